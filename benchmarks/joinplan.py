@@ -0,0 +1,52 @@
+"""Join-tree planning latency of CSVGraph.plan_joins on a synthetic schema.
+
+Run from the repository root:
+
+    python -m benchmarks.joinplan --tables 1000 --edges 3000 --requests 500
+"""
+import argparse
+import random
+import statistics
+import time
+
+from csvgraph import CSVEdge, CSVGraph
+from benchmarks.memory import build_edges
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, default=1000)
+    parser.add_argument('--edges', type=int, default=3000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--min-tables', type=int, default=5)
+    parser.add_argument('--max-tables', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    nodes, pairs = build_edges(args.tables, args.edges, args.seed)
+    graph = CSVGraph(list(nodes))
+    for left, right, columns in pairs:
+        graph.add_edge(CSVEdge(left, right, columns))
+
+    start = time.perf_counter()
+    graph._all_pairs()
+    print(f"path matrix: {args.tables} tables, {len(graph.edges)} edges, {time.perf_counter() - start:.2f} s")
+
+    rng = random.Random(args.seed)
+    latencies, joins = [], 0
+    for _ in range(args.requests):
+        tables = rng.sample(nodes, rng.randint(args.min_tables, args.max_tables))
+        start = time.perf_counter()
+        plan = graph.plan_joins(tables)
+        latencies.append((time.perf_counter() - start) * 1000)
+        joins += len(plan) if plan is not None else 0
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"plan_joins: {args.requests} requests, {joins / args.requests:.1f} joins/request")
+    print(f"{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print(f"{statistics.mean(latencies):>10.2f}{statistics.median(latencies):>10.2f}{p99:>10.2f}{latencies[-1]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Per-edge memory footprint of CSVGraph versus CompactCSVGraph.
+
+Run from the repository root:
+
+    python -m benchmarks.memory --tables 300 --edges 900
+"""
+import argparse
+import random
+import tracemalloc
+
+from csvgraph import CSVNode, CSVEdge, CSVGraph
+from compactgraph import CompactCSVGraph
+
+
+def build_edges(tables: int, edges: int, seed: int = 0):
+    """FK-like edges whose labels are skewed towards a few shared columns."""
+    rng = random.Random(seed)
+    nodes = [CSVNode(i, [f"col_{c}" for c in range(8)]) for i in range(1, tables + 1)]
+    labels = [f"shared_{i}_id" for i in range(40)]
+    weights = [1 / (rank + 1) for rank in range(len(labels))]
+    pairs = []
+    for _ in range(edges):
+        left, right = rng.sample(nodes, 2)
+        # Build a fresh string per edge, as a parser would
+        label = ''.join(rng.choices(labels, weights)[0])
+        pairs.append((left, right, [label]))
+    return nodes, pairs
+
+
+def measure(graph_class, nodes, pairs):
+    """Return (edge count, bytes allocated) for building and compressing one graph."""
+    tracemalloc.start()
+    graph = graph_class(list(nodes))
+    for left, right, columns in pairs:
+        graph.add_edge(CSVEdge(left, right, list(columns)))
+    graph.compress_graph()
+    edge_count = len(graph.edges)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return edge_count, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tables', type=int, default=300)
+    parser.add_argument('--edges', type=int, default=900)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    nodes, pairs = build_edges(args.tables, args.edges, args.seed)
+    print(f"{'backend':<18}{'edges':>10}{'bytes':>14}{'bytes/edge':>12}")
+    for graph_class in (CSVGraph, CompactCSVGraph):
+        edge_count, size = measure(graph_class, nodes, pairs)
+        print(f"{graph_class.__name__:<18}{edge_count:>10}{size:>14}{size / max(edge_count, 1):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
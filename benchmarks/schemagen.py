@@ -0,0 +1,106 @@
+"""Synthetic pg_dump-style schemas shaped like postgres_setup.sql, at any scale.
+
+Run from the repository root:
+
+    python -m benchmarks.schemagen --scale 100 -o /tmp/schema_100x.sql
+"""
+import argparse
+import random
+import sys
+
+# Tables in postgres_setup.sql; --scale multiplies it
+BASE_TABLES = 42
+
+TYPES = ('integer', 'bigint', 'smallint', 'character varying(100)', 'text', 'date', 'numeric(12,2)')
+
+HEADER = """-- Synthetic schema generated by benchmarks.schemagen
+
+SET statement_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+
+"""
+
+
+def generate_schema(tables: int = BASE_TABLES * 10, columns: int = 12, fk_density: float = 1.5,
+                    skew: float = 1.0, copy_rows: int = 0, seed: int = 0):
+    """Yield the text of a synthetic dump in pieces.
+
+    Every table has an id primary key (added by ALTER TABLE, as pg_dump
+    does), a shared data_year column and columns filler columns. Each table
+    gets about fk_density foreign keys, whose referenced tables follow a
+    Zipf law with exponent skew, so a few hub tables (like nibrs_incident)
+    share their id column with many others. copy_rows adds a COPY data
+    section of that many rows per table.
+    """
+    rng = random.Random(seed)
+    names = [f'nibrs_table_{index}' for index in range(tables)]
+    ids = [f'{name[6:]}_id' for name in names]
+    weights = [1 / (rank + 1) ** skew for rank in range(tables)]
+
+    # Referenced tables per table, picked before writing so FK columns appear in CREATE TABLE
+    references = []
+    for index in range(tables):
+        count = int(fk_density) + (rng.random() < fk_density % 1)
+        targets = {target for target in rng.choices(range(tables), weights, k=count) if target != index}
+        references.append(sorted(targets))
+
+    yield HEADER
+    for index, name in enumerate(names):
+        lines = [f'    {ids[index]} bigint NOT NULL', '    data_year int']
+        lines += [f'    {ids[target]} bigint' for target in references[index]]
+        lines += [f'    {name[6:]}_col_{column} {rng.choice(TYPES)}' for column in range(columns)]
+        yield f'CREATE TABLE {name} (\n' + ',\n'.join(lines) + '\n);\n\n'
+
+        if copy_rows:
+            yield f'COPY public.{name} FROM stdin;\n'
+            yield ''.join(f'{row}\t2020\n' for row in range(copy_rows))
+            yield '\\.\n\n'
+
+    yield '  -- PKs\n\n'
+    for name, id_column in zip(names, ids):
+        yield (f'  ALTER TABLE ONLY PUBLIC.{name.upper()} ADD CONSTRAINT {name.upper()}_PK '
+               f'PRIMARY KEY ({id_column.upper()});\n\n')
+
+    yield '  -- FKs\n\n'
+    for index, name in enumerate(names):
+        for target in references[index]:
+            yield (f'  ALTER TABLE ONLY PUBLIC.{name.upper()} ADD CONSTRAINT {name.upper()}_{target}_FK '
+                   f'FOREIGN KEY ({ids[target].upper()})\n'
+                   f'\t  REFERENCES PUBLIC.{names[target].upper()} ({ids[target].upper()});\n\n')
+
+
+def write_schema(path: str, **options):
+    """Write generate_schema(**options) to path."""
+    with open(path, 'w') as file:
+        file.writelines(generate_schema(**options))
+
+
+def add_schema_arguments(parser):
+    parser.add_argument('--scale', type=float, default=10, help="tables as a multiple of postgres_setup.sql's 42")
+    parser.add_argument('--columns', type=int, default=12, help="filler columns per table")
+    parser.add_argument('--fk-density', type=float, default=1.5, help="foreign keys per table")
+    parser.add_argument('--skew', type=float, default=1.0, help="Zipf exponent of referenced tables")
+    parser.add_argument('--copy-rows', type=int, default=0, help="COPY data rows per table")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def schema_options(args) -> dict:
+    return {'tables': max(1, round(BASE_TABLES * args.scale)), 'columns': args.columns,
+            'fk_density': args.fk_density, 'skew': args.skew, 'copy_rows': args.copy_rows, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_schema_arguments(parser)
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.output:
+        write_schema(args.output, **schema_options(args))
+    else:
+        sys.stdout.writelines(generate_schema(**schema_options(args)))
+
+
+if __name__ == "__main__":
+    main()
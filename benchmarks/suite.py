@@ -0,0 +1,135 @@
+"""Stage timings and peak memory of the schema-to-graph pipeline on a synthetic dump.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --scale 10 -o results.json
+    python -m benchmarks.suite --scale 10 --compare results.json --threshold 0.2
+
+With --compare the run fails (exit status 1) when any stage is slower, or
+peaks higher, than in the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.schemagen import add_schema_arguments, schema_options, write_schema
+from main import create_graph
+from render import compute_layout
+from sqlparser import SQLParser
+
+STAGES = ('parse', 'create_graph', 'compress_graph', 'find_path', 'layout')
+
+
+def run_pipeline(path: str, lazy: bool, paths: int, measure):
+    """Run every stage once through measure(stage, function), which returns the function's result."""
+    tables, _, foreign_keys = measure('parse', lambda: SQLParser.from_file(path).parse())
+    graph = measure('create_graph', lambda: create_graph(tables, foreign_keys, list(tables)))
+    measure('compress_graph', lambda: graph.compress_graph(lazy=lazy))
+
+    rng = random.Random(0)
+    pairs = [rng.sample(graph.nodes, 2) for _ in range(paths)]
+    measure('find_path', lambda: [graph.find_path(src, dest) for src, dest in pairs])
+    measure('layout', lambda: compute_layout(graph))
+    return graph
+
+
+def time_stages(path: str, lazy: bool, paths: int, repeat: int) -> dict[str, float]:
+    """Best of repeat wall-clock seconds per stage."""
+    best = dict.fromkeys(STAGES, float('inf'))
+
+    def measure(stage, function):
+        start = time.perf_counter()
+        result = function()
+        best[stage] = min(best[stage], time.perf_counter() - start)
+        return result
+
+    for _ in range(repeat):
+        run_pipeline(path, lazy, paths, measure)
+    return best
+
+
+def peak_memory(path: str, lazy: bool, paths: int) -> dict[str, int]:
+    """Peak bytes allocated while each stage runs, from tracemalloc."""
+    peaks = {}
+
+    def measure(stage, function):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = function()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - base
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(path, lazy, paths, measure)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Describe each stage metric of results exceeding baseline by more than threshold (a fraction)."""
+    regressions = []
+    for stage, metrics in results['stages'].items():
+        for metric, value in metrics.items():
+            base = baseline.get('stages', {}).get(stage, {}).get(metric)
+            if base and value > base * (1 + threshold):
+                regressions.append(f"{stage} {metric}: {base:.6g} -> {value:.6g} (+{value / base - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_schema_arguments(parser)
+    parser.add_argument('--lazy', action='store_true', help="benchmark lazy compression (for large scales)")
+    parser.add_argument('--paths', type=int, default=200, help="find_path queries")
+    parser.add_argument('--repeat', type=int, default=3, help="timing runs; the best is kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('-o', '--output', help="write results as JSON (default: stdout)")
+    parser.add_argument('--compare', help="baseline results JSON to check against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed regression (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    options = schema_options(args)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'schema.sql')
+        write_schema(path, **options)
+        seconds = time_stages(path, args.lazy, args.paths, args.repeat)
+        peaks = {} if args.no_memory else peak_memory(path, args.lazy, args.paths)
+        size = os.path.getsize(path)
+
+    results = {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'schema_bytes': size,
+                 'lazy': args.lazy, 'paths': args.paths, **options},
+        'stages': {stage: {'seconds': seconds[stage], **({'peak_bytes': peaks[stage]} if stage in peaks else {})}
+                   for stage in STAGES},
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    print(f"{'stage':<16}{'seconds':>10}{'peak MB':>10}", file=sys.stderr)
+    for stage, metrics in results['stages'].items():
+        peak = f"{metrics['peak_bytes'] / 2 ** 20:>10.1f}" if 'peak_bytes' in metrics else f"{'-':>10}"
+        print(f"{stage:<16}{metrics['seconds']:>10.4f}{peak}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from array import array
+from collections import deque
+
+from csvgraph import CSVNode, CSVEdge, CSVGraph, DisjointSet
+
+# Edge materialized on demand from a CompactCSVGraph's arrays; column is an interned, immutable tuple
+class CompactEdge:
+    __slots__ = ('left_v', 'right_v', 'column')
+
+    def __init__(self, left_v: CSVNode, right_v: CSVNode, column: tuple[str, ...]):
+        self.left_v: CSVNode = left_v
+        self.right_v: CSVNode = right_v
+        self.column: tuple[str, ...] = column
+
+    def __repr__(self) -> str:
+        return f"({list(self.column)}: {self.left_v.key} <--> {self.right_v.key})\n"
+
+# Read-only sequence of a CompactCSVGraph's edges
+class CompactEdgeList:
+    __slots__ = ('graph',)
+
+    def __init__(self, graph: "CompactCSVGraph"):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return len(self.graph._left)
+
+    def __getitem__(self, index: int) -> CompactEdge:
+        graph = self.graph
+        return CompactEdge(graph._id_nodes[graph._left[index]], graph._id_nodes[graph._right[index]],
+                           graph._column_sets[graph._columns[index]])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+# Array-backed graph over interned node ids and column labels. It covers the core of the CSVGraph API
+# (add_edge, edges, compress_graph, find_path, has_direct_edge); compression is always eager, and
+# to_graph() converts to a CSVGraph for everything else
+class CompactCSVGraph:
+    __slots__ = ('nodes', '_ids', '_id_nodes', '_labels', '_label_ids', '_column_sets', '_column_set_ids',
+                 '_column_set_labels', '_left', '_right', '_columns', '_edge_ids',
+                 '_offsets', '_targets', '_target_columns')
+
+    def __init__(self, nodes: list[CSVNode] | None = None):
+        self.nodes: list[CSVNode] = nodes if nodes is not None else []
+
+        self._ids: dict[int, int] = {}  # node key -> node id
+        self._id_nodes: list[CSVNode] = []  # node id -> node
+
+        # Intern tables: every label string and every distinct column list is stored once
+        self._labels: list[str] = []
+        self._label_ids: dict[str, int] = {}
+        self._column_sets: list[tuple[str, ...]] = []
+        self._column_set_ids: dict[tuple[str, ...], int] = {}
+        self._column_set_labels: list[tuple[int, ...]] = []  # column set id -> label ids
+
+        # Edge i joins node ids _left[i] and _right[i] on column set _columns[i]
+        self._left = array('q')
+        self._right = array('q')
+        self._columns = array('q')
+        self._edge_ids: set[int] = set()  # packed (left id, right id, column set id)
+
+        # CSR adjacency over node ids, rebuilt lazily after edges change
+        self._offsets = array('q')
+        self._targets = array('q')
+        self._target_columns = array('q')  # column set id of the edge behind each _targets entry
+
+    @classmethod
+    def from_graph(cls, graph: CSVGraph) -> "CompactCSVGraph":
+        """Build a compact copy of graph, including any compressed edges."""
+        compact = cls(list(graph.nodes))
+        for edge in graph.edges:
+            compact._append_edge(edge.left_v, edge.right_v, edge.column)
+        return compact
+
+    def to_graph(self) -> CSVGraph:
+        """Convert back to an object-backed CSVGraph with the same nodes and edges."""
+        graph = CSVGraph(list(self.nodes))
+        for edge in self.edges:
+            graph._index_edge(CSVEdge(edge.left_v, edge.right_v, list(edge.column)))
+        return graph
+
+    @property
+    def edges(self) -> CompactEdgeList:
+        return CompactEdgeList(self)
+
+    def _node_id(self, node: CSVNode) -> int:
+        node_id = self._ids.get(node.key)
+        if node_id is None:
+            node_id = self._ids[node.key] = len(self._id_nodes)
+            self._id_nodes.append(node)
+        return node_id
+
+    def _column_set_id(self, columns) -> int:
+        columns = tuple(columns)
+        set_id = self._column_set_ids.get(columns)
+        if set_id is None:
+            label_ids = []
+            for label in columns:
+                if label not in self._label_ids:
+                    self._label_ids[label] = len(self._labels)
+                    self._labels.append(label)
+                label_ids.append(self._label_ids[label])
+
+            interned = tuple(self._labels[label_id] for label_id in label_ids)
+            set_id = self._column_set_ids[interned] = len(self._column_sets)
+            self._column_sets.append(interned)
+            self._column_set_labels.append(tuple(label_ids))
+        return set_id
+
+    def _append_edge(self, left_v: CSVNode, right_v: CSVNode, columns) -> bool:
+        left, right, set_id = self._node_id(left_v), self._node_id(right_v), self._column_set_id(columns)
+        edge_id = (((left << 32) | right) << 32) | set_id
+        if edge_id in self._edge_ids:
+            return False
+
+        self._edge_ids.add(edge_id)
+        self._left.append(left)
+        self._right.append(right)
+        self._columns.append(set_id)
+        return True
+
+    def add_edge(self, edge: CSVEdge):
+        # Ensure consistent order of nodes in the edge
+        if edge.left_v.key > edge.right_v.key:
+            self._append_edge(edge.right_v, edge.left_v, edge.column)
+        else:
+            self._append_edge(edge.left_v, edge.right_v, edge.column)
+
+    def __repr__(self):
+        return '\n'.join([repr(edge) for edge in self.edges])
+
+    def _build_csr(self):
+        """Rebuild the CSR adjacency if edges were added since the last build."""
+        node_count = len(self._id_nodes)
+        if len(self._offsets) == node_count + 1 and self._offsets[-1] == 2 * len(self._left):
+            return
+
+        degrees = array('q', [0]) * (node_count + 1)
+        for left, right in zip(self._left, self._right):
+            degrees[left + 1] += 1
+            degrees[right + 1] += 1
+        for node_id in range(node_count):
+            degrees[node_id + 1] += degrees[node_id]
+
+        targets = array('q', [0]) * degrees[-1]
+        target_columns = array('q', [0]) * degrees[-1]
+        fill = degrees[:-1]
+        for left, right, set_id in zip(self._left, self._right, self._columns):
+            for node_id, other in ((left, right), (right, left)):
+                targets[fill[node_id]] = other
+                target_columns[fill[node_id]] = set_id
+                fill[node_id] += 1
+
+        self._offsets, self._targets, self._target_columns = degrees, targets, target_columns
+
+    def has_direct_edge(self, a: CSVNode, b: CSVNode, column_label: str) -> bool:
+        """Whether a and b are joined on column_label by a stored edge."""
+        label_id = self._label_ids.get(column_label)
+        if label_id is None or a.key not in self._ids or b.key not in self._ids:
+            return False
+
+        self._build_csr()
+        a_id, b_id = self._ids[a.key], self._ids[b.key]
+        for index in range(self._offsets[a_id], self._offsets[a_id + 1]):
+            if self._targets[index] == b_id and label_id in self._column_set_labels[self._target_columns[index]]:
+                return True
+        return False
+
+    def compress_graph(self):
+        """Compress paths for all columns while keeping the original edges."""
+        label_count = len(self._labels)
+        sets = [DisjointSet() for _ in range(label_count)]
+        direct: list[dict[int, set[int]]] = [{} for _ in range(label_count)]
+
+        # One pass over the edge arrays groups every label's components
+        for left, right, set_id in zip(self._left, self._right, self._columns):
+            for label_id in self._column_set_labels[set_id]:
+                sets[label_id].union(left, right)
+                direct[label_id].setdefault(left, set()).add(right)
+                direct[label_id].setdefault(right, set()).add(left)
+
+        new_edges = []
+        for label_id in range(label_count):
+            label_sets, label_direct = sets[label_id], direct[label_id]
+            members: dict[int, list[int]] = {}
+            for node_id in label_sets.parent:
+                members.setdefault(label_sets.find(node_id), []).append(node_id)
+
+            for node in self.nodes:
+                node_id = self._ids.get(node.key)
+                if node_id not in label_sets.parent:
+                    continue
+                for target in members[label_sets.find(node_id)]:
+                    if target != node_id and target not in label_direct[node_id]:
+                        new_edges.append((node, self._id_nodes[target], (self._labels[label_id],)))
+
+        for left_v, right_v, columns in new_edges:
+            self._append_edge(left_v, right_v, columns)
+
+    def find_path(self, src: CSVNode, dest: CSVNode):
+        """Shortest path (fewest hops) from src to dest as a list of nodes, or None."""
+        if src.key == dest.key:
+            return [src]
+        if src.key not in self._ids or dest.key not in self._ids:
+            return None
+
+        self._build_csr()
+        offsets, targets = self._offsets, self._targets
+        src_id, dest_id = self._ids[src.key], self._ids[dest.key]
+        parents = array('q', [-1]) * len(self._id_nodes)
+        parents[src_id] = src_id
+
+        queue = deque([src_id])
+        while queue:
+            current = queue.popleft()
+            for index in range(offsets[current], offsets[current + 1]):
+                neighbor = targets[index]
+                if parents[neighbor] != -1:
+                    continue
+                parents[neighbor] = current
+                if neighbor == dest_id:
+                    path = [neighbor]
+                    while path[-1] != src_id:
+                        path.append(parents[path[-1]])
+                    return [src] + [self._id_nodes[node_id] for node_id in reversed(path[:-1])]
+                queue.append(neighbor)
+
+        return None
@@ -1,11 +1,16 @@
-import networkx as nx
-import matplotlib.pyplot as plt
+from array import array
+from collections import OrderedDict, deque
+from heapq import heappop, heappush
+from itertools import count
+
+import instrument
 
 # Class representing a node in the graph
 class CSVNode:
     def __init__(self, key: int, columns: list[str] = []):
         self.key = key
         self.columns = columns
+        self.stats = None  # tablestats.TableStats of the table's CSV file, set by CSVGraph.attach_stats
 
     def __repr__(self) -> str:
         return f"{self.key}"
@@ -16,99 +21,979 @@ class CSVEdge:
         self.left_v: CSVNode = left_v
         self.right_v: CSVNode = right_v
         self.column: list[str] = columns
+        self.estimated_rows: float | None = None  # estimated join size, set by CSVGraph.attach_stats
 
     def __repr__(self) -> str:
         return f"({self.column}: {self.left_v.key} <--> {self.right_v.key})\n"
 
+# Union-find over node keys, used to group nodes joined by a column label
+class DisjointSet:
+    def __init__(self):
+        self.parent: dict = {}
+        self.size: dict = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        self.add(item)
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]  # path halving
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+# Read-only view over a graph's stored edges followed by its virtual (lazily compressed) edges
+class CSVEdgeView:
+    def __init__(self, graph: "CSVGraph"):
+        self.graph = graph
+
+    def __iter__(self):
+        yield from self.graph._edges
+        yield from self.graph.virtual_edges()
+
+    def __len__(self) -> int:
+        return len(self.graph._edges) + sum(1 for _ in self.graph.virtual_edges())
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+# Tables connected by CSVGraph.plan_joins and the columns of each join, in join order
+class JoinTree:
+    def __init__(self, tables: list[CSVNode], joins: list[tuple[CSVNode, CSVNode, list[str]]]):
+        self.tables = tables
+        self.joins = joins  # (table already in the tree, table joined to it, join columns)
+
+    def __len__(self) -> int:
+        return len(self.joins)
+
+    def __repr__(self) -> str:
+        return ''.join(f"({columns}: {left.key} <--> {right.key})\n" for left, right, columns in self.joins)
+
 # Class representing the graph of CSV relationships
 class CSVGraph:
-    def __init__(self, nodes: list[CSVNode] = []):
-        self.nodes: list[CSVNode] = nodes
-        self.edges: list[CSVEdge] = []
+    def __init__(self, nodes: list[CSVNode] | None = None):
+        self.nodes: list[CSVNode] = nodes if nodes is not None else []
+        self._edges: list[CSVEdge] = []
+
+        # Indexes over self._edges, maintained by _index_edge
+        self._node_index: dict[int, CSVNode] = {}  # node key -> node, for every edge endpoint
+        self._edge_ids: set[tuple] = set()  # (left key, right key, columns) of every edge
+        self._adjacency: dict[int, list[CSVEdge]] = {}  # node key -> incident edges
+        self._label_adjacency: dict[str, dict[int, list[CSVNode]]] = {}  # column label -> node key -> neighbors
+
+        # Compression state: mode used by the last compress_graph, the edges it derived (eager
+        # mode) and, per column label, the component members of each node key
+        self._compression: str | None = None  # None, 'eager' or 'lazy'
+        self.incremental: bool = False  # keep compression current on every edge change
+        self._derived: dict[str, dict[tuple, CSVEdge]] = {}  # column label -> edge id -> edge
+        self._components: dict[str, dict[int, list[CSVNode]]] = {}
+        self._component_labels: dict[int, list[str]] = {}  # node key -> labels it has a component for
+
+        # Path query caches, dropped whenever _version moves past _cache_version
+        self.path_cache_size: int = 128  # max number of cached BFS trees
+        self._version: int = 0
+        self._cache_version: int = 0
+        self._bfs_trees: OrderedDict[int, dict[int, tuple]] = OrderedDict()  # source key -> BFS tree
+        self._path_sources: set[int] = set()  # sources queried once, cached on the next query
+        self._reachability: dict[str | None, dict[int, int]] = {}  # column label (None: any) -> key -> bitset
+        self._bit_positions: dict[int, int] = {}  # node key -> bit in the reachability bitsets
+        self._bit_nodes: list[CSVNode] = []  # bit -> node
+        self._path_matrix: tuple | None = None  # see _all_pairs
+        self._unknown_join_rows: float = 1.0  # cost of a hop without stats, set by attach_stats
+
+    @property
+    def edges(self):
+        """The graph's edges; after compress_graph(lazy=True), a view that also yields virtual edges."""
+        if self._compression == 'lazy':
+            return CSVEdgeView(self)
+        return self._edges
+
+    def __getstate__(self) -> dict:
+        """Compact pickled form: node objects once, edges as key triples over interned column lists.
+
+        Indexes and path caches are rebuilt on load rather than stored.
+        """
+        column_sets: dict[tuple, int] = {}
+        edges = [(edge.left_v.key, edge.right_v.key, column_sets.setdefault(tuple(edge.column), len(column_sets)))
+                 for edge in self._edges]
+        positions = {id(edge): index for index, edge in enumerate(self._edges)}
+
+        # Edge endpoints may be missing from self.nodes; keep them without adding them to it
+        node_keys = {node.key for node in self.nodes}
+        extra_nodes = [node for key, node in self._node_index.items() if key not in node_keys]
+        return {
+            'nodes': self.nodes,
+            'extra_nodes': extra_nodes,
+            'column_sets': list(column_sets),
+            'edges': edges,
+            'compression': self._compression,
+            'incremental': self.incremental,
+            'derived': {label: [positions[id(edge)] for edge in derived.values()]
+                        for label, derived in self._derived.items()},
+            'components': {label: list({id(members): [node.key for node in members]
+                                        for members in components.values()}.values())
+                           for label, components in self._components.items()},
+            'path_cache_size': self.path_cache_size,
+            'unknown_join_rows': self._unknown_join_rows,
+        }
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['nodes'])
+        self.path_cache_size = state['path_cache_size']
+        self._unknown_join_rows = state.get('unknown_join_rows', 1.0)
+
+        nodes_by_key = {node.key: node for node in state['extra_nodes']}
+        nodes_by_key.update((node.key, node) for node in self.nodes)
+        column_sets = state['column_sets']
+        for left_key, right_key, column_set in state['edges']:
+            edge = CSVEdge(nodes_by_key[left_key], nodes_by_key[right_key], list(column_sets[column_set]))
+            self._index_edge(edge)
+
+        self._compression = state['compression']
+        self.incremental = state['incremental']
+        for column_label, indices in state['derived'].items():
+            self._register_derived(column_label, [self._edges[index] for index in indices])
+        for column_label, member_keys in state['components'].items():
+            components = self._components[column_label] = {}
+            for keys in member_keys:
+                members = [self._node_index[key] for key in keys]
+                for key in keys:
+                    components[key] = members
+                    self._component_labels.setdefault(key, []).append(column_label)
+
+    @staticmethod
+    def _edge_id(edge: CSVEdge) -> tuple:
+        return (edge.left_v.key, edge.right_v.key, tuple(edge.column))
+
+    def _index_edge(self, edge: CSVEdge):
+        """Append edge to self._edges and register it in the adjacency indexes."""
+        self._edges.append(edge)
+        self._edge_ids.add(self._edge_id(edge))
+        self._version += 1
+
+        left, right = edge.left_v, edge.right_v
+        self._node_index.setdefault(left.key, left)
+        self._node_index.setdefault(right.key, right)
+        self._adjacency.setdefault(left.key, []).append(edge)
+        if right.key != left.key:
+            self._adjacency.setdefault(right.key, []).append(edge)
+
+        for label in edge.column:
+            neighbors = self._label_adjacency.setdefault(label, {})
+            neighbors.setdefault(left.key, []).append(right)
+            neighbors.setdefault(right.key, []).append(left)
+
+    def _register_derived(self, column_label: str, edges: list[CSVEdge]):
+        """Record edges as created by compressing column_label."""
+        if instrument.enabled:
+            instrument.count('edges_derived', len(edges))
+        derived = self._derived.setdefault(column_label, {})
+        for edge in edges:
+            derived[self._edge_id(edge)] = edge
+
+    def _unindex_edges(self, edges: list[CSVEdge]):
+        """Remove edges (stored objects) from self._edges and from the indexes."""
+        removed = {id(edge) for edge in edges}
+        if not removed:
+            return
+
+        self._edges = [edge for edge in self._edges if id(edge) not in removed]
+        affected_keys, affected_labels = set(), set()
+        for edge in edges:
+            self._edge_ids.discard(self._edge_id(edge))
+            affected_keys.update((edge.left_v.key, edge.right_v.key))
+            affected_labels.update(edge.column)
+
+        # Rebuild the touched adjacency lists in one pass each, keeping edge order
+        for key in affected_keys:
+            incident = [edge for edge in self._adjacency.get(key, []) if id(edge) not in removed]
+            if incident:
+                self._adjacency[key] = incident
+            else:
+                self._adjacency.pop(key, None)
+
+        for label in affected_labels:
+            neighbors = self._label_adjacency.get(label, {})
+            for key in affected_keys:
+                label_neighbors = []
+                for edge in self._adjacency.get(key, []):
+                    if label in edge.column:
+                        label_neighbors.append(edge.right_v if edge.left_v.key == key else edge.left_v)
+                        if edge.left_v.key == edge.right_v.key:
+                            label_neighbors.append(edge.left_v)  # self-loops are listed twice
+                if label_neighbors:
+                    neighbors[key] = label_neighbors
+                else:
+                    neighbors.pop(key, None)
+            if not neighbors:
+                self._label_adjacency.pop(label, None)
+
+            if label in self._derived:
+                self._derived[label] = {edge_id: edge for edge_id, edge in self._derived[label].items()
+                                        if id(edge) not in removed}
+
+        self._version += 1
+
+    def is_derived(self, edge: CSVEdge) -> bool:
+        """Whether edge (a stored edge) was created by compression rather than added."""
+        return len(edge.column) == 1 and self._derived.get(edge.column[0], {}).get(self._edge_id(edge)) is edge
+
+    def original_edges(self):
+        """Yield the stored edges that were added rather than derived by compression."""
+        if not self._derived:
+            return iter(self._edges)
+        derived = {id(edge) for edges in self._derived.values() for edge in edges.values()}
+        return (edge for edge in self._edges if id(edge) not in derived)
+
+    def derived_edges(self):
+        """Yield the stored edges created by compression."""
+        for derived in self._derived.values():
+            yield from derived.values()
+
+    def _remove_stored_edge(self, edge: CSVEdge):
+        derived = self.is_derived(edge)
+        self._unindex_edges([edge])
+        if self.incremental and self._compression and not derived:
+            for column_label in edge.column:
+                self._split_component(column_label, edge.left_v, edge.right_v)
+
+    def remove_edge(self, edge: CSVEdge) -> bool:
+        """Remove the stored edge joining edge's nodes (in either order) on the same columns.
+
+        Original edges are preferred over derived ones with the same ends.
+        """
+        ends = {edge.left_v.key, edge.right_v.key}
+        candidates = [candidate for candidate in self._adjacency.get(edge.left_v.key, [])
+                      if {candidate.left_v.key, candidate.right_v.key} == ends and candidate.column == edge.column]
+        if not candidates:
+            return False
+
+        candidates.sort(key=self.is_derived)
+        self._remove_stored_edge(candidates[0])
+        return True
+
+    def remove_node(self, node: CSVNode) -> set[str]:
+        """Remove node and its edges, returning the column labels of the removed edges."""
+        self.nodes[:] = [n for n in self.nodes if n.key != node.key]
+        edges = list(self._adjacency.get(node.key, []))
+        if self.incremental and self._compression:
+            # Detach the node edge by edge so each label's component is split in place
+            for edge in edges:
+                if not self.is_derived(edge):
+                    self._remove_stored_edge(edge)
+            for column_label in list(self._component_labels.get(node.key, [])):
+                self._drop_from_component(column_label, node.key)
+        self._unindex_edges(list(self._adjacency.get(node.key, [])))
+        self._node_index.pop(node.key, None)
+        self._version += 1
+        return {label for edge in edges for label in edge.column}
+
+    def _label_neighbors(self, node: CSVNode, column_label: str) -> list[CSVNode]:
+        """Nodes sharing an edge with node whose columns include column_label."""
+        return self._label_adjacency.get(column_label, {}).get(node.key, [])
+
+    def has_direct_edge(self, a: CSVNode, b: CSVNode, column_label: str) -> bool:
+        """Whether a and b are joined on column_label by a stored or virtual edge."""
+        if any(neighbor.key == b.key for neighbor in self._label_neighbors(a, column_label)):
+            return True
+        if self._compression != 'lazy':
+            return False
+        members = self._components.get(column_label, {}).get(a.key)
+        return a.key != b.key and members is not None and members is self._components[column_label].get(b.key)
 
     def add_edge(self, edge: CSVEdge):
         # Ensure consistent order of nodes in the edge
         if edge.left_v.key > edge.right_v.key:
             edge = CSVEdge(edge.right_v, edge.left_v, edge.column)
 
-        for e in self.edges:
-            if e.left_v == edge.left_v and e.right_v == edge.right_v and e.column == edge.column:
+        edge_id = self._edge_id(edge)
+        if edge_id in self._edge_ids:
+            # Adding an edge that compression derived makes it an original one
+            if len(edge.column) != 1 or self._derived.get(edge.column[0], {}).pop(edge_id, None) is None:
+                if instrument.enabled:
+                    instrument.count('edges_deduplicated')
                 return
+        else:
+            self._index_edge(edge)
 
-        self.edges.append(edge)
+        if self.incremental and self._compression:
+            for column_label in edge.column:
+                self._merge_components(column_label, edge.left_v, edge.right_v)
 
     def __repr__(self):
         return '\n'.join([repr(edge) for edge in self.edges])
 
     def _extract_column_labels(self) -> set[str]:
         """Extract unique column labels from the graph's edges."""
-        column_labels = set()
-        for edge in self.edges:
-            column_labels.update(edge.column)
-        return column_labels
+        return set(self._label_adjacency)
 
     def _find_reachable_nodes(self, start_node: CSVNode, column_label: str) -> list[CSVNode]:
         """Find nodes reachable from start_node using only edges with column_label."""
         visited = set()
         reachable_nodes = []
 
-        def dfs(current_node):
+        # Depth-first preorder with an explicit stack, so long chains do not hit the recursion limit
+        stack = [start_node]
+        while stack:
+            current_node = stack.pop()
             if current_node in visited:
-                return
+                continue
             visited.add(current_node)
             reachable_nodes.append(current_node)
+            stack.extend(reversed(self._label_neighbors(current_node, column_label)))
 
-            for edge in self.edges:
-                if (current_node == edge.left_v or current_node == edge.right_v) and column_label in edge.column:
-                    next_node = edge.right_v if current_node == edge.left_v else edge.left_v
-                    dfs(next_node)
-
-        dfs(start_node)
+        if instrument.enabled:
+            instrument.count('nodes_visited', len(reachable_nodes))
         return reachable_nodes
 
     def _create_direct_edges(self, column_label: str):
-        """Create direct edges for all nodes reachable via column_label."""
+        """Create direct edges for all nodes reachable via column_label.
+
+        Reference implementation (one DFS per node); compress_graph uses
+        _create_component_edges, which produces the same edges.
+        """
         new_edges = []
 
         for node in self.nodes:
+            # Targets already joined to node on column_label, as of before this pass
+            direct = {neighbor.key for neighbor in self._label_neighbors(node, column_label)}
             reachable_nodes = self._find_reachable_nodes(node, column_label)
             for target_node in reachable_nodes:
-                if node != target_node and not any(
-                    (edge.left_v == node and edge.right_v == target_node or edge.left_v == target_node and edge.right_v == node) and column_label in edge.column
-                    for edge in self.edges
-                ):
+                if node != target_node and target_node.key not in direct:
                     new_edges.append(CSVEdge(node, target_node, [column_label]))
 
-        self.edges.extend(new_edges)
+        for edge in new_edges:
+            self._index_edge(edge)
+        self._register_derived(column_label, new_edges)
+
+    def _label_components(self, column_label: str) -> dict[int, list[CSVNode]]:
+        """Map each node key joined on column_label to the members of its component."""
+        sets = DisjointSet()
+        adjacency = self._label_adjacency.get(column_label, {})
+        for key, neighbors in adjacency.items():
+            for neighbor in neighbors:
+                sets.union(key, neighbor.key)
+        if instrument.enabled:
+            instrument.count('edges_scanned', sum(map(len, adjacency.values())) // 2)
+
+        members: dict[int, list[CSVNode]] = {}
+        for key in sets.parent:
+            members.setdefault(sets.find(key), []).append(self._node_index[key])
+        return {key: members[sets.find(key)] for key in sets.parent}
 
-    def compress_graph(self):
-        """Compress paths for all columns while keeping the original edges."""
-        column_labels = self._extract_column_labels()
+    def _component_edges(self, column_label: str, components: dict[int, list[CSVNode]]):
+        """Yield the direct edges missing between members of each column_label component."""
+        for node in self.nodes:
+            members = components.get(node.key)
+            if members is None:
+                continue
+
+            direct = {neighbor.key for neighbor in self._label_neighbors(node, column_label)}
+            for target_node in members:
+                if target_node.key != node.key and target_node.key not in direct:
+                    yield CSVEdge(node, target_node, [column_label])
+
+    def _create_component_edges(self, column_label: str):
+        """Create direct edges between all members of each column_label component."""
+        components = self._label_components(column_label)
+        self._set_components(column_label, components)
+        new_edges = list(self._component_edges(column_label, components))
+
+        for edge in new_edges:
+            self._index_edge(edge)
+        self._register_derived(column_label, new_edges)
+
+    def virtual_edges(self):
+        """Yield the edges implied by lazy compression, built on demand."""
+        if self._compression != 'lazy':
+            return
+        for column_label, components in self._components.items():
+            yield from self._component_edges(column_label, components)
+
+    def compress_graph(self, lazy: bool = False, incremental: bool = False):
+        """Compress paths for all columns while keeping the original edges.
+
+        With lazy=True only the component membership of each column label is
+        stored; the direct edges are served as virtual edges by self.edges,
+        has_direct_edge and find_path instead of being materialized.
+
+        With incremental=True later add_edge, remove_edge and remove_node
+        calls keep the compression current by merging or splitting only the
+        components of the labels on the changed edge.
+        """
+        self._components = {}
+        self._component_labels = {}
+        self._compression = 'lazy' if lazy else 'eager'
+        self.incremental = incremental
+        self._version += 1
+
+        with instrument.stage('compress_graph'):
+            for column_label in list(self._label_adjacency):
+                if lazy:
+                    self._set_components(column_label, self._label_components(column_label))
+                else:
+                    self._create_component_edges(column_label)
+
+    def _set_components(self, column_label: str, components: dict[int, list[CSVNode]]):
+        """Replace the lazy component membership stored for column_label."""
+        for key in self._components.pop(column_label, {}):
+            self._component_labels[key].remove(column_label)
+            if not self._component_labels[key]:
+                del self._component_labels[key]
+
+        if components:
+            self._components[column_label] = components
+            for key in components:
+                self._component_labels.setdefault(key, []).append(column_label)
+
+    def recompress(self, column_labels):
+        """Bring the compression of the given column labels up to date with the current edges.
+
+        Only these labels' compressed edges (or lazy components) are rebuilt;
+        does nothing if compress_graph has not been called.
+        """
         for column_label in column_labels:
+            if self._compression == 'eager':
+                self._unindex_edges(list(self._derived.pop(column_label, {}).values()))
+                if column_label in self._label_adjacency:
+                    self._create_component_edges(column_label)
+                else:
+                    self._set_components(column_label, {})
+            elif self._compression == 'lazy':
+                components = self._label_components(column_label) if column_label in self._label_adjacency else {}
+                self._set_components(column_label, components)
+        self._version += 1
+
+    def _assign_component(self, column_label: str, members: list[CSVNode]):
+        components = self._components.setdefault(column_label, {})
+        for node in members:
+            if node.key not in components:
+                self._component_labels.setdefault(node.key, []).append(column_label)
+            components[node.key] = members
+
+    def _drop_from_component(self, column_label: str, key: int):
+        components = self._components.get(column_label, {})
+        if components.pop(key, None) is not None:
+            self._component_labels[key].remove(column_label)
+            if not self._component_labels[key]:
+                del self._component_labels[key]
+        if not components:
+            self._components.pop(column_label, None)
+
+    def _add_derived_edges(self, column_label: str, pairs):
+        """Index and register derived edges for the (source, target) pairs whose source is in self.nodes."""
+        node_keys = {node.key for node in self.nodes}
+        new_edges = [CSVEdge(node, target, [column_label]) for node, target in pairs if node.key in node_keys]
+        for edge in new_edges:
+            self._index_edge(edge)
+        self._register_derived(column_label, new_edges)
+
+    def _merge_components(self, column_label: str, a: CSVNode, b: CSVNode):
+        """Incremental compression after an original edge a-b carrying column_label was added."""
+        components = self._components.get(column_label, {})
+        members_a, members_b = components.get(a.key, [a]), components.get(b.key, [b])
+
+        if members_a is members_b or a.key == b.key:
+            self._assign_component(column_label, members_a)
+            if self._compression == 'eager':
+                # a and b are now direct neighbors, so edges derived between them are redundant
+                derived = self._derived.get(column_label, {})
+                self._unindex_edges([derived[edge_id] for edge_id in ((a.key, b.key, (column_label,)),
+                                                                      (b.key, a.key, (column_label,)))
+                                     if edge_id in derived])
+            return
+
+        self._assign_component(column_label, members_a + members_b)
+        if self._compression == 'eager':
+            pairs = []
+            for sources, targets in ((members_a, members_b), (members_b, members_a)):
+                for node in sources:
+                    direct = {neighbor.key for neighbor in self._label_neighbors(node, column_label)}
+                    pairs.extend((node, target) for target in targets if target.key not in direct)
+            self._add_derived_edges(column_label, pairs)
+
+    def _split_component(self, column_label: str, a: CSVNode, b: CSVNode):
+        """Incremental compression after an original edge a-b carrying column_label was removed."""
+        components = self._components.get(column_label, {})
+        members = components.get(a.key)
+        if members is None or components.get(b.key) is not members:
+            return
+
+        derived = self._derived.get(column_label, {})
+
+        def reach(start: CSVNode) -> list[CSVNode]:
+            # Walk original column_label edges only; derived ones shortcut the removed edge
+            seen, part = {start.key}, [start]
+            for node in part:
+                for edge in self._adjacency.get(node.key, []):
+                    if column_label in edge.column and derived.get(self._edge_id(edge)) is not edge:
+                        neighbor = edge.right_v if edge.left_v.key == node.key else edge.left_v
+                        if neighbor.key not in seen:
+                            seen.add(neighbor.key)
+                            part.append(neighbor)
+            return part
+
+        part_a = reach(a)
+        if any(node.key == b.key for node in part_a):
+            # Still one component; a and b now need derived edges unless another edge joins them
+            if self._compression == 'eager' and all(n.key != b.key for n in self._label_neighbors(a, column_label)):
+                self._add_derived_edges(column_label, [(a, b), (b, a)])
+            return
+
+        part_b = reach(b)
+        labelled = self._label_adjacency.get(column_label, {})
+        for part in (part_a, part_b):
+            if len(part) == 1 and part[0].key not in labelled:
+                self._drop_from_component(column_label, part[0].key)
+            else:
+                self._assign_component(column_label, part)
+
+        if self._compression == 'eager':
+            side_a = {node.key for node in part_a}
+            smaller = part_a if len(part_a) <= len(part_b) else part_b
+            stale = {}
+            for node in smaller:
+                for edge in self._adjacency.get(node.key, []):
+                    if derived.get(self._edge_id(edge)) is edge and \
+                            (edge.left_v.key in side_a) != (edge.right_v.key in side_a):
+                        stale[id(edge)] = edge
+            self._unindex_edges(list(stale.values()))
+
+    def _neighbors(self, node: CSVNode):
+        """Yield nodes adjacent to node through stored or virtual edges."""
+        for edge in self._adjacency.get(node.key, []):
+            yield edge.right_v if edge.left_v.key == node.key else edge.left_v
+
+        if self._compression != 'lazy':
+            return
+        for column_label in self._component_labels.get(node.key, []):
+            for member in self._components[column_label][node.key]:
+                if member.key != node.key:
+                    yield member
+
+    def _compress_graph_reference(self):
+        """compress_graph using the per-node DFS engine, kept for regression tests."""
+        self._compression = 'eager'
+        for column_label in self._extract_column_labels():
             self._create_direct_edges(column_label)
 
-    def find_path(self, src: CSVNode, dest: CSVNode):
-        visited = set()
-        queue = [(src, [src])] #stores the source node and it's path
+    def _sync_path_cache(self):
+        if self._cache_version != self._version:
+            self._bfs_trees.clear()
+            self._path_sources.clear()
+            self._reachability.clear()
+            self._bit_positions.clear()
+            self._bit_nodes.clear()
+            self._path_matrix = None
+            self._cache_version = self._version
+
+    def bfs_tree(self, src: CSVNode) -> dict[int, tuple]:
+        """BFS tree rooted at src as {node key: (node, parent key, depth)}, memoized per source."""
+        self._sync_path_cache()
+        tree = self._bfs_trees.get(src.key)
+        if tree is not None:
+            if instrument.enabled:
+                instrument.count('path_cache_hits')
+            self._bfs_trees.move_to_end(src.key)
+            return tree
 
+        tree = {src.key: (src, None, 0)}
+        queue = deque([src])
         while queue:
-            current, path = queue.pop(0)
-            if current.key in visited: continue
-            visited.add(current.key)
+            current = queue.popleft()
+            depth = tree[current.key][2] + 1
+            for neighbor in self._neighbors(current):
+                if neighbor.key not in tree:
+                    tree[neighbor.key] = (neighbor, current.key, depth)
+                    queue.append(neighbor)
+
+        if instrument.enabled:
+            instrument.count('nodes_visited', len(tree))
+        self._bfs_trees[src.key] = tree
+        while len(self._bfs_trees) > self.path_cache_size:
+            self._bfs_trees.popitem(last=False)
+        return tree
+
+    @staticmethod
+    def _walk_to_root(tree: dict[int, tuple], key) -> list[CSVNode]:
+        """Follow parent pointers from key up to the root of tree."""
+        path = []
+        while key is not None:
+            node, key, _ = tree[key]
+            path.append(node)
+        return path
+
+    def _bidirectional_search(self, src: CSVNode, dest: CSVNode):
+        """Shortest path by growing BFS levels from both ends, smaller frontier first."""
+        forward = {src.key: (src, None, 0)}
+        backward = {dest.key: (dest, None, 0)}
+        forward_frontier, backward_frontier = [src], [dest]
+
+        while forward_frontier and backward_frontier:
+            expand_forward = len(forward_frontier) <= len(backward_frontier)
+            tree, other = (forward, backward) if expand_forward else (backward, forward)
+            frontier = forward_frontier if expand_forward else backward_frontier
+
+            # Expand a whole level, keeping the shortest meeting found in it
+            best, next_frontier = None, []
+            for current in frontier:
+                depth = tree[current.key][2] + 1
+                for neighbor in self._neighbors(current):
+                    if neighbor.key in other:
+                        length = depth + other[neighbor.key][2]
+                        if best is None or length < best[0]:
+                            best = (length, current.key, neighbor.key)
+                    if neighbor.key not in tree:
+                        tree[neighbor.key] = (neighbor, current.key, depth)
+                        next_frontier.append(neighbor)
+
+            if best is not None:
+                if instrument.enabled:
+                    instrument.count('nodes_visited', len(forward) + len(backward))
+                _, near, far = best
+                path = self._walk_to_root(tree, near)[::-1] + self._walk_to_root(other, far)
+                return path if expand_forward else path[::-1]
+
+            if expand_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+
+        if instrument.enabled:
+            instrument.count('nodes_visited', len(forward) + len(backward))
+        return None
+
+    def find_path(self, src: CSVNode, dest: CSVNode):
+        """Shortest path (fewest hops) from src to dest as a list of nodes, or None.
+
+        A source queried for the second time gets its BFS tree cached (see
+        bfs_tree), so later queries from or to it are answered by following
+        parent pointers; other queries use a bidirectional search.
+        """
+        if instrument.enabled:
+            instrument.count('path_queries')
+        if src.key == dest.key:
+            return [src]
+
+        self._sync_path_cache()
+        if self._path_matrix is not None:
+            if instrument.enabled:
+                instrument.count('path_cache_hits')
+            positions, nodes, distances, parents = self._path_matrix
+            if src.key not in positions or dest.key not in positions:
+                return None
+            path = self._matrix_path(parents, positions[src.key], positions[dest.key])
+            return [nodes[index] for index in path] if path is not None else None
+
+        if src.key in self._bfs_trees or src.key in self._path_sources:
+            tree = self.bfs_tree(src)
+            return self._walk_to_root(tree, dest.key)[::-1] if dest.key in tree else None
+
+        if dest.key in self._bfs_trees:
+            tree = self.bfs_tree(dest)
+            return self._walk_to_root(tree, src.key) if src.key in tree else None
+
+        self._path_sources.add(src.key)
+        return self._bidirectional_search(src, dest)
+
+    def _bit(self, key: int) -> int:
+        position = self._bit_positions.get(key)
+        if position is None:
+            position = self._bit_positions[key] = len(self._bit_nodes)
+            self._bit_nodes.append(self._node_index[key])
+        return position
+
+    def _reachability_index(self, column_label: str | None) -> dict[int, int]:
+        """Map each node key to the bitset of nodes it reaches on column_label (None: on any column).
+
+        Built once per label with a union-find pass and kept until the edges change.
+        """
+        self._sync_path_cache()
+        index = self._reachability.get(column_label)
+        if index is not None:
+            if instrument.enabled:
+                instrument.count('reachability_cache_hits')
+            return index
+
+        sets = DisjointSet()
+        if column_label is None:
+            # Virtual edges join nodes already connected on their label, so stored edges suffice
+            for edge in self._edges:
+                sets.union(edge.left_v.key, edge.right_v.key)
+        else:
+            for key, neighbors in self._label_adjacency.get(column_label, {}).items():
+                for neighbor in neighbors:
+                    sets.union(key, neighbor.key)
+
+        bitsets: dict[int, int] = {}
+        for key in sets.parent:
+            root = sets.find(key)
+            bitsets[root] = bitsets.get(root, 0) | 1 << self._bit(key)
+        index = self._reachability[column_label] = {key: bitsets[sets.find(key)] for key in sets.parent}
+        return index
+
+    def can_reach(self, a: CSVNode, b: CSVNode, column_label: str | None = None) -> bool:
+        """Whether a path joins a and b using only edges on column_label (any edges if None)."""
+        if a.key == b.key:
+            return True
+        index = self._reachability_index(column_label)
+        position = self._bit_positions.get(b.key)
+        return position is not None and index.get(a.key, 0) >> position & 1 == 1
+
+    def reachable_set(self, a: CSVNode, column_label: str | None = None) -> set[CSVNode]:
+        """Nodes reachable from a (a included) using only edges on column_label (any edges if None)."""
+        bits = self._reachability_index(column_label).get(a.key)
+        if bits is None:
+            return {a}
+        reachable = set()
+        while bits:
+            low = bits & -bits
+            reachable.add(self._bit_nodes[low.bit_length() - 1])
+            bits ^= low
+        return reachable
+
+    def _all_pairs(self) -> tuple:
+        """All-pairs shortest paths as (node key -> index, index -> node, distance rows, parent rows).
+
+        distances[i][j] is the hop count from node i to node j (-1 if
+        unreachable) and parents[i][j] the node before j on a shortest path
+        from i. Built with one BFS per node and kept until the edges change;
+        while it exists find_path answers from it.
+        """
+        self._sync_path_cache()
+        if self._path_matrix is not None:
+            return self._path_matrix
+
+        nodes = list(self._node_index.values())
+        nodes += [node for node in {node.key: node for node in self.nodes}.values()
+                  if node.key not in self._node_index]
+        positions = {node.key: index for index, node in enumerate(nodes)}
+        adjacency = [list(dict.fromkeys(positions[neighbor.key] for neighbor in self._neighbors(node)))
+                     for node in nodes]
+
+        distances, parents = [], []
+        unreached = array('i', [-1]) * len(nodes)
+        for source in range(len(nodes)):
+            distance, parent = array('i', unreached), array('i', unreached)
+            distance[source], parent[source] = 0, source
+            frontier, depth = [source], 0
+            while frontier:
+                depth += 1
+                next_frontier = []
+                for current in frontier:
+                    for neighbor in adjacency[current]:
+                        if distance[neighbor] < 0:
+                            distance[neighbor], parent[neighbor] = depth, current
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+            distances.append(distance)
+            parents.append(parent)
+
+        self._path_matrix = (positions, nodes, distances, parents)
+        return self._path_matrix
+
+    @staticmethod
+    def _matrix_path(parents: list, src: int, dest: int) -> list[int] | None:
+        """Node indexes of the shortest path from src to dest in the _all_pairs parent rows."""
+        row = parents[src]
+        if row[dest] < 0:
+            return None
+        path = [dest]
+        while path[-1] != src:
+            path.append(row[path[-1]])
+        return path[::-1]
+
+    def distance(self, a: CSVNode, b: CSVNode) -> int | None:
+        """Fewest hops between a and b, or None if they are not connected."""
+        if a.key == b.key:
+            return 0
+        positions, _, distances, _ = self._all_pairs()
+        if a.key not in positions or b.key not in positions:
+            return None
+        hops = distances[positions[a.key]][positions[b.key]]
+        return hops if hops >= 0 else None
+
+    def join_columns(self, a: CSVNode, b: CSVNode) -> list[str]:
+        """Column labels of the stored or virtual edges joining a and b."""
+        columns = {}
+        for edge in self._adjacency.get(a.key, []):
+            if {edge.left_v.key, edge.right_v.key} == {a.key, b.key}:
+                columns.update(dict.fromkeys(edge.column))
+        if self._compression == 'lazy':
+            for column_label in self._component_labels.get(a.key, []):
+                if self.has_direct_edge(a, b, column_label):
+                    columns[column_label] = None
+        return list(columns)
+
+    @staticmethod
+    def _grow_join_tree(root: int, terminals: list[int], distances: list, parents: list):
+        """Join tree from root, repeatedly attaching the terminal nearest to the tree by a shortest path.
+
+        Returns the (tree index, new index) hops, or None if a terminal is unreachable.
+        """
+        if any(distances[root][terminal] < 0 for terminal in terminals):
+            return None
+
+        in_tree, hops = {root}, []
+        nearest = {terminal: root for terminal in terminals if terminal != root}  # terminal -> closest tree node
+        while nearest:
+            target = min(nearest, key=lambda terminal: distances[nearest[terminal]][terminal])
+            path = CSVGraph._matrix_path(parents, nearest.pop(target), target)
+            added = []
+            for near, far in zip(path, path[1:]):
+                hops.append((near, far))
+                in_tree.add(far)
+                added.append(far)
+            for index in added:
+                nearest.pop(index, None)
+            for terminal, closest in nearest.items():
+                for index in added:
+                    if distances[index][terminal] < distances[closest][terminal]:
+                        closest = nearest[terminal] = index
+        return hops
+
+    def attach_stats(self, stats: dict):
+        """Attach table statistics (node key -> tablestats.TableStats) to nodes and join estimates to edges.
+
+        Joins that cannot be estimated are costed as the largest estimated
+        join, so find_cheapest_path does not favour tables without stats.
+        """
+        for node in list(self._node_index.values()) + self.nodes:
+            node.stats = stats.get(node.key)
+        for edge in self._edges:
+            edge.estimated_rows = self.join_estimate(edge.left_v, edge.right_v, edge.column)
+        self._unknown_join_rows = max((edge.estimated_rows for edge in self._edges if edge.estimated_rows is not None),
+                                      default=1.0)
+
+    @staticmethod
+    def join_estimate(a: CSVNode, b: CSVNode, columns: list[str]) -> float | None:
+        """Estimated rows of joining a's and b's tables on columns, or None without stats for both.
+
+        Uses |A| * |B| / max(distinct A.c, distinct B.c) per column, scaled by
+        the non-null fractions and assuming independent columns.
+        """
+        if a.stats is None or b.stats is None:
+            return None
+        rows = float(a.stats.row_count * b.stats.row_count)
+        for column in columns:
+            distinct = (a.stats.distinct_count(column), b.stats.distinct_count(column))
+            if None in distinct:
+                continue  # column missing from a CSV header
+            rows *= (1 - a.stats.null_rate(column)) * (1 - b.stats.null_rate(column)) / max(*distinct, 1)
+        return rows
+
+    def _weighted_neighbors(self, node: CSVNode):
+        """Yield (neighbor, estimated join rows) over stored and virtual edges; _unknown_join_rows without stats."""
+        for edge in self._adjacency.get(node.key, []):
+            neighbor = edge.right_v if edge.left_v.key == node.key else edge.left_v
+            estimate = edge.estimated_rows
+            if estimate is None:
+                estimate = self.join_estimate(edge.left_v, edge.right_v, edge.column)
+            yield neighbor, estimate if estimate is not None else self._unknown_join_rows
+
+        if self._compression != 'lazy':
+            return
+        for column_label in self._component_labels.get(node.key, []):
+            for member in self._components[column_label][node.key]:
+                if member.key != node.key:
+                    estimate = self.join_estimate(node, member, [column_label])
+                    yield member, estimate if estimate is not None else self._unknown_join_rows
+
+    def find_cheapest_path(self, src: CSVNode, dest: CSVNode):
+        """Path from src to dest with the fewest total estimated join rows, or None.
+
+        Each hop costs the estimated size of joining its two tables (see
+        attach_stats and join_estimate). Hops that cannot be estimated cost as
+        much as the largest estimated join, or one row if there are no stats,
+        so without any stats this is a fewest-hops path.
+        """
+        if src.key == dest.key:
+            return [src]
+
+        tree = {src.key: (src, None, 0)}  # node key -> (node, parent key, depth), as in bfs_tree
+        costs, done = {src.key: 0.0}, set()
+        order = count()
+        heap = [(0.0, next(order), src)]
+        while heap:
+            cost, _, current = heappop(heap)
+            if current.key in done:
+                continue
+            if current.key == dest.key:
+                return self._walk_to_root(tree, dest.key)[::-1]
+            done.add(current.key)
+
+            for neighbor, estimate in self._weighted_neighbors(current):
+                total = cost + estimate
+                if neighbor.key not in done and total < costs.get(neighbor.key, float('inf')):
+                    costs[neighbor.key] = total
+                    tree[neighbor.key] = (neighbor, current.key, tree[current.key][2] + 1)
+                    heappush(heap, (total, next(order), neighbor))
+
+        return None
+
+    def path_joins(self, path: list[CSVNode]) -> JoinTree:
+        """JoinTree following path, as returned by find_path, hop by hop."""
+        return JoinTree(list(path), [(near, far, self.join_columns(near, far)) for near, far in zip(path, path[1:])])
+
+    def plan_joins(self, tables: list[CSVNode]) -> JoinTree | None:
+        """Approximate smallest join tree connecting tables, or None if they are not all connected.
+
+        Grows a tree from each table in turn, attaching the nearest remaining
+        table along a shortest path of the cached _all_pairs matrix, and keeps
+        the tree with the fewest joins (at most twice the optimum).
+        """
+        tables = list({table.key: table for table in tables}.values())
+        if len(tables) <= 1:
+            return JoinTree(tables, [])
+
+        positions, nodes, distances, parents = self._all_pairs()
+        if any(table.key not in positions for table in tables):
+            return None
+        terminals = [positions[table.key] for table in tables]
+
+        best = None
+        for root in terminals:
+            hops = self._grow_join_tree(root, terminals, distances, parents)
+            if hops is None:
+                return None
+            if best is None or len(hops) < len(best[1]):
+                best = (root, hops)
+
+        root, hops = best
+        joins = [(nodes[near], nodes[far], self.join_columns(nodes[near], nodes[far])) for near, far in hops]
+        return JoinTree([nodes[root]] + [far for _, far, _ in joins], joins)
+
+# Graphs with more nodes than this are drawn by render.render_graph
+SCALABLE_RENDER_NODES = 100
 
-            # return the path if the destination is reached
-            if current.key == dest.key: return path 
+def visualize(graph, output=None, names=None, scalable=None, **options):
+    """Draw graph in a window, or to output (an image path such as graph.png or graph.svg).
 
-            for edge in self.edges:
-                if edge.left_v.key == current.key:
-                    queue.append((edge.right_v, path + [edge.right_v]))
-                elif edge.right_v.key == current.key:
-                    queue.append((edge.left_v, path + [edge.left_v]))
+    Large graphs, or any graph with scalable=True, are drawn by
+    render.render_graph (cached layouts, aggregated cliques, collections),
+    which receives options. names maps node keys to labels.
+    """
+    if scalable or (scalable is None and len(graph.nodes) > SCALABLE_RENDER_NODES):
+        from render import render_graph
+        return render_graph(graph, output, names, **options)
 
-        #return None if there's no path between the source and the destination
-        return None 
+    # Plotting libraries are slow to import and need a display, so only visualize loads them
+    import networkx as nx
+    import matplotlib.pyplot as plt
 
-def visualize(graph):
     G = nx.Graph()
 
     for node in graph.nodes: G.add_node(node.key)
@@ -118,11 +1003,16 @@ def visualize(graph):
     pos = nx.spring_layout(G, k=10, seed=25)
     nx.draw_networkx_nodes(G, pos, node_size=3000, node_color="skyblue", edgecolors="black")
     nx.draw_networkx_edges(G, pos, width=2, alpha=0.6, edge_color="gray")
-    nx.draw_networkx_labels(G, pos, labels={node: node for node in G.nodes}, font_size=10, font_weight="bold")
+    nx.draw_networkx_labels(G, pos, labels={node: (names or {}).get(node, node) for node in G.nodes},
+                            font_size=10, font_weight="bold")
 
     edge_labels = nx.get_edge_attributes(G, 'label')
     nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_color='red', font_size=10)
 
     plt.title("Graph Visualization")
     plt.axis('off')
-    plt.show()
+    if output is None:
+        plt.show()
+    else:
+        plt.savefig(output, bbox_inches='tight')
+        plt.close()
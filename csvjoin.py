@@ -0,0 +1,149 @@
+import csv
+import os
+import pickle
+import tempfile
+from itertools import chain
+
+from csvgraph import CSVNode, JoinTree
+
+def table_files(directory: str, table_names: list[str]) -> dict[int, str]:
+    """Map the node key of each table (index + 1, as in main.create_graph) to its CSV file in directory.
+
+    File names are matched case-insensitively against '<table name>.csv';
+    tables without a file are left out.
+    """
+    paths = {name.lower(): os.path.join(directory, name) for name in os.listdir(directory)}
+    files = {}
+    for index, table_name in enumerate(table_names):
+        path = paths.get(f'{table_name.lower()}.csv')
+        if path is not None:
+            files[index + 1] = path
+    return files
+
+def _row_size(row: dict) -> int:
+    """Rough in-memory size of a row of strings, used against the memory limit."""
+    return 64 + sum(len(value) + 80 for value in row.values())
+
+def _join_key(row: dict, columns: list[str]):
+    """Values of columns in row, or None if any is empty (NULL never joins)."""
+    key = tuple(row[column] for column in columns)
+    return None if '' in key else key
+
+def _read_spill(path: str):
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+# Runs join trees over per-table CSV files with memory-bounded hash joins
+class HashJoinExecutor:
+    def __init__(self, files: dict[int, str], memory_limit: int = 64 << 20, partitions: int = 16,
+                 spill_dir: str | None = None, encoding: str = 'utf-8'):
+        self.files = files  # node key -> CSV path
+        self.memory_limit = memory_limit  # bytes of build rows held before spilling to partitions
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        self.encoding = encoding
+        self.max_depth = 4  # re-partitioning rounds before a skewed partition is loaded whole
+        self.spilled_partitions = 0  # partitions written by the last execute
+
+    def _path(self, node: CSVNode) -> str:
+        if node.key not in self.files:
+            raise ValueError(f"no CSV file for table {node.key}")
+        return self.files[node.key]
+
+    def table_name(self, node: CSVNode) -> str:
+        """Prefix of node's columns in joined rows: its CSV file name without extension, lowercased."""
+        return os.path.splitext(os.path.basename(self._path(node)))[0].lower()
+
+    def _qualified(self, node: CSVNode, columns: list[str]) -> list[str]:
+        name = self.table_name(node)
+        return [f'{name}.{column.lower()}' for column in columns]
+
+    def rows(self, node: CSVNode):
+        """Stream node's CSV rows as dicts keyed by '<table>.<column>' (column lowercased)."""
+        name = self.table_name(node)
+        with open(self._path(node), newline='', encoding=self.encoding) as file:
+            reader = csv.reader(file)
+            header = [f'{name}.{column.strip().lower()}' for column in next(reader, [])]
+            for values in reader:
+                yield dict(zip(header, values))
+
+    def execute(self, plan: JoinTree):
+        """Yield the rows of plan's inner joins, in no particular order.
+
+        Each join matches the new table's rows to the rows joined so far on
+        all of the join's columns. The first join builds its hash table on
+        the smaller of the two files; later joins build on the new table,
+        while the rows joined so far are streamed through as the probe side.
+        """
+        self.spilled_partitions = 0
+        if not plan.joins:
+            yield from (self.rows(plan.tables[0]) if plan.tables else ())
+            return
+
+        root = plan.joins[0][0]
+        stream = self.rows(root)
+        for index, (near, far, columns) in enumerate(plan.joins):
+            if not columns:
+                raise ValueError(f"no join columns between tables {near.key} and {far.key}")
+            near_columns, far_columns = self._qualified(near, columns), self._qualified(far, columns)
+            if index == 0 and os.path.getsize(self._path(root)) < os.path.getsize(self._path(far)):
+                stream = self._hash_join(self.rows(far), far_columns, stream, near_columns, build_first=True)
+            else:
+                stream = self._hash_join(stream, near_columns, self.rows(far), far_columns)
+        yield from stream
+
+    def _hash_join(self, probe, probe_columns: list[str], build, build_columns: list[str],
+                   build_first: bool = False, depth: int = 0):
+        """Yield probe rows merged with the build rows whose build_columns equal their probe_columns.
+
+        build_first puts the build row's columns first in the merged rows.
+        Once the build rows held pass memory_limit, both sides are spilled to
+        hash partitions on disk and joined partition by partition.
+        """
+        table, size = {}, 0
+        build = iter(build)
+        for row in build:
+            key = _join_key(row, build_columns)
+            if key is None:
+                continue
+            table.setdefault(key, []).append(row)
+            size += _row_size(row)
+            if size > self.memory_limit and depth < self.max_depth:
+                held = chain.from_iterable(table.values())
+                yield from self._partitioned_join(probe, probe_columns, chain(held, build), build_columns,
+                                                  build_first, depth)
+                return
+
+        for row in probe:
+            for match in table.get(_join_key(row, probe_columns), ()):
+                yield {**match, **row} if build_first else {**row, **match}
+
+    def _spill(self, rows, columns: list[str], directory: str, side: str, depth: int) -> list[str]:
+        """Write rows to hash partitions of their join key, returning the partition paths."""
+        paths = [os.path.join(directory, f'{side}-{index}') for index in range(self.partitions)]
+        files = [open(path, 'wb') for path in paths]
+        try:
+            for row in rows:
+                key = _join_key(row, columns)
+                if key is not None:
+                    # Salt with the depth so re-partitioning splits a partition differently
+                    pickle.dump(row, files[hash((depth, key)) % self.partitions], pickle.HIGHEST_PROTOCOL)
+        finally:
+            for file in files:
+                file.close()
+        return paths
+
+    def _partitioned_join(self, probe, probe_columns: list[str], build, build_columns: list[str],
+                          build_first: bool, depth: int):
+        with tempfile.TemporaryDirectory(prefix='csvjoin-', dir=self.spill_dir) as directory:
+            build_paths = self._spill(build, build_columns, directory, 'build', depth)
+            probe_paths = self._spill(probe, probe_columns, directory, 'probe', depth)
+            self.spilled_partitions += self.partitions
+            for build_path, probe_path in zip(build_paths, probe_paths):
+                if os.path.getsize(build_path) and os.path.getsize(probe_path):
+                    yield from self._hash_join(_read_spill(probe_path), probe_columns, _read_spill(build_path),
+                                               build_columns, build_first, depth + 1)
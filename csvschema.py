@@ -0,0 +1,80 @@
+import csv
+import os
+import re
+from itertools import islice
+
+from csvgraph import CSVNode, CSVEdge, CSVGraph
+
+def read_header(path: str, sample_rows: int = 0, encoding: str = 'utf-8') -> tuple[list[str], list[list[str]]]:
+    """Lowercased column names of a CSV file and up to sample_rows of its first rows."""
+    with open(path, newline='', encoding=encoding) as file:
+        reader = csv.reader(file)
+        columns = [column.strip().lower() for column in next(reader, [])]
+        return columns, list(islice(reader, sample_rows))
+
+def scan_headers(paths, sample_rows: int = 0, workers: int | None = None,
+                 encoding: str = 'utf-8') -> dict[str, tuple[list[str], list[list[str]]]]:
+    """Read the header (and sample) of each file in a thread pool, keyed by lowercased file name stem.
+
+    paths is a directory, whose *.csv files are read in case-insensitive
+    name order, or a list of CSV paths.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        directory = paths
+        names = sorted((name for name in os.listdir(directory) if name.lower().endswith('.csv')), key=str.lower)
+        paths = [os.path.join(directory, name) for name in names]
+
+    from concurrent.futures import ThreadPoolExecutor  # only needed here; keeps CLI startup fast
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        headers = executor.map(lambda path: read_header(path, sample_rows, encoding), paths)
+        return {os.path.splitext(os.path.basename(path))[0].lower(): header for path, header in zip(paths, headers)}
+
+def column_index(headers: dict[str, tuple[list[str], list]]) -> dict[str, list[str]]:
+    """Inverted index of column name -> tables having it, in table order."""
+    index: dict[str, list[str]] = {}
+    for table_name, (columns, _) in headers.items():
+        for column in dict.fromkeys(columns):
+            index.setdefault(column, []).append(table_name)
+    return index
+
+def _owner(column: str, table_names: list[str], headers: dict) -> str:
+    """The table column most likely identifies: named after it, else unique in its sample, else the first."""
+    stem = column[:-3] if column.endswith('_id') else column
+    named = [table_name for table_name in table_names if table_name == stem or table_name.endswith('_' + stem)]
+    if named:
+        return min(named, key=len)
+
+    for table_name in table_names:
+        columns, sample = headers[table_name]
+        position = columns.index(column)
+        values = [row[position] for row in sample if position < len(row)]
+        if values and '' not in values and len(set(values)) == len(values):
+            return table_name
+    return table_names[0]
+
+def infer_graph(paths, sample_rows: int = 0, workers: int | None = None, shared_columns=None,
+                encoding: str = 'utf-8') -> tuple[CSVGraph, list[str]]:
+    """Build the join graph of a folder of CSV files from their headers alone.
+
+    Tables become nodes keyed by index + 1 in the returned table names (as
+    in main.create_graph). Tables sharing a column are joined on it in a
+    star around the table the column most likely identifies, so the edge
+    count is linear in the number of shared columns and compression
+    recovers every pair. shared_columns, a regex, limits which columns
+    join tables (e.g. r'.*_id').
+    """
+    headers = scan_headers(paths, sample_rows, workers, encoding)
+    table_names = list(headers)
+    nodes = {table_name: CSVNode(index + 1, headers[table_name][0]) for index, table_name in enumerate(table_names)}
+    graph = CSVGraph(list(nodes.values()))
+    pattern = re.compile(shared_columns) if isinstance(shared_columns, str) else shared_columns
+
+    for column, tables in column_index(headers).items():
+        if len(tables) < 2 or (pattern is not None and not pattern.fullmatch(column)):
+            continue
+        owner = _owner(column, tables, headers)
+        for table_name in tables:
+            if table_name != owner:
+                graph.add_edge(CSVEdge(nodes[table_name], nodes[owner], [column]))
+
+    return graph, table_names
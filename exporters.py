@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+from csvgraph import CSVGraph
+
+FORMATS = ('dot', 'json', 'graphml')
+
+def iter_edges(graph: CSVGraph, edges=None):
+    """Yield (edge, derived) for edges, or for all of graph's stored and virtual edges."""
+    if edges is not None:
+        for edge in edges:
+            yield edge, graph.is_derived(edge)
+        return
+    for edge in graph._edges:
+        yield edge, graph.is_derived(edge)
+    for edge in graph.virtual_edges():
+        yield edge, True
+
+def _name(names: dict | None, key: int) -> str:
+    return names.get(key, str(key)) if names else str(key)
+
+def escape(value: str) -> str:
+    """Escape XML character data (xml.sax.saxutils pulls in urllib at import)."""
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _dot_string(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def write_dot(graph: CSVGraph, file, names: dict | None = None, edges=None):
+    """Write graph as an undirected Graphviz DOT graph; derived edges are dashed."""
+    file.write('graph csvgraph {\n')
+    for node in graph.nodes:
+        file.write(f'  {node.key} [label={_dot_string(_name(names, node.key))}];\n')
+    for edge, derived in iter_edges(graph, edges):
+        style = ', style=dashed' if derived else ''
+        file.write(f'  {edge.left_v.key} -- {edge.right_v.key} [label={_dot_string(",".join(edge.column))}{style}];\n')
+    file.write('}\n')
+
+def write_json(graph: CSVGraph, file, names: dict | None = None, edges=None):
+    """Write graph as {"nodes": [{key, name, columns}], "edges": [{source, target, columns, derived}]}."""
+    file.write('{"nodes": [')
+    for index, node in enumerate(graph.nodes):
+        file.write(',\n  ' if index else '\n  ')
+        file.write(json.dumps({'key': node.key, 'name': _name(names, node.key), 'columns': list(node.columns)}))
+    file.write('\n], "edges": [')
+    for index, (edge, derived) in enumerate(iter_edges(graph, edges)):
+        file.write(',\n  ' if index else '\n  ')
+        file.write(json.dumps({'source': edge.left_v.key, 'target': edge.right_v.key,
+                               'columns': list(edge.column), 'derived': derived}))
+    file.write('\n]}\n')
+
+def write_graphml(graph: CSVGraph, file, names: dict | None = None, edges=None):
+    """Write graph as GraphML; node columns and edge columns are comma-separated attributes."""
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+               '  <key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+               '  <key id="node_columns" for="node" attr.name="columns" attr.type="string"/>\n'
+               '  <key id="columns" for="edge" attr.name="columns" attr.type="string"/>\n'
+               '  <key id="derived" for="edge" attr.name="derived" attr.type="boolean"/>\n'
+               '  <graph id="csvgraph" edgedefault="undirected">\n')
+    for node in graph.nodes:
+        file.write(f'    <node id="n{node.key}"><data key="name">{escape(_name(names, node.key))}</data>'
+                   f'<data key="node_columns">{escape(",".join(node.columns))}</data></node>\n')
+    for edge, derived in iter_edges(graph, edges):
+        file.write(f'    <edge source="n{edge.left_v.key}" target="n{edge.right_v.key}">'
+                   f'<data key="columns">{escape(",".join(edge.column))}</data>'
+                   f'<data key="derived">{str(derived).lower()}</data></edge>\n')
+    file.write('  </graph>\n</graphml>\n')
+
+WRITERS = {'dot': write_dot, 'json': write_json, 'graphml': write_graphml}
+
+@contextmanager
+def _open_output(output):
+    if output is None or output == '-':
+        yield sys.stdout
+    elif isinstance(output, (str, os.PathLike)):
+        with open(output, 'w', encoding='utf-8') as file:
+            yield file
+    else:
+        yield output
+
+def export(graph: CSVGraph, output=None, format: str = 'json', names: dict | None = None, edges=None):
+    """Write graph in format (one of FORMATS) to output: a path, a text file object, or None for stdout."""
+    with _open_output(output) as file:
+        WRITERS[format](graph, file, names, edges)
@@ -0,0 +1,180 @@
+import hashlib
+from collections import Counter, defaultdict
+
+from csvgraph import CSVNode, CSVEdge, CSVGraph
+from parallelparser import merge_shards
+from sqlparser import SQLParser, SQLStatementSplitter, iter_sql_chunks
+
+# Changes between two parses of a schema
+class SchemaDiff:
+    def __init__(self):
+        self.added_tables: dict[str, list[str]] = {}  # table -> columns
+        self.removed_tables: list[str] = []
+        self.added_columns: dict[str, list[str]] = {}  # table -> columns
+        self.removed_columns: dict[str, list[str]] = {}
+        self.added_foreign_keys: list[tuple[str, dict]] = []  # (table, foreign key)
+        self.removed_foreign_keys: list[tuple[str, dict]] = []
+
+    def __bool__(self) -> bool:
+        return any((self.added_tables, self.removed_tables, self.added_columns, self.removed_columns,
+                    self.added_foreign_keys, self.removed_foreign_keys))
+
+    def __repr__(self) -> str:
+        return (f"SchemaDiff(+{len(self.added_tables)}/-{len(self.removed_tables)} tables, "
+                f"+{sum(map(len, self.added_columns.values()))}/-{sum(map(len, self.removed_columns.values()))} columns, "
+                f"+{len(self.added_foreign_keys)}/-{len(self.removed_foreign_keys)} foreign keys)")
+
+def _foreign_key_id(table_name: str, fk: dict) -> tuple:
+    return (table_name.lower(), tuple(fk['columns']), fk['ref_table'], tuple(fk['ref_columns']))
+
+def diff_schemas(old, new) -> SchemaDiff:
+    """Compare two (tables, primary_keys, foreign_keys) parser results."""
+    old_tables, _, old_foreign_keys = old
+    new_tables, _, new_foreign_keys = new
+    diff = SchemaDiff()
+
+    for table_name, columns in new_tables.items():
+        if table_name not in old_tables:
+            diff.added_tables[table_name] = columns
+            continue
+        old_columns, new_columns = set(old_tables[table_name]), set(columns)
+        added = [column for column in columns if column not in old_columns]
+        removed = [column for column in old_tables[table_name] if column not in new_columns]
+        if added:
+            diff.added_columns[table_name] = added
+        if removed:
+            diff.removed_columns[table_name] = removed
+    diff.removed_tables = [table_name for table_name in old_tables if table_name not in new_tables]
+
+    # Foreign keys are compared as multisets, so duplicate constraints are matched one to one
+    unmatched = Counter(_foreign_key_id(table_name, fk) for table_name, fks in old_foreign_keys.items() for fk in fks)
+    for table_name, fks in new_foreign_keys.items():
+        for fk in fks:
+            fk_id = _foreign_key_id(table_name, fk)
+            if unmatched[fk_id] > 0:
+                unmatched[fk_id] -= 1
+            else:
+                diff.added_foreign_keys.append((table_name, fk))
+    for table_name, fks in old_foreign_keys.items():
+        for fk in fks:
+            fk_id = _foreign_key_id(table_name, fk)
+            if unmatched[fk_id] > 0:
+                unmatched[fk_id] -= 1
+                diff.removed_foreign_keys.append((table_name, fk))
+
+    return diff
+
+# Re-parses only the CREATE/ALTER TABLE statements that changed since the last update
+class IncrementalSchema:
+    def __init__(self, allowlist=None, chunk_size: int = 1 << 20):
+        self.allowlist = allowlist
+        self.chunk_size = chunk_size
+        self.parsed = (defaultdict(), defaultdict(list), defaultdict(list))
+        self.reparsed_statements = 0  # statements parsed by the last update
+        self._parser = SQLParser(allowlist=allowlist)
+        self._pieces: dict[bytes, tuple] = {}  # statement digest -> parsed statement
+
+    def _parse_statement(self, statement: str) -> tuple:
+        parser = SQLParser(allowlist=self.allowlist)
+        alter_table_pks = []
+        parser._dispatch_statement(statement, alter_table_pks)
+        return dict(parser.tables), alter_table_pks, dict(parser.foreign_keys)
+
+    def update(self, source) -> SchemaDiff:
+        """Re-read source (a path or file object), returning how the schema changed."""
+        splitter = SQLStatementSplitter(keep=self._parser._is_schema_statement)
+        pieces, seen = [], {}
+        self.reparsed_statements = 0
+
+        def collect(statements):
+            for statement in statements:
+                digest = hashlib.blake2b(statement.encode(), digest_size=16).digest()
+                piece = seen.get(digest) or self._pieces.get(digest)
+                if piece is None:
+                    piece = self._parse_statement(statement)
+                    self.reparsed_statements += 1
+                seen[digest] = piece
+                pieces.append(piece)
+
+        for chunk in iter_sql_chunks(source, self.chunk_size):
+            collect(splitter.feed(chunk))
+        collect(splitter.close())
+
+        # Statements that disappeared from the dump are forgotten
+        self._pieces = seen
+        parsed = merge_shards(pieces, self.allowlist)
+        diff = diff_schemas(self.parsed, parsed)
+        self.parsed = parsed
+        return diff
+
+def patch_graph(graph: CSVGraph, diff: SchemaDiff, parsed, table_names: list[str]) -> set[str]:
+    """Apply diff in place to a graph built by main.create_graph from the previous parse.
+
+    parsed is the new parser result and table_names the list given to
+    create_graph. Added tables also get the edges of existing foreign keys
+    to or from them, as a rebuild would. Only the compression of the column labels whose edges
+    changed is rebuilt (or, after compress_graph(incremental=True), kept
+    current edge by edge); those labels are returned.
+    """
+    tables, _, foreign_keys = parsed
+    keys = {}
+    for index, table_name in enumerate(table_names):
+        keys.setdefault(table_name.lower(), index + 1)
+    nodes = {node.key: node for node in graph.nodes}
+    affected = set()
+
+    for table_name in diff.removed_tables:
+        node = nodes.pop(keys.get(table_name.lower()), None)
+        if node is not None:
+            affected |= graph.remove_node(node)
+
+    added_keys = set()
+    for table_name, columns in diff.added_tables.items():
+        key = keys.get(table_name.lower())
+        if key is not None and key not in nodes:
+            nodes[key] = CSVNode(key, columns)
+            graph.nodes.append(nodes[key])
+            added_keys.add(key)
+
+    for table_name in diff.added_columns.keys() | diff.removed_columns.keys():
+        node = nodes.get(keys.get(table_name.lower()))
+        if node is not None:
+            node.columns = tables[table_name]
+
+    def fk_nodes(table_name, fk):
+        return nodes.get(keys.get(table_name.lower())), nodes.get(keys.get(fk['ref_table'].lower()))
+
+    if diff.removed_foreign_keys:
+        # An edge stays while any remaining foreign key still produces it
+        remaining = set()
+        for table_name, fks in foreign_keys.items():
+            for fk in fks:
+                left, right = fk_nodes(table_name, fk)
+                if left is not None and right is not None:
+                    remaining.add((frozenset((left.key, right.key)), tuple(fk['columns'])))
+
+        for table_name, fk in diff.removed_foreign_keys:
+            left, right = fk_nodes(table_name, fk)
+            if left is None or right is None or (frozenset((left.key, right.key)), tuple(fk['columns'])) in remaining:
+                continue
+            if graph.remove_edge(CSVEdge(left, right, fk['columns'])):
+                affected.update(fk['columns'])
+
+    # Foreign keys create_graph skipped while one of their tables was missing become edges with it
+    added_foreign_keys = list(diff.added_foreign_keys)
+    if added_keys:
+        for table_name, fks in foreign_keys.items():
+            for fk in fks:
+                left, right = fk_nodes(table_name, fk)
+                if left is not None and right is not None and (left.key in added_keys or right.key in added_keys):
+                    added_foreign_keys.append((table_name, fk))
+
+    for table_name, fk in added_foreign_keys:
+        left, right = fk_nodes(table_name, fk)
+        if left is not None and right is not None:
+            graph.add_edge(CSVEdge(left, right, fk['columns']))
+            affected.update(fk['columns'])
+
+    if not graph.incremental:
+        graph.recompress(affected)
+    return affected
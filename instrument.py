@@ -0,0 +1,94 @@
+# Optional stage timers and event counters for the parse -> graph -> query pipeline.
+# Instrumented code checks the module-level `enabled` flag before recording anything,
+# so while no recorder is installed a call site costs one attribute lookup.
+import time
+from contextlib import contextmanager
+
+enabled = False
+_recorder = None
+
+# Stage timings and counters collected while installed by instrumented()
+class Recorder:
+    def __init__(self, hooks=()):
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self.counters: dict[str, int] = {}
+        self.hooks = list(hooks)
+
+    def add_hook(self, hook):
+        """Call hook(kind, name, value) on every event: kind 'stage' with seconds, or 'count' with the amount."""
+        self.hooks.append(hook)
+
+    def record(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+        for hook in self.hooks:
+            hook('stage', name, seconds)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+        for hook in self.hooks:
+            hook('count', name, amount)
+
+    def as_dict(self) -> dict:
+        return {'stages': {name: {'seconds': self.seconds[name], 'calls': self.calls[name]} for name in self.seconds},
+                'counters': dict(self.counters)}
+
+    def report(self) -> str:
+        """Stage breakdown and counters as a text table; nested stages are included in their parent's time."""
+        lines = [f"{'stage':<24}{'calls':>8}{'seconds':>12}"]
+        lines += [f"{name:<24}{self.calls[name]:>8}{seconds:>12.4f}" for name, seconds in self.seconds.items()]
+        if self.counters:
+            lines.append(f"{'counter':<24}{'value':>20}")
+            lines += [f"{name:<24}{value:>20}" for name, value in sorted(self.counters.items())]
+        return '\n'.join(lines)
+
+class _Stage:
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder: Recorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, time.perf_counter() - self.start)
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+def stage(name: str):
+    """Context manager timing a stage into the installed recorder; a shared no-op when disabled."""
+    return _Stage(_recorder, name) if enabled else _NULL_STAGE
+
+def count(name: str, amount: int = 1):
+    """Add amount to a counter. Hot paths should test `enabled` first instead of calling this."""
+    if enabled:
+        _recorder.count(name, amount)
+
+@contextmanager
+def instrumented(recorder: Recorder | None = None, hooks=()):
+    """Install recorder (a new Recorder with hooks by default) for the duration of the block and yield it.
+
+    Counters from worker processes (parse_parallel) are not collected.
+    """
+    global enabled, _recorder
+    if recorder is None:
+        recorder = Recorder(hooks)
+    previous = enabled, _recorder
+    enabled, _recorder = True, recorder
+    try:
+        yield recorder
+    finally:
+        enabled, _recorder = previous
@@ -1,5 +1,18 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+import instrument
 from csvgraph import *
 from sqlparser import SQLParser
+from parallelparser import parse_parallel
+from schemacache import SchemaCache
+from csvschema import infer_graph
+from exporters import FORMATS, export
+from render import LayoutCache
+from snapshot import write_snapshot
 
 # List of tables with filenames and their corresponding indexes
 filtered = [
@@ -14,14 +27,24 @@ filtered = [
     'nibrs_victim_type',
 ]
 
-def create_graph(tables, foreign_keys):
+def create_graph(tables, foreign_keys, table_names=filtered):
+    with instrument.stage('create_graph'):
+        return _create_graph(tables, foreign_keys, table_names)
+
+def _create_graph(tables, foreign_keys, table_names):
     nodes = {}
     graph = CSVGraph()
 
-    # Create nodes for each filtered table with numerical labels
-    for index, table_name in enumerate(filtered):
-        if table_name in tables:
-            node = CSVNode(index + 1, tables[table_name])
+    # Table names are matched case-insensitively: dumps may spell them in any case
+    columns = {}
+    for table_name, table_columns in tables.items():
+        columns.setdefault(table_name.lower(), table_columns)
+
+    # Create nodes for each selected table with numerical labels
+    for index, table_name in enumerate(table_names):
+        table_name = table_name.lower()
+        if table_name in columns and table_name not in nodes:
+            node = CSVNode(index + 1, columns[table_name])
             nodes[table_name] = node
             graph.nodes.append(node)
 
@@ -43,15 +66,191 @@ def create_graph(tables, foreign_keys):
 
     return graph
 
-if __name__ == "__main__":
-    sql_file_path = 'postgres_setup.sql'
-    with open(sql_file_path, 'r') as file:
-        sql_content = file.read()
+def parse_allowlist(value: str) -> list:
+    """Comma-separated table names and glob patterns; entries prefixed with 're:' are regexes."""
+    entries = [entry.strip() for entry in value.split(',') if entry.strip()]
+    return [re.compile(entry[3:]) if entry.startswith('re:') else entry for entry in entries]
 
-    parser = SQLParser(sql_content)
-    tables, primary_keys, foreign_keys = parser.parse()
-    filtered_parsed_tables = {k: v for k, v in tables.items() if k.lower() in tables}
+def graph_table_names(parsed, allowlist=None) -> list[str]:
+    """Table names of the graph load_graph builds from parsed; node key k is table_names[k - 1]."""
+    return filtered if allowlist is None else [name.lower() for name in parsed[0]]
 
-    graph = create_graph(filtered_parsed_tables, foreign_keys)
+def load_graph(sql_files, allowlist=None, workers=1, cache=None, stage='compressed'):
+    """Parse sql_files and build the compressed graph, or load both from cache.
+
+    With allowlist=None the built-in filtered tables are used. On a cache
+    miss, stage stops the pipeline early: 'parsed' builds no graph (None is
+    returned for it) and 'graph' leaves it uncompressed; only complete
+    results are cached. Returns ((tables, primary_keys, foreign_keys), graph).
+    """
+    tables_allowlist = allowlist if allowlist is not None else filtered
+    if cache is not None:
+        key = cache.key(sql_files, allowlist)
+        with instrument.stage('cache_load'):
+            entry = cache.load(key)
+        if entry is not None:
+            instrument.count('schema_cache_hits')
+            return entry
+        instrument.count('schema_cache_misses')
+
+    if len(sql_files) == 1 and workers == 1:
+        parsed = SQLParser.from_file(sql_files[0], allowlist=tables_allowlist).parse()
+    else:
+        parsed = parse_parallel(sql_files, workers, tables_allowlist)
+    if stage == 'parsed':
+        return parsed, None
+    tables, primary_keys, foreign_keys = parsed
+    graph = create_graph(tables, foreign_keys, graph_table_names(parsed, allowlist))
+    if stage == 'graph':
+        return parsed, graph
     graph.compress_graph()
-    visualize(graph)
+
+    if cache is not None:
+        cache.store(key, parsed, graph)
+    return parsed, graph
+
+def add_source_arguments(parser):
+    parser.add_argument('sql_files', nargs='*', default=['postgres_setup.sql'],
+                        help="schema dump(s), parsed in the given order")
+    parser.add_argument('--tables', type=parse_allowlist,
+                        help="tables to keep, e.g. 'nibrs_incident,nibrs_victim*,re:nibrs_(offense|offender)' "
+                             "(default: the built-in nibrs subset)")
+    parser.add_argument('--workers', type=int,
+                        help="parser processes for multiple or very large dumps (default: 1), "
+                             "or header scanning threads with --csv-dir (default: the thread pool's)")
+    parser.add_argument('--cache-dir', help="where parsed schemas and graphs are cached (default: ~/.cache/csvgraph)")
+    parser.add_argument('--no-cache', action='store_true', help="always parse and compress from scratch")
+    parser.add_argument('--csv-dir', help="infer the graph from the headers of the CSV files in this folder "
+                                          "instead of parsing a schema dump")
+    parser.add_argument('--profile', action='store_true',
+                        help="print the time spent in each stage and the pipeline counters to stderr")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="run under cProfile, write the statistics to FILE (for pstats) and print the top calls")
+
+def add_export_arguments(parser):
+    parser.add_argument('--format', choices=FORMATS, default='json', help="output format (default: json)")
+    parser.add_argument('-o', '--output', help="output file (default: stdout)")
+
+def build_cli() -> argparse.ArgumentParser:
+    cli = argparse.ArgumentParser(description="Build, query and export the join graph of an SQL schema.")
+    commands = cli.add_subparsers(dest='command', required=True)
+
+    add_source_arguments(commands.add_parser('parse', help="print the parsed tables and keys as JSON"))
+    for name, help in (('build', "export the foreign key graph"),
+                       ('compress', "export the compressed graph, with derived edges")):
+        command = commands.add_parser(name, help=help)
+        add_source_arguments(command)
+        add_export_arguments(command)
+
+    path = commands.add_parser('path', help="print the shortest join path between two tables")
+    path.add_argument('src', help="table to start from")
+    path.add_argument('dest', help="table to reach")
+    add_source_arguments(path)
+
+    snapshot = commands.add_parser('snapshot', help="write the compressed graph as a memory-mappable binary snapshot")
+    add_source_arguments(snapshot)
+    snapshot.add_argument('-o', '--output', required=True, help="snapshot file to write")
+
+    render = commands.add_parser('render', help="draw the compressed graph")
+    add_source_arguments(render)
+    render.add_argument('-o', '--output', help="write an image (.png, .svg, ...) instead of opening a window")
+    render.add_argument('--scalable', action='store_true', default=None,
+                        help=f"use the scalable renderer (default for more than {SCALABLE_RENDER_NODES} tables)")
+    render.add_argument('--all-edges', action='store_true', help="lay out with compressed edges too (scalable)")
+    render.add_argument('--no-aggregate', action='store_true',
+                        help="draw every compressed edge instead of one star per clique (scalable)")
+    return cli
+
+# How far each command needs the source taken (see load_graph); the others need the compressed graph
+COMMAND_STAGES = {'parse': 'parsed', 'build': 'graph'}
+
+def load_cli_graph(args):
+    """(parsed or None, graph or None, table names) for the source arguments of a command.
+
+    The graph is only built, and only compressed, if the command needs it.
+    """
+    stage = COMMAND_STAGES.get(args.command, 'compressed')
+    if args.csv_dir:
+        with instrument.stage('infer_graph'):
+            graph, table_names = infer_graph(args.csv_dir, sample_rows=100, workers=args.workers)
+        if stage == 'compressed':
+            graph.compress_graph()
+        return None, graph, table_names
+
+    cache = None if args.no_cache else SchemaCache(args.cache_dir)
+    parsed, graph = load_graph(args.sql_files, args.tables, args.workers or 1, cache, stage)
+    return parsed, graph, graph_table_names(parsed, args.tables)
+
+def main(argv=None):
+    cli = build_cli()
+    args = cli.parse_args(argv)
+    if not (args.profile or args.cprofile):
+        return run_command(cli, args)
+
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+    with instrument.instrumented() as recorder:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with instrument.stage('total'):
+                status = run_command(cli, args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+    if args.profile:
+        print(recorder.report(), file=sys.stderr)
+    if profiler is not None:
+        import pstats
+        profiler.dump_stats(args.cprofile)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+    return status
+
+def run_command(cli, args) -> int:
+    parsed, graph, table_names = load_cli_graph(args)
+    names = {index + 1: table_name for index, table_name in enumerate(table_names)}
+
+    if args.command == 'parse':
+        if parsed is None:
+            parsed = ({names[node.key]: node.columns for node in graph.nodes}, {}, {})
+        tables, primary_keys, foreign_keys = parsed
+        json.dump({'tables': tables, 'primary_keys': primary_keys, 'foreign_keys': foreign_keys}, sys.stdout, indent=2)
+        print()
+    elif args.command in ('build', 'compress'):
+        edges = graph.original_edges() if args.command == 'build' else None
+        with instrument.stage('export'):
+            export(graph, args.output, args.format, names, edges)
+    elif args.command == 'path':
+        keys = {table_name: key for key, table_name in names.items()}
+        nodes = {node.key: node for node in graph.nodes}
+        ends = []
+        for table_name in (args.src, args.dest):
+            node = nodes.get(keys.get(table_name.lower()))
+            if node is None:
+                cli.error(f"unknown table {table_name}")
+            ends.append(node)
+        with instrument.stage('find_path'):
+            path = graph.find_path(*ends)
+        if path is None:
+            print(f"no join path from {args.src} to {args.dest}")
+            return 1
+        plan = graph.path_joins(path)
+        print(names[path[0].key])
+        for _, far, columns in plan.joins:
+            print(f"  -[{', '.join(columns)}]- {names[far.key]}")
+    elif args.command == 'snapshot':
+        with instrument.stage('snapshot'):
+            write_snapshot(graph, args.output, names)
+    elif args.command == 'render':
+        options = {}
+        if args.scalable or (args.scalable is None and len(graph.nodes) > SCALABLE_RENDER_NODES):
+            layouts = None if args.no_cache else LayoutCache(args.cache_dir and os.path.join(args.cache_dir, 'layouts'))
+            options = {'originals_only': not args.all_edges, 'aggregate': not args.no_aggregate, 'layout_cache': layouts}
+        visualize(graph, args.output, names, args.scalable, **options)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import mmap
+import os
+import re
+from itertools import repeat
+
+import instrument
+from sqlparser import SQLParser
+
+# Byte-level counterparts of the SQLStatementSplitter patterns, used to find statement ends
+TOKEN_PATTERN = re.compile(rb"--|/\*|[;'\"$]")
+SPACE_PATTERN = re.compile(rb"\s*")
+BLOCK_PATTERN = re.compile(rb"/\*|\*/")
+DOLLAR_TAG_PATTERN = re.compile(rb"\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$")
+COPY_PATTERN = re.compile(rb"COPY\b.*\bFROM\s+stdin\b", re.I | re.S)
+COPY_END_PATTERN = re.compile(rb"\n\\\.\r?\n")
+
+# Read-only binary file object limited to bytes [start, end) of a file
+class FileRange:
+    def __init__(self, path, start: int, end: int):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+def statement_ends(view):
+    """Yield the offset just past each statement of view (bytes or mmap), in order.
+
+    A statement ends at a ';' outside quotes, dollar quotes and comments, as
+    in SQLStatementSplitter; a COPY ... FROM stdin statement ends after its
+    data's "\\." terminator line. Only positions are computed, so this
+    pre-scan is much cheaper than parsing.
+    """
+    pos, end = 0, len(view)
+    head = None  # offset of the current statement's first significant byte
+    while pos < end:
+        match = TOKEN_PATTERN.search(view, pos)
+        if match is None:
+            return
+        if head is None:
+            space = SPACE_PATTERN.match(view, pos, match.start()).end()
+            head = space if space < match.start() else None
+        token, pos = match.group(), match.start()
+
+        if token == b';':
+            pos += 1
+            if head is not None and COPY_PATTERN.match(view, head, pos):
+                terminator = COPY_END_PATTERN.search(view, pos)
+                pos = terminator.end() if terminator else end
+            head = None
+            yield pos
+        elif token == b'--':
+            index = view.find(b'\n', pos)
+            pos = end if index == -1 else index + 1
+        elif token == b'/*':
+            depth, pos = 1, pos + 2
+            while depth:
+                block = BLOCK_PATTERN.search(view, pos)
+                if block is None:
+                    return
+                depth += 1 if block.group() == b'/*' else -1
+                pos = block.end()
+        elif token == b'$':
+            head = pos if head is None else head
+            tag = DOLLAR_TAG_PATTERN.match(view, pos)
+            if tag is None:
+                pos += 1
+                continue
+            index = view.find(tag.group(), tag.end())
+            if index == -1:
+                return
+            pos = index + len(tag.group())
+        else:
+            head = pos if head is None else head
+            pos += 1
+            # A doubled quote character stands for itself inside the quotes
+            while True:
+                index = view.find(token, pos)
+                if index == -1:
+                    return
+                pos = index + 1
+                if view[pos:pos + 1] != token:
+                    break
+                pos += 1
+
+def split_shards(paths, shard_size: int) -> list[tuple[str, int, int]]:
+    """Split each file into (path, start, end) byte ranges of about shard_size, ending at statement ends.
+
+    Boundaries come from statement_ends, so no shard starts inside a quoted
+    literal, a dollar-quoted body, a comment or COPY data.
+    """
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if size <= shard_size:
+            shards.append((path, 0, size))
+            continue
+
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            start = 0
+            for end in statement_ends(view):
+                if end - start >= shard_size and end < size:
+                    shards.append((path, start, end))
+                    start = end
+            shards.append((path, start, size))
+    return shards
+
+def _parse_shard(shard: tuple[str, int, int], allowlist, chunk_size: int):
+    """Worker: parse one shard, returning picklable pieces for merge_shards."""
+    path, start, end = shard
+    source = FileRange(path, start, end)
+    try:
+        parser = SQLParser.from_file(source, chunk_size, allowlist)
+        alter_table_pks = parser._scan_statements()
+    finally:
+        source.close()
+    return dict(parser.tables), alter_table_pks, dict(parser.foreign_keys)
+
+def merge_shards(results, allowlist=None):
+    """Merge shard results in shard order into the tables, primary_keys, foreign_keys of a serial parse."""
+    parser = SQLParser(allowlist=allowlist)
+    alter_table_pks = []
+    for tables, shard_alter_table_pks, foreign_keys in results:
+        parser.tables.update(tables)
+        alter_table_pks.extend(shard_alter_table_pks)
+        for table_name, fks in foreign_keys.items():
+            parser.foreign_keys[table_name].extend(fks)
+
+    # Primary keys depend on the merged tables, so they are resolved here rather than in the workers
+    parser._parse_primary_keys()
+    for table_name, pk_columns in alter_table_pks:
+        parser._add_alter_table_primary_key(table_name, pk_columns)
+
+    return parser.tables, parser.primary_keys, parser.foreign_keys
+
+def parse_parallel(paths, workers: int | None = None, allowlist=None,
+                   shard_size: int = 64 << 20, chunk_size: int = 1 << 20):
+    """Parse one or more SQL files across a process pool.
+
+    Files are parsed in the given order, each split into statement-aligned
+    shards of about shard_size bytes. The result is identical to a serial
+    SQLParser.from_file parse of the files concatenated. workers=1 parses
+    in this process; None uses os.cpu_count() workers.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    with instrument.stage('parse'):
+        shards = split_shards(paths, shard_size)
+        if workers == 1 or len(shards) == 1:
+            results = [_parse_shard(shard, allowlist, chunk_size) for shard in shards]
+        else:
+            # Imported here: multiprocessing adds tens of milliseconds to the CLI's startup
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_parse_shard, shards, repeat(allowlist), repeat(chunk_size)))
+
+        return merge_shards(results, allowlist)
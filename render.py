@@ -0,0 +1,175 @@
+# Scalable drawing of large graphs: cached layouts, aggregated cliques and collection-based drawing.
+# Matplotlib is used without pyplot when writing to a file, so no display is needed.
+import hashlib
+import json
+import os
+import tempfile
+
+import instrument
+from csvgraph import CSVGraph
+from exporters import iter_edges
+from schemacache import default_cache_dir
+
+# Node labels are drawn only up to this many nodes
+LABEL_LIMIT = 200
+
+# Pull of the layout centre, relative to the spread of the nodes
+GRAVITY = 0.5
+
+def layout_key(graph: CSVGraph, originals_only: bool, seed: int) -> str:
+    """Hash of the nodes and of the edges a layout is computed from."""
+    edges = graph.original_edges() if originals_only else graph.edges
+    digest = hashlib.blake2b(f'{seed}:{originals_only}'.encode(), digest_size=16)
+    digest.update(repr(sorted(node.key for node in graph.nodes)).encode())
+    digest.update(repr(sorted((edge.left_v.key, edge.right_v.key) for edge in edges)).encode())
+    return digest.hexdigest()
+
+# Node positions stored as JSON files keyed by layout_key
+class LayoutCache:
+    def __init__(self, directory: str | None = None):
+        self.directory = directory or os.path.join(default_cache_dir(), 'layouts')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.json')
+
+    def load(self, key: str) -> dict[int, tuple[float, float]] | None:
+        try:
+            with open(self._path(key)) as file:
+                return {int(node_key): tuple(position) for node_key, position in json.load(file).items()}
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key: str, positions: dict[int, tuple[float, float]]):
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, delete=False) as file:
+            json.dump({node_key: list(position) for node_key, position in positions.items()}, file)
+        os.replace(file.name, self._path(key))
+
+def compute_layout(graph: CSVGraph, originals_only: bool = True, seed: int = 25,
+                   iterations: int = 50) -> dict[int, tuple[float, float]]:
+    """Fruchterman-Reingold layout of graph's nodes over its original edges (or all edges), in [-1, 1].
+
+    Vectorized with NumPy: repulsion is computed in row blocks of the
+    pairwise distance matrix so memory stays bounded for thousands of nodes.
+    """
+    with instrument.stage('layout'):
+        return _fruchterman_reingold(graph, originals_only, seed, iterations)
+
+def _fruchterman_reingold(graph: CSVGraph, originals_only: bool, seed: int, iterations: int):
+    import numpy as np
+
+    edges = graph.original_edges() if originals_only else graph.edges
+    pairs = [(edge.left_v.key, edge.right_v.key) for edge in edges]
+    keys = list(dict.fromkeys([node.key for node in graph.nodes] + [key for pair in pairs for key in pair]))
+    if not keys:
+        return {}
+    index = {key: position for position, key in enumerate(keys)}
+    ends = np.array([(index[left], index[right]) for left, right in pairs if left != right], dtype=np.intp)
+    ends = ends.reshape(-1, 2)
+
+    count = len(keys)
+    positions = np.random.default_rng(seed).random((count, 2))
+    k = 1 / np.sqrt(count)  # optimal distance between nodes
+    temperature = 0.1
+    gravity = GRAVITY * k * count
+    block = max(1, (1 << 21) // count)
+    for _ in range(iterations):
+        displacement = np.zeros((count, 2))
+        for start in range(0, count, block):
+            delta = positions[start:start + block, None, :] - positions[None, :, :]
+            distance2 = np.maximum((delta ** 2).sum(axis=2), 1e-6)
+            displacement[start:start + block] += (delta * (k * k / distance2)[:, :, None]).sum(axis=1)
+
+        delta = positions[ends[:, 0]] - positions[ends[:, 1]]
+        pull = delta * (np.sqrt((delta ** 2).sum(axis=1)) / k)[:, None]
+        np.subtract.at(displacement, ends[:, 0], pull)
+        np.add.at(displacement, ends[:, 1], pull)
+        # Gravity towards the centre keeps disconnected tables from drifting off
+        displacement -= (positions - positions.mean(axis=0)) * gravity
+
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 1e-9)
+        positions += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= 0.1 / (iterations + 1)
+
+    positions -= positions.mean(axis=0)
+    positions /= max(np.abs(positions).max(), 1e-9)
+    return {key: (float(x), float(y)) for key, (x, y) in zip(keys, positions)}
+
+def cached_layout(graph: CSVGraph, originals_only: bool = True, seed: int = 25,
+                  cache: LayoutCache | None = None) -> dict[int, tuple[float, float]]:
+    """compute_layout, reusing positions cached for an identical graph."""
+    if cache is None:
+        return compute_layout(graph, originals_only, seed)
+
+    key = layout_key(graph, originals_only, seed)
+    positions = cache.load(key)
+    if positions is None:
+        positions = compute_layout(graph, originals_only, seed)
+        cache.store(key, positions)
+    else:
+        instrument.count('layout_cache_hits')
+    return positions
+
+def _label_hubs(graph: CSVGraph, positions: dict):
+    """Yield (column label, hub position, member positions) for each compressed clique of 3+ nodes."""
+    for column_label in sorted(graph._extract_column_labels()):
+        components = graph._components.get(column_label) or graph._label_components(column_label)
+        for members in {id(members): members for members in components.values()}.values():
+            points = [positions[node.key] for node in members if node.key in positions]
+            if len(points) >= 3:
+                hub = (sum(x for x, _ in points) / len(points), sum(y for _, y in points) / len(points))
+                yield column_label, hub, points
+
+def render_graph(graph: CSVGraph, output=None, names: dict | None = None, originals_only: bool = True,
+                 aggregate: bool = True, layout_cache: LayoutCache | None = None, seed: int = 25):
+    """Draw graph with Matplotlib collections, to output (a .png/.svg/... path) or to a window.
+
+    The layout is computed from the original edges only unless
+    originals_only is False. With aggregate, each compressed clique (the
+    component of a column label) is drawn as a star around a labelled hub
+    instead of as all of its derived edges.
+    """
+    from matplotlib.collections import LineCollection
+
+    positions = cached_layout(graph, originals_only, seed, layout_cache)
+    if output is None:
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=(12, 12))
+    else:
+        from matplotlib.figure import Figure
+        figure = Figure(figsize=(12, 12))
+    axes = figure.add_subplot()
+
+    original, derived = [], []
+    for edge, is_derived in iter_edges(graph, graph.original_edges() if aggregate else None):
+        (derived if is_derived else original).append((positions[edge.left_v.key], positions[edge.right_v.key]))
+
+    hubs = list(_label_hubs(graph, positions)) if aggregate and graph._compression else []
+    for _, hub, points in hubs:
+        derived.extend((hub, point) for point in points)
+
+    axes.add_collection(LineCollection(derived, colors='tab:orange', linewidths=0.5, linestyles='dashed', alpha=0.4))
+    axes.add_collection(LineCollection(original, colors='gray', linewidths=1.5, alpha=0.7))
+
+    keys = [node.key for node in graph.nodes]
+    node_size = max(20, min(3000, 60000 / max(len(keys), 1)))
+    axes.scatter([positions[key][0] for key in keys], [positions[key][1] for key in keys],
+                 s=node_size, c='skyblue', edgecolors='black', zorder=3)
+    if hubs:
+        axes.scatter([hub[0] for _, hub, _ in hubs], [hub[1] for _, hub, _ in hubs],
+                     s=node_size / 3, c='tab:orange', marker='D', zorder=3)
+
+    if len(keys) <= LABEL_LIMIT:
+        for key in keys:
+            label = names.get(key, str(key)) if names else str(key)
+            axes.annotate(label, positions[key], ha='center', va='center', fontsize=8, zorder=4)
+        for column_label, hub, _ in hubs:
+            axes.annotate(column_label, hub, color='red', fontsize=7, ha='center', va='bottom', zorder=4)
+
+    axes.autoscale_view()
+    axes.set_axis_off()
+    axes.set_title("Graph Visualization")
+    if output is None:
+        plt.show()
+    else:
+        figure.savefig(output, bbox_inches='tight')
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+# Bump when the layout of cache entries changes
+FORMAT_VERSION = 1
+
+# Modules whose code determines the parsed schema and the graph built from it
+SOURCE_FILES = ('sqlparser.py', 'parallelparser.py', 'csvgraph.py', 'main.py')
+
+def default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'csvgraph')
+
+def code_version() -> str:
+    """Digest of the cache format and of the source of the modules producing cached data."""
+    digest = hashlib.blake2b(str(FORMAT_VERSION).encode(), digest_size=16)
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in SOURCE_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+# On-disk cache of parser output and compressed graphs, keyed by input content
+class SchemaCache:
+    def __init__(self, directory: str | None = None, max_bytes: int = 256 << 20):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, paths, allowlist=None) -> str:
+        """Hash of the files' contents, the allowlist (order included) and the code version."""
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+
+        digest = hashlib.blake2b(code_version().encode(), digest_size=20)
+        for path in paths:
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1 << 20), b''):
+                    digest.update(block)
+            digest.update(b'\0')
+        digest.update(repr(None if allowlist is None else [repr(entry) for entry in allowlist]).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pickle.z')
+
+    def load(self, key: str):
+        """Return the cached (parsed, graph) pair for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                entry = pickle.loads(zlib.decompress(file.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+
+        os.utime(path)  # mark as recently used for eviction
+        return entry
+
+    def store(self, key: str, parsed, graph):
+        """Write (parsed, graph) under key, then evict old entries beyond max_bytes."""
+        data = zlib.compress(pickle.dumps((parsed, graph), protocol=pickle.HIGHEST_PROTOCOL))
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as file:
+            file.write(data)
+        os.replace(file.name, self._path(key))
+        self.evict(keep=key)
+
+    def evict(self, keep: str | None = None):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle.z'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and name == os.path.basename(self._path(keep)):
+                continue
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,266 @@
+"""Long-running join graph query service over HTTP, on a TCP port or a Unix socket.
+
+The schema is parsed and compressed once, and the path and reachability
+indexes are kept warm between requests. The schema file is watched and
+re-applied incrementally when it changes.
+
+    python service.py postgres_setup.sql --port 8765
+    curl 'localhost:8765/path?src=nibrs_victim&dest=nibrs_weapon'
+    curl --unix-socket /tmp/csvgraph.sock 'http://localhost/neighbors?table=nibrs_victim&depth=2'
+
+Endpoints (GET with query parameters, or POST with a JSON object body):
+    /path?src=&dest=                 shortest join path and the columns of each join
+    /reach?src=&dest=[&column=]      whether src and dest are joinable (through column only)
+    /neighbors?table=[&depth=1]      tables within depth joins of table
+    /health                          schema generation and graph size
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from incremental import IncrementalSchema, patch_graph
+from main import create_graph, filtered, graph_table_names, parse_allowlist
+
+# Graphs up to this many tables get an all-pairs path matrix when (re)loaded
+MATRIX_NODES = 2000
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+# Preloaded graph answering queries on one thread, so its caches are never mutated concurrently
+class GraphService:
+    def __init__(self, schema_path: str, allowlist=None, poll_interval: float = 1.0, matrix_nodes: int = MATRIX_NODES):
+        self.schema_path = schema_path
+        self.allowlist = allowlist
+        self.poll_interval = poll_interval
+        self.matrix_nodes = matrix_nodes
+        self.generation = 0  # bumped by every reload that changed the schema
+        self.schema = IncrementalSchema(allowlist if allowlist is not None else filtered)
+        self.graph = None
+        self.table_names: list[str] = []
+        self._keys: dict[str, int] = {}
+        self._names: dict[int, str] = {}
+        self._nodes: dict = {}
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='csvgraph-query')
+        self._reload_lock = asyncio.Lock()
+        self._stamp = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.schema_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """Parse the schema, build and compress the graph and warm its indexes."""
+        self._stamp = self._file_stamp()
+        self.schema.update(self.schema_path)
+        self.table_names = list(graph_table_names(self.schema.parsed, self.allowlist))
+        tables, _, foreign_keys = self.schema.parsed
+        self.graph = create_graph(tables, foreign_keys, self.table_names)
+        self.graph.compress_graph(incremental=True)
+        self._index_tables()
+        self._warm()
+
+    def _index_tables(self):
+        self._names = dict(enumerate(self.table_names, 1))
+        self._keys = {table_name: key for key, table_name in self._names.items()}
+        self._nodes = {node.key: node for node in self.graph.nodes}
+
+    def _warm(self):
+        """Build the indexes queries are answered from, so the first requests do not pay for them."""
+        self.graph._reachability_index(None)
+        if len(self.graph.nodes) <= self.matrix_nodes:
+            self.graph._all_pairs()
+
+    def _patch(self, diff):
+        """Apply a schema diff to the graph; runs on the query thread, between queries."""
+        if self.allowlist is not None:
+            # Keys must stay stable: new tables are appended, removed ones keep their slot
+            known = set(self.table_names)
+            self.table_names += [name.lower() for name in self.schema.parsed[0] if name.lower() not in known]
+        patch_graph(self.graph, diff, self.schema.parsed, self.table_names)
+        self._index_tables()
+        self._warm()
+
+    async def reload(self):
+        """Re-read the schema file and apply what changed, returning the SchemaDiff.
+
+        Parsing runs in a worker thread while queries are still answered from
+        the current graph; the patch is then queued on the query thread, so
+        no request is dropped or sees a half-patched graph.
+        """
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            self._stamp = self._file_stamp()
+            diff = await loop.run_in_executor(None, self.schema.update, self.schema_path)
+            if diff:
+                await loop.run_in_executor(self._executor, self._patch, diff)
+                self.generation += 1
+            return diff
+
+    async def watch(self):
+        """Reload whenever the schema file's modification time or size changes."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            stamp = self._file_stamp()
+            if stamp is None or stamp == self._stamp:
+                continue
+            try:
+                diff = await self.reload()
+            except Exception as error:  # keep serving the last good graph
+                print(f"reload of {self.schema_path} failed: {error!r}", file=sys.stderr)
+            else:
+                if diff:
+                    print(f"reloaded {self.schema_path}: {diff}", file=sys.stderr)
+
+    def _node(self, table_name: str):
+        node = self._nodes.get(self._keys.get(table_name.lower()))
+        if node is None:
+            raise LookupError(f"unknown table {table_name}")
+        return node
+
+    def _run(self, command: str, params: dict) -> dict:
+        """Answer one query from the current graph; runs on the query thread."""
+        names = self._names
+        if command == 'path':
+            src, dest = self._node(params['src']), self._node(params['dest'])
+            path = self.graph.find_path(src, dest)
+            if path is None:
+                return {'path': None, 'joins': []}
+            joins = self.graph.path_joins(path).joins
+            return {'path': [names[node.key] for node in path],
+                    'joins': [{'from': names[near.key], 'to': names[far.key], 'columns': columns}
+                              for near, far, columns in joins]}
+        if command == 'reach':
+            src, dest = self._node(params['src']), self._node(params['dest'])
+            return {'reachable': self.graph.can_reach(src, dest, params.get('column') or None)}
+        if command == 'neighbors':
+            node, depth = self._node(params['table']), int(params.get('depth', 1))
+            tree = self.graph.bfs_tree(node)
+            neighbors = sorted((hops, names[key], names[parent]) for key, (_, parent, hops) in tree.items()
+                               if 0 < hops <= depth)
+            return {'table': names[node.key], 'neighbors': [{'table': table_name, 'distance': hops, 'via': via}
+                                                            for hops, table_name, via in neighbors]}
+        if command == 'health':
+            return {'generation': self.generation, 'tables': len(self.graph.nodes),
+                    'edges': len(list(self.graph.original_edges()))}
+        raise LookupError(f"unknown query {command}")
+
+    async def query(self, command: str, params: dict) -> dict:
+        """Answer a query on the query thread; identical queries in flight share one answer."""
+        key = (self.generation, command, tuple(sorted(params.items())))
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = asyncio.ensure_future(loop.run_in_executor(self._executor, self._run, command, params))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def respond(self, method: str, target: str, body: bytes) -> tuple[int, dict]:
+        """(HTTP status, JSON payload) for a request."""
+        if method not in ('GET', 'POST'):
+            return 405, {'error': f"method {method} not allowed"}
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        try:
+            if body:
+                data = json.loads(body)
+                if not isinstance(data, dict):
+                    raise ValueError("the request body must be a JSON object")
+                params.update(data)
+            return 200, await self.query(url.path.strip('/'), {key: str(value) for key, value in params.items()})
+        except KeyError as error:
+            return 400, {'error': f"missing parameter {error.args[0]}"}
+        except LookupError as error:
+            return 404, {'error': error.args[0] if error.args else str(error)}
+        except ValueError as error:
+            return 400, {'error': str(error)}
+        except Exception as error:
+            return 500, {'error': repr(error)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one connection, keeping it open between requests."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                except ValueError:
+                    status, payload, version = 400, {'error': "malformed request"}, 'HTTP/1.0'
+                else:
+                    status, payload = await self.respond(method, target, body)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload).encode()
+                head = [f"HTTP/1.1 {status} {REASONS[status]}", "Content-Type: application/json",
+                        f"Content-Length: {len(data)}"]
+                if not keep_alive:
+                    head.append("Connection: close")
+                writer.write('\r\n'.join(head + ['', '']).encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765, unix_socket: str | None = None):
+        """Start listening (on unix_socket if given, else on host:port) and return the asyncio server."""
+        if unix_socket is not None:
+            return await asyncio.start_unix_server(self.handle_connection, unix_socket)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+async def serve(service: GraphService, host: str = '127.0.0.1', port: int = 8765, unix_socket: str | None = None):
+    """Load service's graph, then answer requests and watch the schema until cancelled."""
+    await asyncio.get_running_loop().run_in_executor(service._executor, service.load)
+    server = await service.start(host, port, unix_socket)
+    address = unix_socket or '%s:%d' % server.sockets[0].getsockname()[:2]
+    print(f"serving {len(service.graph.nodes)} tables from {service.schema_path} on {address}", file=sys.stderr)
+    watcher = asyncio.create_task(service.watch())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+        service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sql_file', nargs='?', default='postgres_setup.sql', help="schema dump to serve and watch")
+    parser.add_argument('--tables', type=parse_allowlist, help="tables to keep (as in main.py; default: the nibrs subset)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', help="listen on this Unix socket path instead of a TCP port")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="seconds between schema file checks")
+    args = parser.parse_args()
+
+    service = GraphService(args.sql_file, args.tables, args.poll_interval)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# Versioned binary snapshots of a CSVGraph, read through mmap without unpickling.
+# A snapshot stores the original edges and, per column label, the component of every
+# node; compressed (derived or virtual) edges are implied by the components, as in
+# lazy compression. Every section is a flat array, so GraphSnapshot answers queries
+# straight from the mapped file and only builds CSVNode/CSVEdge objects on access.
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+
+from csvgraph import CSVNode, CSVEdge, CSVGraph, DisjointSet, JoinTree
+
+MAGIC = b'CSVGSNAP'
+
+# Bump when the layout of any section changes; readers reject other versions
+FORMAT_VERSION = 1
+
+NONE = 0xFFFFFFFF  # absent string id, component or node position
+
+# Flat arrays after the header, in file order, as (name, array typecode)
+SECTIONS = (
+    ('string_offsets', 'I'),      # string id -> start in strings; string_count + 1 entries
+    ('strings', 'B'),             # UTF-8 table and column names
+    ('node_keys', 'q'),           # node position -> key
+    ('node_names', 'I'),          # node position -> string id of its table name, or NONE
+    ('node_column_offsets', 'I'),  # node position -> start in node_columns; node_count + 1 entries
+    ('node_columns', 'I'),        # string ids
+    ('sorted_keys', 'q'),         # node keys in ascending order, for bisection
+    ('sorted_positions', 'I'),    # node position of each sorted_keys entry
+    ('edges', 'I'),               # 4 per original edge: left position, right position, column start, count
+    ('edge_columns', 'I'),        # string ids
+    ('adjacency_offsets', 'I'),   # node position -> start in adjacency; node_count + 1 entries
+    ('adjacency', 'I'),           # incident edge indexes per node
+    ('node_label_offsets', 'I'),  # node position -> start in node_labels; node_count + 1 entries
+    ('node_labels', 'I'),         # label indexes whose components contain the node
+    ('labels', 'B'),              # LABEL entries; the last one is the any-column label
+)
+
+# Header: magic, version, byte order (0 little, 1 big), compression (0 none, 1 eager, 2 lazy),
+# flags (1: incremental), node, listed node, edge, string and label counts
+HEADER = struct.Struct('=8sHBBIIIIII')
+SECTION = struct.Struct('=QQ')  # offset and byte length of each of SECTIONS
+# Label: string id (NONE for the any-column label), component count, then the offset and byte
+# length of three arrays: node position -> component id (or NONE), component -> start in
+# members (component count + 1 entries), and the members' node positions
+LABEL = struct.Struct('=II6Q')
+
+COMPRESSION = {None: 0, 'eager': 1, 'lazy': 2}
+
+def _aligned(size: int) -> int:
+    return -size % 8
+
+def write_snapshot(graph: CSVGraph, path: str, names: dict | None = None):
+    """Write graph (and optional node key -> table name) as a snapshot file at path."""
+    listed = list(graph.nodes)
+    listed_keys = {node.key for node in listed}
+    nodes = listed + [node for key, node in graph._node_index.items() if key not in listed_keys]
+    positions: dict[int, int] = {}
+    for position, node in enumerate(nodes):
+        positions.setdefault(node.key, position)
+
+    strings: dict[str, int] = {}
+    intern = lambda value: strings.setdefault(value, len(strings))
+    arrays = {name: array(typecode) for name, typecode in SECTIONS}
+
+    arrays['node_keys'].extend(node.key for node in nodes)
+    for node in nodes:
+        name = names.get(node.key) if names else None
+        arrays['node_names'].append(NONE if name is None else intern(name))
+        arrays['node_column_offsets'].append(len(arrays['node_columns']))
+        arrays['node_columns'].extend(intern(column) for column in node.columns)
+    arrays['node_column_offsets'].append(len(arrays['node_columns']))
+
+    order = sorted(range(len(nodes)), key=lambda position: nodes[position].key)
+    arrays['sorted_keys'].extend(nodes[position].key for position in order)
+    arrays['sorted_positions'].extend(order)
+
+    originals = list(graph.original_edges())
+    incident: list[list[int]] = [[] for _ in nodes]
+    for index, edge in enumerate(originals):
+        left, right = positions[edge.left_v.key], positions[edge.right_v.key]
+        arrays['edges'].extend((left, right, len(arrays['edge_columns']), len(edge.column)))
+        arrays['edge_columns'].extend(intern(column) for column in edge.column)
+        incident[left].append(index)
+        if right != left:
+            incident[right].append(index)
+    for edge_indexes in incident:
+        arrays['adjacency_offsets'].append(len(arrays['adjacency']))
+        arrays['adjacency'].extend(edge_indexes)
+    arrays['adjacency_offsets'].append(len(arrays['adjacency']))
+
+    # Components per label (as kept by compression, when compressed), then over every column;
+    # original edges connect the same nodes as all edges
+    components = [(intern(label), graph._components.get(label) or graph._label_components(label))
+                  for label in sorted(graph._extract_column_labels())]
+    everything = DisjointSet()
+    for edge in originals:
+        everything.union(edge.left_v.key, edge.right_v.key)
+    roots: dict = {}
+    for key in everything.parent:
+        roots.setdefault(everything.find(key), []).append(graph._node_index[key])
+    components.append((NONE, {key: roots[everything.find(key)] for key in everything.parent}))
+
+    node_labels: list[list[int]] = [[] for _ in nodes]
+    label_sections = []
+    for label_index, (string_id, members_of) in enumerate(components):
+        component_ids, member_offsets, members = array('I', [NONE]) * len(nodes), array('I'), array('I')
+        for component in {id(component): component for component in members_of.values()}.values():
+            member_offsets.append(len(members))
+            for member in component:
+                position = positions[member.key]
+                component_ids[position] = len(member_offsets) - 1
+                members.append(position)
+                if string_id != NONE:
+                    node_labels[position].append(label_index)
+        member_offsets.append(len(members))
+        label_sections.append((string_id, len(member_offsets) - 1, (component_ids, member_offsets, members)))
+    for label_indexes in node_labels:
+        arrays['node_label_offsets'].append(len(arrays['node_labels']))
+        arrays['node_labels'].extend(label_indexes)
+    arrays['node_label_offsets'].append(len(arrays['node_labels']))
+
+    for value in strings:
+        arrays['string_offsets'].append(len(arrays['strings']))
+        arrays['strings'].frombytes(value.encode())
+    arrays['string_offsets'].append(len(arrays['strings']))
+
+    # Lay out the fixed sections, then each label's arrays, every one 8-byte aligned
+    blobs = [arrays[name].tobytes() for name, _ in SECTIONS[:-1]] + [bytes(LABEL.size * len(label_sections))]
+    blobs += [section.tobytes() for _, _, sections in label_sections for section in sections]
+    offsets, offset = [], HEADER.size + SECTION.size * len(SECTIONS)
+    for blob in blobs:
+        offset += _aligned(offset)
+        offsets.append(offset)
+        offset += len(blob)
+
+    label_blobs = iter(zip(offsets[len(SECTIONS):], blobs[len(SECTIONS):]))
+    entries = bytearray()
+    for string_id, count, _ in label_sections:
+        ranges = []
+        for _ in range(3):
+            start, blob = next(label_blobs)
+            ranges += (start, len(blob))
+        entries += LABEL.pack(string_id, count, *ranges)
+    blobs[len(SECTIONS) - 1] = bytes(entries)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, sys.byteorder == 'big', COMPRESSION[graph._compression],
+                         1 if graph.incremental else 0, len(nodes), len(listed), len(arrays['edges']) // 4,
+                         len(strings), len(label_sections))
+
+    # Replaced atomically: processes may have the previous snapshot mapped
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        file.write(header)
+        file.write(b''.join(SECTION.pack(start, len(blob)) for start, blob in zip(offsets, blobs[:len(SECTIONS)])))
+        for start, blob in zip(offsets, blobs):
+            file.write(bytes(start - file.tell()))
+            file.write(blob)
+    os.replace(file.name, path)
+
+# Sequence of a snapshot's nodes, each built on first access
+class SnapshotNodes(Sequence):
+    def __init__(self, snapshot: "GraphSnapshot", count: int):
+        self.snapshot = snapshot
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.snapshot._node(position) for position in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("node index out of range")
+        return self.snapshot._node(index)
+
+# Read-only graph served from a memory-mapped snapshot file
+class GraphSnapshot:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = [memoryview(self._map)]
+        self._string_objects: dict[int, str] = {}
+        try:
+            self._read_sections()
+        except Exception:
+            self.close()
+            raise
+
+        self._node_objects: list[CSVNode | None] = [None] * self.node_count
+        self._edge_objects: dict[int, CSVEdge] = {}
+        self._name_positions: dict[str, int] | None = None
+        self.nodes = SnapshotNodes(self, self.listed_count)
+
+    def _read_sections(self):
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{self.path} is not a graph snapshot")
+        (magic, version, big_endian, compression, flags, self.node_count, self.listed_count,
+         self.edge_count, _, label_count) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a graph snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has snapshot format version {version}, expected {FORMAT_VERSION}")
+        if big_endian != (sys.byteorder == 'big'):
+            raise ValueError(f"{self.path} was written on a machine with the other byte order")
+        self._compression = {value: mode for mode, value in COMPRESSION.items()}[compression]
+        self.incremental = bool(flags & 1)
+
+        for index, (name, typecode) in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(self._map, HEADER.size + index * SECTION.size)
+            setattr(self, '_' + name, self._view(offset, length, typecode))
+
+        self._label_arrays: list[tuple] = []  # label index -> (component ids, member offsets, members)
+        self._label_indexes: dict[str | None, int] = {None: label_count - 1}
+        for index in range(label_count):
+            string_id, _, *ranges = LABEL.unpack_from(self._labels, index * LABEL.size)
+            self._label_arrays.append(tuple(self._view(ranges[start], ranges[start + 1], 'I') for start in (0, 2, 4)))
+            if string_id != NONE:
+                self._label_indexes[self._string(string_id)] = index
+
+    def _view(self, offset: int, length: int, typecode: str) -> memoryview:
+        view = self._views[0][offset:offset + length].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        """Release the mapping; nodes and edges already built stay usable."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._map.close()
+
+    def __enter__(self) -> "GraphSnapshot":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _string(self, string_id: int) -> str:
+        value = self._string_objects.get(string_id)
+        if value is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            value = self._string_objects[string_id] = bytes(self._strings[start:end]).decode()
+        return value
+
+    def _node(self, position: int) -> CSVNode:
+        node = self._node_objects[position]
+        if node is None:
+            start, end = self._node_column_offsets[position], self._node_column_offsets[position + 1]
+            columns = [self._string(string_id) for string_id in self._node_columns[start:end]]
+            node = self._node_objects[position] = CSVNode(self._node_keys[position], columns)
+        return node
+
+    def _edge(self, index: int) -> CSVEdge:
+        edge = self._edge_objects.get(index)
+        if edge is None:
+            left, right, start, count = self._edges[4 * index:4 * index + 4]
+            columns = [self._string(string_id) for string_id in self._edge_columns[start:start + count]]
+            edge = self._edge_objects[index] = CSVEdge(self._node(left), self._node(right), columns)
+        return edge
+
+    def _position(self, key: int) -> int | None:
+        index = bisect_left(self._sorted_keys, key)
+        if index < len(self._sorted_keys) and self._sorted_keys[index] == key:
+            return self._sorted_positions[index]
+        return None
+
+    def node(self, key: int) -> CSVNode | None:
+        """The node with key, or None."""
+        position = self._position(key)
+        return None if position is None else self._node(position)
+
+    def name(self, node: CSVNode) -> str | None:
+        """Table name stored for node, if names were given to write_snapshot."""
+        position = self._position(node.key)
+        string_id = NONE if position is None else self._node_names[position]
+        return None if string_id == NONE else self._string(string_id)
+
+    def find_node(self, table_name: str) -> CSVNode | None:
+        """The node stored under table_name (case-insensitive), or None."""
+        if self._name_positions is None:
+            self._name_positions = {}
+            for position, string_id in enumerate(self._node_names):
+                if string_id != NONE:
+                    self._name_positions.setdefault(self._string(string_id).lower(), position)
+        position = self._name_positions.get(table_name.lower())
+        return None if position is None else self._node(position)
+
+    def original_edges(self):
+        """Yield the stored (uncompressed) edges."""
+        for index in range(self.edge_count):
+            yield self._edge(index)
+
+    def _neighbor_positions(self, position: int, expanded: set | None = None):
+        """Yield positions adjacent to position through stored or compressed edges (and possibly itself).
+
+        Components whose (label index, component) pair is in expanded are
+        skipped and newly yielded ones added: a BFS reaches all members of a
+        component the first time it expands one.
+        """
+        for index in self._adjacency[self._adjacency_offsets[position]:self._adjacency_offsets[position + 1]]:
+            left, right = self._edges[4 * index], self._edges[4 * index + 1]
+            yield right if left == position else left
+
+        if self._compression is None:
+            return
+        for label in self._node_labels[self._node_label_offsets[position]:self._node_label_offsets[position + 1]]:
+            component_ids, member_offsets, members = self._label_arrays[label]
+            component = component_ids[position]
+            if expanded is not None:
+                if (label, component) in expanded:
+                    continue
+                expanded.add((label, component))
+            yield from members[member_offsets[component]:member_offsets[component + 1]]
+
+    def _same_component(self, a: int, b: int, label: int) -> bool:
+        component_ids = self._label_arrays[label][0]
+        return component_ids[a] != NONE and component_ids[a] == component_ids[b]
+
+    def find_path(self, src: CSVNode, dest: CSVNode):
+        """Shortest path (fewest hops) from src to dest as a list of nodes, or None."""
+        if src.key == dest.key:
+            return [src]
+        start, goal = self._position(src.key), self._position(dest.key)
+        if start is None or goal is None or not self._same_component(start, goal, self._label_indexes[None]):
+            return None
+
+        parents = {start: None}
+        frontier, expanded = [start], set()
+        while frontier:
+            next_frontier = []
+            for current in frontier:
+                for neighbor in self._neighbor_positions(current, expanded):
+                    if neighbor in parents:
+                        continue
+                    parents[neighbor] = current
+                    if neighbor == goal:
+                        path = []
+                        while neighbor is not None:
+                            path.append(self._node(neighbor))
+                            neighbor = parents[neighbor]
+                        return path[::-1]
+                    next_frontier.append(neighbor)
+            frontier = next_frontier
+        return None
+
+    def distance(self, a: CSVNode, b: CSVNode) -> int | None:
+        """Fewest hops between a and b, or None if they are not connected."""
+        path = self.find_path(a, b)
+        return None if path is None else len(path) - 1
+
+    def can_reach(self, a: CSVNode, b: CSVNode, column_label: str | None = None) -> bool:
+        """Whether a path joins a and b using only edges on column_label (any edges if None)."""
+        if a.key == b.key:
+            return True
+        label = self._label_indexes.get(column_label)
+        first, second = self._position(a.key), self._position(b.key)
+        return label is not None and first is not None and second is not None and \
+            self._same_component(first, second, label)
+
+    def reachable_set(self, a: CSVNode, column_label: str | None = None) -> set[CSVNode]:
+        """Nodes reachable from a (a included) using only edges on column_label (any edges if None)."""
+        label, position = self._label_indexes.get(column_label), self._position(a.key)
+        if label is None or position is None:
+            return {a}
+        component_ids, member_offsets, members = self._label_arrays[label]
+        component = component_ids[position]
+        if component == NONE:
+            return {a}
+        return {self._node(member) for member in members[member_offsets[component]:member_offsets[component + 1]]}
+
+    def join_columns(self, a: CSVNode, b: CSVNode) -> list[str]:
+        """Column labels of the stored or compressed edges joining a and b."""
+        first, second = self._position(a.key), self._position(b.key)
+        if first is None or second is None:
+            return []
+        columns = {}
+        for index in self._adjacency[self._adjacency_offsets[first]:self._adjacency_offsets[first + 1]]:
+            if {self._edges[4 * index], self._edges[4 * index + 1]} == {first, second}:
+                columns.update(dict.fromkeys(self._edge(index).column))
+        if self._compression is not None and first != second:
+            start, end = self._node_label_offsets[first], self._node_label_offsets[first + 1]
+            for label_name, label in self._label_indexes.items():
+                if label_name is not None and label in self._node_labels[start:end] and \
+                        self._same_component(first, second, label):
+                    columns[label_name] = None
+        return list(columns)
+
+    def has_direct_edge(self, a: CSVNode, b: CSVNode, column_label: str) -> bool:
+        """Whether a stored or compressed edge on column_label joins a and b."""
+        return column_label in self.join_columns(a, b)
+
+    def path_joins(self, path: list[CSVNode]) -> JoinTree:
+        """JoinTree following path, as returned by find_path, hop by hop."""
+        return JoinTree(list(path), [(near, far, self.join_columns(near, far)) for near, far in zip(path, path[1:])])
+
+    def to_graph(self) -> CSVGraph:
+        """Build the full CSVGraph (compressed as when written), materializing every node and edge."""
+        graph = CSVGraph(list(self.nodes))
+        for edge in self.original_edges():
+            graph.add_edge(edge)
+        if self._compression is not None:
+            graph.compress_graph(lazy=self._compression == 'lazy', incremental=self.incremental)
+        return graph
@@ -1,16 +1,268 @@
+import codecs
+import fnmatch
+import mmap
+import os
 import re
 from collections import defaultdict
 
+import instrument
+
+def iter_sql_chunks(source, chunk_size: int = 1 << 20, encoding: str = 'utf-8'):
+    """Yield decoded text chunks from a file path (through mmap) or a text/binary file object."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+                for offset in range(0, len(view), chunk_size):
+                    yield decoder.decode(view[offset:offset + chunk_size])
+                yield decoder.decode(b'', final=True)
+        return
+
+    decoder = None
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            decoder = decoder or codecs.getincrementaldecoder(encoding)(errors='replace')
+            chunk = decoder.decode(chunk)
+        yield chunk
+    if decoder is not None:
+        yield decoder.decode(b'', final=True)
+
+class SQLStatementSplitter:
+    """Incrementally split SQL text into ';'-terminated statements.
+
+    Quotes, dollar quotes and (nested) block comments are tracked so that a
+    ';' inside them does not end a statement, and the data of COPY ... FROM
+    stdin blocks is skipped. Text before a statement's first significant
+    character is dropped. keep(head) is called with the statement's first
+    HEAD_SIZE significant characters; statements it rejects are not
+    buffered, which keeps memory bounded by the size of kept statements.
+    """
+    HEAD_SIZE = 128
+
+    _normal_pattern = re.compile(r"--|/\*|[;'\"$]")
+    _block_pattern = re.compile(r"/\*|\*/")
+    _dollar_tag_pattern = re.compile(r"\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$")
+    _dollar_prefix_pattern = re.compile(r"\$[A-Za-z_0-9]*")
+    _copy_pattern = re.compile(r"COPY\b.*\bFROM\s+stdin\b", re.I | re.S)
+    _copy_end_pattern = re.compile(r"\n\\\.\r?\n")
+    _copy_final_end_pattern = re.compile(r"\n\\\.\s*\Z")
+
+    def __init__(self, keep=None):
+        self.keep = keep
+        self._buffer = ''
+        self._state = 'normal'  # normal, quote, comment, block, dollar or copy
+        self._delimiter = ''  # closing quote character or dollar tag
+        self._depth = 0  # block comment nesting
+        self._reset_statement()
+
+    def _reset_statement(self):
+        self._started = False
+        self._keep = None  # undecided until HEAD_SIZE significant characters are seen
+        self._copy = False
+        self._head = ''
+        self._parts = []
+
+    def _decide(self):
+        self._copy = self._head[:4].upper() == 'COPY'
+        self._keep = self._copy or self.keep is None or self.keep(self._head)
+        if not self._keep:
+            self._parts = []
+
+    def _consume(self, text: str, significant: bool = True):
+        if not self._started:
+            if not significant:
+                return
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+
+        if self._keep is False:
+            return
+        self._parts.append(text)
+        if self._keep is None and significant:
+            self._head += text
+            if len(self._head) >= self.HEAD_SIZE:
+                self._decide()
+
+    def _end_statement(self, statements: list[str]):
+        if self._started:
+            if self._keep is None:
+                self._decide()
+            if self._keep:
+                statement = ''.join(self._parts)
+                if self._copy and self._copy_pattern.match(statement):
+                    self._state = 'copy'
+                if self.keep is None or self.keep(self._head):
+                    statements.append(statement)
+        self._reset_statement()
+
+    def feed(self, chunk: str) -> list[str]:
+        """Add text and return the statements it completes."""
+        self._buffer += chunk
+        return self._scan(final=False)
+
+    def close(self) -> list[str]:
+        """Flush remaining text, returning a final unterminated statement if any."""
+        statements = self._scan(final=True)
+        self._end_statement(statements)
+        return statements
+
+    def _scan(self, final: bool) -> list[str]:
+        statements = []
+        buffer, pos, end = self._buffer, 0, len(self._buffer)
+
+        while pos < end:
+            state = self._state
+            if state == 'normal':
+                match = self._normal_pattern.search(buffer, pos)
+                if match is None:
+                    # Hold back a trailing '-' or '/' that may open a comment
+                    stop = end - 1 if not final and buffer[-1] in '-/' else end
+                    self._consume(buffer[pos:stop])
+                    pos = stop
+                    break
+
+                self._consume(buffer[pos:match.start()])
+                token, pos = match.group(), match.start()
+                if token == ';':
+                    self._consume(';')
+                    self._end_statement(statements)
+                    pos += 1
+                elif token in '\'"':
+                    self._state, self._delimiter = 'quote', token
+                    self._consume(token)
+                    pos += 1
+                elif token == '--':
+                    self._state = 'comment'
+                    self._consume(token, significant=False)
+                    pos += 2
+                elif token == '/*':
+                    self._state, self._depth = 'block', 1
+                    self._consume(token, significant=False)
+                    pos += 2
+                else:
+                    tag = self._dollar_tag_pattern.match(buffer, pos)
+                    if tag is not None:
+                        self._state, self._delimiter = 'dollar', tag.group()
+                        self._consume(tag.group())
+                        pos = tag.end()
+                    elif not final and self._dollar_prefix_pattern.match(buffer, pos).end() == end:
+                        break  # the tag may continue in the next chunk
+                    else:
+                        self._consume('$')
+                        pos += 1
+
+            elif state == 'quote':
+                index = buffer.find(self._delimiter, pos)
+                if index == -1:
+                    self._consume(buffer[pos:])
+                    pos = end
+                elif index + 1 == end and not final:
+                    # Cannot tell a closing quote from a doubled one yet
+                    self._consume(buffer[pos:index])
+                    pos = index
+                    break
+                elif buffer.startswith(self._delimiter, index + 1):
+                    self._consume(buffer[pos:index + 2])
+                    pos = index + 2
+                else:
+                    self._consume(buffer[pos:index + 1])
+                    self._state, pos = 'normal', index + 1
+
+            elif state == 'comment':
+                index = buffer.find('\n', pos)
+                stop = end if index == -1 else index + 1
+                self._consume(buffer[pos:stop], significant=False)
+                pos = stop
+                if index != -1:
+                    self._state = 'normal'
+
+            elif state == 'block':
+                match = self._block_pattern.search(buffer, pos)
+                if match is None:
+                    stop = end - 1 if not final and buffer[-1] in '/*' else end
+                    self._consume(buffer[pos:stop], significant=False)
+                    pos = stop
+                    break
+                self._consume(buffer[pos:match.end()], significant=False)
+                self._depth += 1 if match.group() == '/*' else -1
+                pos = match.end()
+                if self._depth == 0:
+                    self._state = 'normal'
+
+            elif state == 'dollar':
+                index = buffer.find(self._delimiter, pos)
+                if index == -1:
+                    stop = end if final else max(pos, end - len(self._delimiter) + 1)
+                    self._consume(buffer[pos:stop])
+                    pos = stop
+                    break
+                stop = index + len(self._delimiter)
+                self._consume(buffer[pos:stop])
+                self._state, pos = 'normal', stop
+
+            else:  # copy: skip data rows up to the "\." terminator line
+                match = self._copy_end_pattern.search(buffer, pos)
+                if match is None and final:
+                    match = self._copy_final_end_pattern.search(buffer, pos)
+                if match is None:
+                    pos = end if final else max(pos, end - 3)
+                    break
+                self._state, pos = 'normal', match.end()
+
+        self._buffer = buffer[pos:]
+        return statements
+
+class TableAllowlist:
+    """Case-insensitive table filter built from exact names, glob patterns and compiled regexes."""
+
+    def __init__(self, patterns):
+        self.names: set[str] = set()
+        regexes = []
+        for pattern in patterns:
+            if isinstance(pattern, re.Pattern):
+                regexes.append(pattern.pattern)
+            elif any(char in pattern for char in '*?['):
+                regexes.append(fnmatch.translate(pattern))
+            else:
+                self.names.add(pattern.lower())
+        self.pattern = re.compile('|'.join(f'(?:{regex})' for regex in regexes), re.I) if regexes else None
+
+    def __contains__(self, table_name: str) -> bool:
+        if table_name.lower() in self.names:
+            return True
+        return self.pattern is not None and self.pattern.fullmatch(table_name) is not None
+
 class SQLParser:
-    def __init__(self, sql_content):
+    def __init__(self, sql_content: str = '', allowlist=None):
         self.sql_content = sql_content
+        self.source = None  # file path or file object read by the streaming mode
+        self.chunk_size = 1 << 20
+        # Tables outside the allowlist are skipped before their columns and constraints are read
+        self.allowlist = TableAllowlist(allowlist) if allowlist is not None else None
         self.tables = defaultdict() 
         self.primary_keys = defaultdict(list)
         self.foreign_keys = defaultdict(list)
         self._compile_patterns()
 
+    @classmethod
+    def from_file(cls, source, chunk_size: int = 1 << 20, allowlist=None) -> "SQLParser":
+        """Parser that streams source (a path or file object) statement by statement."""
+        parser = cls(allowlist=allowlist)
+        parser.source = source
+        parser.chunk_size = chunk_size
+        return parser
+
     def _compile_patterns(self):
         self.create_table_pattern = re.compile(r'CREATE TABLE (\w+)\s*\((.*?)\);', re.S)
+        self.create_table_header_pattern = re.compile(r'CREATE TABLE (\w+)\s*\(')
+        self.statement_table_pattern = re.compile(r'(?:CREATE TABLE|ALTER TABLE ONLY)\s+(?:PUBLIC\.)?(\S+?)(?=[\s(])')
         self.primary_key_pattern = re.compile(r'PRIMARY KEY\s*\((.*?)\)', re.S)
         self.alter_table_pk_pattern = re.compile(
             r"ALTER TABLE ONLY\s+(?:PUBLIC\.)?(\S+)\s+ADD CONSTRAINT \S+ PRIMARY KEY \((.*?)\);", re.S
@@ -21,19 +273,112 @@ class SQLParser:
         )
 
     def parse(self):
-        self._parse_create_table_statements()
+        with instrument.stage('parse'):
+            if self.source is not None:
+                return self._parse_stream()
+
+            self._parse_create_table_statements()
+            self._parse_primary_keys()
+            self._parse_alter_table_primary_keys()
+            self._parse_foreign_keys()
+
+            return self.tables, self.primary_keys, self.foreign_keys
+
+    def _allows(self, table_name: str) -> bool:
+        return self.allowlist is None or table_name in self.allowlist
+
+    def _is_schema_statement(self, head: str) -> bool:
+        if not head.startswith(('CREATE TABLE', 'ALTER TABLE')):
+            return False
+        if self.allowlist is None:
+            return True
+
+        # Keep statements whose table name is cut off by the head; dispatch filters them
+        match = self.statement_table_pattern.match(head)
+        return match is None or match.group(1) in self.allowlist
+
+    def _parse_stream(self):
+        alter_table_pks = self._scan_statements()
+
+        # Same order as the full-text mode: inline primary keys before ALTER TABLE ones
         self._parse_primary_keys()
-        self._parse_alter_table_primary_keys()
-        self._parse_foreign_keys()
+        for table_name, pk_columns in alter_table_pks:
+            self._add_alter_table_primary_key(table_name, pk_columns)
 
         return self.tables, self.primary_keys, self.foreign_keys
 
+    def _scan_statements(self) -> list[tuple[str, str]]:
+        """Single pass over self.source, dispatching each statement to the patterns it can match.
+
+        Fills self.tables and self.foreign_keys and returns the ALTER TABLE
+        primary keys as (table, columns) pairs, which must be applied after
+        the inline primary keys.
+        """
+        alter_table_pks = []
+        splitter = SQLStatementSplitter(keep=self._is_schema_statement)
+
+        for chunk in iter_sql_chunks(self.source, self.chunk_size):
+            for statement in splitter.feed(chunk):
+                self._dispatch_statement(statement, alter_table_pks)
+        for statement in splitter.close():
+            self._dispatch_statement(statement, alter_table_pks)
+        return alter_table_pks
+
+    def _dispatch_statement(self, statement: str, alter_table_pks: list[tuple[str, str]]):
+        """Apply the patterns a CREATE TABLE or ALTER TABLE statement can match."""
+        if instrument.enabled:
+            instrument.count('statements_parsed')
+        if statement.startswith('CREATE TABLE'):
+            for match in self.create_table_pattern.finditer(statement):
+                self._add_table(match)
+        else:
+            alter_table_pks.extend(match.groups() for match in self.alter_table_pk_pattern.finditer(statement))
+            for match in self.foreign_key_pattern.finditer(statement):
+                self._add_foreign_key(match)
+
+    def _add_table(self, match):
+        table_name = match.group(1)
+        if not self._allows(table_name):
+            return
+        columns = match.group(2)
+        columns = [col.strip().split()[0] for col in columns.split(',')]
+        self.tables[table_name] = columns
+
+    def _add_alter_table_primary_key(self, table_name: str, pk_columns: str):
+        if not self._allows(table_name):
+            return
+        pk_columns = pk_columns.split(',')
+        self.primary_keys[table_name].extend([col.strip().lower() for col in pk_columns])
+
+    def _add_foreign_key(self, match):
+        table_name = match.group(1)
+        if not self._allows(table_name):
+            return
+        fk_columns = match.group(2).split(',')
+        ref_table = match.group(3)
+        ref_columns = match.group(4).split(',')
+        self.foreign_keys[table_name].append({
+            'columns': [col.strip().lower() for col in fk_columns],
+            'ref_table': ref_table.lower(),
+            'ref_columns': [col.strip().lower() for col in ref_columns]
+        })
+
     def _parse_create_table_statements(self):
-        for match in self.create_table_pattern.finditer(self.sql_content):
-            table_name = match.group(1)
-            columns = match.group(2)
-            columns = [col.strip().split()[0] for col in columns.split(',')]
-            self.tables[table_name] = columns
+        if self.allowlist is None:
+            for match in self.create_table_pattern.finditer(self.sql_content):
+                if instrument.enabled:
+                    instrument.count('statements_parsed')
+                self._add_table(match)
+            return
+
+        # Only the header of each CREATE TABLE is matched; bodies are read for allowed tables alone
+        for header in self.create_table_header_pattern.finditer(self.sql_content):
+            if header.group(1) in self.allowlist:
+                match = self.create_table_pattern.match(self.sql_content, header.start())
+                if match:
+                    if instrument.enabled:
+                        instrument.count('statements_parsed')
+                    self._add_table(match)
 
     def _parse_primary_keys(self):
         for table_name, columns in self.tables.items():
@@ -45,18 +390,12 @@ class SQLParser:
 
     def _parse_alter_table_primary_keys(self):
         for match in self.alter_table_pk_pattern.finditer(self.sql_content):
-            table_name = match.group(1)
-            pk_columns = match.group(2).split(',')
-            self.primary_keys[table_name].extend([col.strip().lower() for col in pk_columns])
+            if instrument.enabled:
+                instrument.count('statements_parsed')
+            self._add_alter_table_primary_key(*match.groups())
 
     def _parse_foreign_keys(self):
         for match in self.foreign_key_pattern.finditer(self.sql_content):
-            table_name = match.group(1)
-            fk_columns = match.group(2).split(',')
-            ref_table = match.group(3)
-            ref_columns = match.group(4).split(',')
-            self.foreign_keys[table_name].append({
-                'columns': [col.strip().lower() for col in fk_columns],
-                'ref_table': ref_table.lower(),
-                'ref_columns': [col.strip().lower() for col in ref_columns]
-            })
+            if instrument.enabled:
+                instrument.count('statements_parsed')
+            self._add_foreign_key(match)
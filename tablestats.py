@@ -0,0 +1,79 @@
+import csv
+import hashlib
+import math
+
+# Distinct-count sketch: 2**precision registers, about 1.04 / sqrt(2**precision) relative error
+class HyperLogLog:
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        width = 64 - self.precision
+        index, rest = hashed >> width, hashed & ((1 << width) - 1)
+        rank = width - rest.bit_length() + 1  # position of the leftmost 1 bit
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Fold other (of the same precision) into this sketch."""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        size = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)  # linear counting for small cardinalities
+        return round(estimate)
+
+# Row count, distinct-count sketches and null counts of one table's columns
+class TableStats:
+    def __init__(self, columns: list[str], precision: int = 12):
+        self.columns = columns  # lowercased CSV header
+        self.row_count = 0
+        self.distinct = {column: HyperLogLog(precision) for column in columns}
+        self.nulls = dict.fromkeys(columns, 0)
+        self._counts: dict[str, int] = {}  # memoized distinct counts, cleared by add_row
+
+    def add_row(self, values: list[str]):
+        if self._counts:
+            self._counts = {}
+        self.row_count += 1
+        for column, value in zip(self.columns, values):
+            if value == '':
+                self.nulls[column] += 1
+            else:
+                self.distinct[column].add(value)
+
+    def distinct_count(self, column: str) -> int | None:
+        column = column.lower()
+        if column not in self._counts:
+            if column not in self.distinct:
+                return None
+            self._counts[column] = self.distinct[column].count()
+        return self._counts[column]
+
+    def null_rate(self, column: str) -> float | None:
+        nulls = self.nulls.get(column.lower())
+        if nulls is None:
+            return None
+        return nulls / self.row_count if self.row_count else 0.0
+
+    def __repr__(self) -> str:
+        return f"TableStats({self.row_count} rows, {len(self.columns)} columns)"
+
+def collect_table_stats(path: str, precision: int = 12, encoding: str = 'utf-8') -> TableStats:
+    """Read one CSV file once, collecting its TableStats. Empty fields count as nulls."""
+    with open(path, newline='', encoding=encoding) as file:
+        reader = csv.reader(file)
+        stats = TableStats([column.strip().lower() for column in next(reader, [])], precision)
+        for values in reader:
+            stats.add_row(values)
+    return stats
+
+def collect_stats(files: dict[int, str], precision: int = 12, encoding: str = 'utf-8') -> dict[int, TableStats]:
+    """TableStats of each CSV file in files (node key -> path, see csvjoin.table_files)."""
+    return {key: collect_table_stats(path, precision, encoding) for key, path in files.items()}
@@ -1,5 +1,34 @@
+import contextlib
+import io
+import itertools
+import json
+import os
+import pickle
+import random
+import re
+import subprocess
+import sys
+import tempfile
 import unittest
-from sqlparser import SQLParser
+import xml.etree.ElementTree as ET
+from sqlparser import SQLParser, SQLStatementSplitter
+from parallelparser import parse_parallel, split_shards
+from schemacache import SchemaCache
+from incremental import IncrementalSchema, patch_graph
+from csvjoin import HashJoinExecutor, table_files
+from tablestats import HyperLogLog, collect_stats
+from csvschema import column_index, infer_graph, scan_headers
+from exporters import export
+import asyncio
+import instrument
+import render
+from benchmarks.schemagen import generate_schema
+from benchmarks.suite import compare
+import main
+from service import GraphService
+from snapshot import FORMAT_VERSION, GraphSnapshot, write_snapshot
+from csvgraph import CSVNode, CSVEdge, CSVGraph, visualize
+from compactgraph import CompactCSVGraph
 
 class TestSQLParser(unittest.TestCase):
 
@@ -309,5 +338,1115 @@ class TestSQLParser(unittest.TestCase):
         self.assertEqual(foreign_keys['orders'][0]['ref_table'], 'customers')
         self.assertEqual(foreign_keys['orders'][0]['ref_columns'], ['customer_id'])
 
+class TestCSVGraph(unittest.TestCase):
+
+    def build_graph(self):
+        nodes = [CSVNode(i) for i in range(1, 6)]
+        graph = CSVGraph(list(nodes))
+        graph.add_edge(CSVEdge(nodes[0], nodes[1], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[2], nodes[1], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[2], nodes[3], ['victim_id']))
+        graph.add_edge(CSVEdge(nodes[3], nodes[4], ['victim_id', 'offender_id']))
+        return graph, nodes
+
+    def edge_set(self, graph):
+        return sorted((e.left_v.key, e.right_v.key, tuple(e.column)) for e in graph.edges)
+
+    def test_add_edge_orders_and_deduplicates(self):
+        graph, nodes = self.build_graph()
+        graph.add_edge(CSVEdge(nodes[1], nodes[0], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[0], nodes[1], ['incident_id']))
+        self.assertEqual(len(graph.edges), 4)
+        self.assertEqual((graph.edges[1].left_v.key, graph.edges[1].right_v.key), (2, 3))
+        graph.add_edge(CSVEdge(nodes[0], nodes[1], ['offense_id']))
+        self.assertEqual(len(graph.edges), 5)
+
+    def test_graphs_do_not_share_default_nodes(self):
+        CSVGraph().nodes.append(CSVNode(1))
+        self.assertEqual(CSVGraph().nodes, [])
+
+    def test_find_path(self):
+        graph, nodes = self.build_graph()
+        self.assertEqual([n.key for n in graph.find_path(nodes[0], nodes[4])], [1, 2, 3, 4, 5])
+        self.assertEqual(graph.find_path(nodes[0], CSVNode(99)), None)
+
+    def test_compress_graph(self):
+        graph, nodes = self.build_graph()
+        graph.compress_graph()
+        self.assertEqual(self.edge_set(graph), [
+            (1, 2, ('incident_id',)),
+            (1, 3, ('incident_id',)),
+            (2, 3, ('incident_id',)),
+            (3, 1, ('incident_id',)),
+            (3, 4, ('victim_id',)),
+            (3, 5, ('victim_id',)),
+            (4, 5, ('victim_id', 'offender_id')),
+            (5, 3, ('victim_id',)),
+        ])
+        self.assertEqual([n.key for n in graph.find_path(nodes[0], nodes[4])], [1, 3, 5])
+
+    def test_compress_graph_matches_reference_engine(self):
+        rng = random.Random(7)
+        labels = ['incident_id', 'victim_id', 'offender_id', 'data_year']
+        for _ in range(20):
+            nodes = [CSVNode(i) for i in range(1, 31)]
+            fast, reference = CSVGraph(list(nodes)), CSVGraph(list(nodes))
+            for _ in range(40):
+                left, right = rng.sample(nodes, 2)
+                columns = rng.sample(labels, rng.randint(1, 2))
+                fast.add_edge(CSVEdge(left, right, columns))
+                reference.add_edge(CSVEdge(left, right, columns))
+
+            fast.compress_graph()
+            reference._compress_graph_reference()
+            self.assertEqual(self.edge_set(fast), self.edge_set(reference))
+
+    def test_lazy_compression_serves_virtual_edges(self):
+        eager, nodes = self.build_graph()
+        lazy, _ = self.build_graph()
+        eager.compress_graph()
+        lazy.compress_graph(lazy=True)
+
+        self.assertEqual(len(lazy._edges), 4)
+        self.assertEqual(len(lazy.edges), len(eager.edges))
+        self.assertEqual(self.edge_set(lazy), self.edge_set(eager))
+        self.assertEqual(sorted(repr(lazy).split('\n')), sorted(repr(eager).split('\n')))
+        self.assertTrue(lazy.has_direct_edge(nodes[0], nodes[2], 'incident_id'))
+        self.assertFalse(lazy.has_direct_edge(nodes[0], nodes[2], 'victim_id'))
+        self.assertFalse(lazy.has_direct_edge(nodes[0], nodes[0], 'incident_id'))
+        self.assertEqual(len(lazy.find_path(nodes[0], nodes[4])), 3)
+
+    def test_pickle_round_trip(self):
+        for lazy in (False, True):
+            graph, nodes = self.build_graph()
+            graph.compress_graph(lazy=lazy)
+            restored = pickle.loads(pickle.dumps(graph))
+            self.assertEqual([n.key for n in restored.nodes], [n.key for n in nodes])
+            self.assertEqual(self.edge_set(restored), self.edge_set(graph))
+            self.assertEqual(len(restored._edges), len(graph._edges))
+            self.assertEqual([n.key for n in restored.find_path(restored.nodes[0], restored.nodes[4])], [1, 3, 5])
+
+    def random_graph(self, rng, size=30, edges=35):
+        nodes = [CSVNode(i) for i in range(1, size + 1)]
+        graph = CSVGraph(list(nodes))
+        for _ in range(edges):
+            left, right = rng.sample(nodes, 2)
+            graph.add_edge(CSVEdge(left, right, [rng.choice(['incident_id', 'victim_id', 'data_year'])]))
+        return graph, nodes
+
+    def hop_counts(self, graph, src):
+        depths, frontier = {src.key: 0}, [src]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                for edge in graph.edges:
+                    for a, b in ((edge.left_v, edge.right_v), (edge.right_v, edge.left_v)):
+                        if a.key == node.key and b.key not in depths:
+                            depths[b.key] = depths[node.key] + 1
+                            next_frontier.append(b)
+            frontier = next_frontier
+        return depths
+
+    def assert_shortest_path(self, graph, src, dest, path):
+        depths = self.hop_counts(graph, src)
+        if dest.key not in depths:
+            self.assertIsNone(path)
+            return
+        self.assertEqual(len(path) - 1, depths[dest.key])
+        self.assertEqual((path[0].key, path[-1].key), (src.key, dest.key))
+        edges = {frozenset((e.left_v.key, e.right_v.key)) for e in graph.edges}
+        for a, b in zip(path, path[1:]):
+            self.assertIn(frozenset((a.key, b.key)), edges)
+
+    def test_find_path_returns_shortest_paths(self):
+        rng = random.Random(11)
+        for lazy in (False, True):
+            graph, nodes = self.random_graph(rng)
+            graph.compress_graph(lazy=lazy)
+            for _ in range(60):
+                # Repeated sources exercise the cached BFS trees as well as the bidirectional search
+                src, dest = rng.choice(nodes[:5]), rng.choice(nodes)
+                self.assert_shortest_path(graph, src, dest, graph.find_path(src, dest))
+
+    def test_path_cache_eviction_and_invalidation(self):
+        graph, nodes = self.random_graph(random.Random(3))
+        graph.path_cache_size = 2
+        for src in nodes[:4]:
+            graph.find_path(src, nodes[-1])
+            graph.find_path(src, nodes[-1])
+        self.assertEqual(list(graph._bfs_trees), [nodes[2].key, nodes[3].key])
+
+        graph.add_edge(CSVEdge(nodes[3], nodes[-1], ['data_year']))
+        self.assertEqual([n.key for n in graph.find_path(nodes[3], nodes[-1])], [nodes[3].key, nodes[-1].key])
+
+    def test_reachability_matches_search(self):
+        graph, nodes = self.random_graph(random.Random(8), edges=25)
+        for src in nodes[:10]:
+            depths = self.hop_counts(graph, src)
+            self.assertEqual({node.key for node in graph.reachable_set(src)}, set(depths))
+            for dest in nodes:
+                self.assertEqual(graph.can_reach(src, dest), dest.key in depths)
+            for label in ('incident_id', 'victim_id', 'data_year'):
+                expected = {node.key for node in graph._find_reachable_nodes(src, label)}
+                self.assertEqual({node.key for node in graph.reachable_set(src, label)}, expected)
+                self.assertEqual([dest.key for dest in nodes if graph.can_reach(src, dest, label)],
+                                 [dest.key for dest in nodes if dest.key in expected])
+
+        # Indexes follow edge changes
+        lone = CSVNode(99)
+        self.assertFalse(graph.can_reach(nodes[0], lone, 'victim_id'))
+        graph.add_edge(CSVEdge(nodes[0], lone, ['victim_id']))
+        self.assertTrue(graph.can_reach(lone, nodes[0], 'victim_id'))
+        graph.remove_node(lone)
+        self.assertFalse(graph.can_reach(nodes[0], lone))
+
+    def test_reachability_on_long_chains(self):
+        nodes = [CSVNode(i) for i in range(5000)]
+        graph = CSVGraph(list(nodes))
+        for left, right in zip(nodes, nodes[1:]):
+            graph.add_edge(CSVEdge(left, right, ['incident_id']))
+        self.assertTrue(graph.can_reach(nodes[0], nodes[-1], 'incident_id'))
+        self.assertEqual(len(graph._find_reachable_nodes(nodes[0], 'incident_id')), 5000)
+
+    def test_path_matrix_matches_search(self):
+        graph, nodes = self.random_graph(random.Random(4))
+        for src in nodes[:5]:
+            depths = self.hop_counts(graph, src)
+            self.assertEqual([graph.distance(src, dest) for dest in nodes], [depths.get(dest.key) for dest in nodes])
+            # With the matrix built, find_path answers from it
+            for dest in nodes:
+                self.assert_shortest_path(graph, src, dest, graph.find_path(src, dest))
+
+    def steiner_size(self, graph, nodes, terminals):
+        # Fewest joins of any connected node set containing terminals, by brute force
+        others = [node for node in nodes if node not in terminals]
+        for extra in range(len(others) + 1):
+            for chosen in itertools.combinations(others, extra):
+                keys = {node.key for node in terminals + list(chosen)}
+                sub = CSVGraph()
+                for edge in graph.edges:
+                    if edge.left_v.key in keys and edge.right_v.key in keys:
+                        sub.add_edge(edge)
+                if all(sub.can_reach(terminals[0], node) for node in terminals):
+                    return len(keys) - 1
+        return None
+
+    def test_plan_joins_builds_small_join_trees(self):
+        rng = random.Random(6)
+        graph, nodes = self.random_graph(rng, size=12, edges=14)
+        for _ in range(20):
+            terminals = rng.sample(nodes, rng.randint(2, 5))
+            plan, optimum = graph.plan_joins(terminals), self.steiner_size(graph, nodes, terminals)
+            if optimum is None:
+                self.assertIsNone(plan)
+                continue
+
+            self.assertLessEqual(optimum, len(plan))
+            self.assertLessEqual(len(plan), 2 * optimum)
+            self.assertEqual(len(plan.tables), len(plan) + 1)
+            self.assertTrue({node.key for node in terminals} <= {node.key for node in plan.tables})
+            joined = {plan.tables[0].key}
+            for left, right, columns in plan.joins:
+                self.assertIn(left.key, joined)
+                joined.add(right.key)
+                self.assertTrue(columns)
+                self.assertTrue(all(graph.has_direct_edge(left, right, column) for column in columns))
+
+    def test_incremental_compression_matches_recompression(self):
+        labels = ['incident_id', 'victim_id', 'data_year']
+        for lazy in (False, True):
+            rng = random.Random(11)
+            graph, nodes = self.random_graph(rng, size=15, edges=12)
+            graph.compress_graph(lazy=lazy, incremental=True)
+            for _ in range(60):
+                step = rng.random()
+                originals = list(graph.original_edges())
+                if step < 0.5 or not originals:
+                    left, right = rng.sample(graph.nodes, 2)
+                    graph.add_edge(CSVEdge(left, right, rng.sample(labels, rng.randint(1, 2))))
+                elif step < 0.9:
+                    self.assertTrue(graph.remove_edge(rng.choice(originals)))
+                else:
+                    graph.remove_node(rng.choice(graph.nodes))
+
+                fresh = CSVGraph(list(graph.nodes))
+                for edge in graph.original_edges():
+                    fresh.add_edge(CSVEdge(edge.left_v, edge.right_v, edge.column))
+                fresh.compress_graph(lazy=lazy)
+                self.assertEqual(self.edge_set(graph), self.edge_set(fresh))
+                self.assertEqual(sorted(map(repr, graph.derived_edges())),
+                                 sorted(map(repr, fresh.derived_edges())))
+
+    def test_original_and_derived_edges(self):
+        graph, nodes = self.build_graph()
+        graph.compress_graph(incremental=True)
+        self.assertEqual(len(list(graph.original_edges())), 4)
+        self.assertTrue(all(graph.is_derived(edge) for edge in graph.derived_edges()))
+
+        # Adding a derived edge as an original one promotes it
+        derived = next(graph.derived_edges())
+        graph.add_edge(CSVEdge(derived.left_v, derived.right_v, derived.column))
+        self.assertFalse(graph.is_derived(derived))
+        self.assertEqual(len(list(graph.original_edges())), 5)
+
+class TestCompactCSVGraph(unittest.TestCase):
+
+    def edge_set(self, graph):
+        return sorted((e.left_v.key, e.right_v.key, tuple(e.column)) for e in graph.edges)
+
+    def test_matches_object_graph_and_round_trips(self):
+        rng = random.Random(5)
+        labels = ['incident_id', 'victim_id', 'offender_id', 'data_year']
+        nodes = [CSVNode(i) for i in range(1, 26)]
+        graph, compact = CSVGraph(list(nodes)), CompactCSVGraph(list(nodes))
+        for _ in range(30):
+            left, right = rng.sample(nodes, 2)
+            columns = rng.sample(labels, rng.randint(1, 2))
+            graph.add_edge(CSVEdge(left, right, columns))
+            compact.add_edge(CSVEdge(left, right, columns))
+
+        graph.compress_graph()
+        compact.compress_graph()
+        self.assertEqual(self.edge_set(compact), self.edge_set(graph))
+        self.assertEqual(self.edge_set(compact.to_graph()), self.edge_set(graph))
+        self.assertEqual(self.edge_set(CompactCSVGraph.from_graph(graph)), self.edge_set(graph))
+
+        for src in nodes[:5]:
+            for dest in nodes:
+                path, expected = compact.find_path(src, dest), graph.find_path(src, dest)
+                self.assertEqual(path is None, expected is None)
+                if path is not None:
+                    self.assertEqual(len(path), len(expected))
+                    for a, b in zip(path, path[1:]):
+                        self.assertTrue(any(compact.has_direct_edge(a, b, label) for label in labels))
+
+    def test_column_labels_are_interned(self):
+        nodes = [CSVNode(i) for i in range(1, 4)]
+        compact = CompactCSVGraph(list(nodes))
+        compact.add_edge(CSVEdge(nodes[0], nodes[1], ['incident_id']))
+        compact.add_edge(CSVEdge(nodes[1], nodes[2], ['incident_id']))
+        compact.add_edge(CSVEdge(nodes[1], nodes[2], ['incident_id']))
+        self.assertEqual(len(compact.edges), 2)
+        self.assertIs(compact.edges[0].column, compact.edges[1].column)
+
+class TestStreamingSQLParser(unittest.TestCase):
+
+    def split(self, sql_content, chunk_size, keep=None):
+        splitter = SQLStatementSplitter(keep)
+        statements = []
+        for start in range(0, len(sql_content), chunk_size):
+            statements.extend(splitter.feed(sql_content[start:start + chunk_size]))
+        return statements + splitter.close()
+
+    def test_matches_full_text_parse_of_schema_dump(self):
+        with open('postgres_setup.sql') as file:
+            expected = SQLParser(file.read()).parse()
+        for chunk_size in (1, 4096):
+            self.assertEqual(SQLParser.from_file('postgres_setup.sql', chunk_size).parse(), expected)
+
+    def test_matches_full_text_parse_from_file_objects(self):
+        sql_content = '''
+        -- Foreign key constraint; not a statement
+        CREATE TABLE orders (
+            order_id INT PRIMARY KEY, -- Primary key for orders
+            customer_id INT,
+            note TEXT DEFAULT 'a;b'
+        );
+
+        ALTER TABLE ONLY public.orders ADD CONSTRAINT orders_pk PRIMARY KEY (order_id);
+        ALTER TABLE ONLY public.orders ADD CONSTRAINT fk_customer FOREIGN KEY (customer_id)
+            REFERENCES public.customers (customer_id);
+        '''
+        expected = SQLParser(sql_content).parse()
+        self.assertEqual(SQLParser.from_file(io.StringIO(sql_content), 5).parse(), expected)
+        self.assertEqual(SQLParser.from_file(io.BytesIO(sql_content.encode()), 5).parse(), expected)
+
+    def test_splitter_is_quote_comment_and_copy_aware(self):
+        sql_content = (
+            "-- leading; comment\n"
+            "CREATE TABLE a (x text DEFAULT 'a;''b', /* c; /* nested; */ */ y int);\n"
+            "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;\n"
+            "COPY a (x, y) FROM stdin;\n"
+            "1;\t2\n"
+            "\\.\n"
+            "SELECT $1;\n"
+        )
+        expected = [
+            "CREATE TABLE a (x text DEFAULT 'a;''b', /* c; /* nested; */ */ y int);",
+            "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $body$ LANGUAGE sql;",
+            "COPY a (x, y) FROM stdin;",
+            "SELECT $1;",
+        ]
+        for chunk_size in (1, 3, len(sql_content)):
+            self.assertEqual(self.split(sql_content, chunk_size), expected)
+        self.assertEqual(self.split(sql_content, 2, keep=lambda head: head.startswith('SELECT')), ['SELECT $1;'])
+
+class TestTableAllowlist(unittest.TestCase):
+
+    def test_allowlist_restricts_both_parse_modes(self):
+        with open('postgres_setup.sql') as file:
+            sql_content = file.read()
+        allowlist = ['nibrs_incident', 'NIBRS_VICTIM_*', re.compile(r'nibrs_weapon(_type)?')]
+        allowed = {'nibrs_incident', 'nibrs_victim_injury', 'nibrs_victim_offender_rel', 'nibrs_victim_type',
+                   'nibrs_victim_circumstances', 'nibrs_victim_offense', 'nibrs_weapon', 'nibrs_weapon_type'}
+
+        tables, primary_keys, foreign_keys = SQLParser(sql_content).parse()
+        expected = (
+            {name: columns for name, columns in tables.items() if name.lower() in allowed},
+            {name: keys for name, keys in primary_keys.items() if name.lower() in allowed},
+            {name: fks for name, fks in foreign_keys.items() if name.lower() in allowed},
+        )
+        for parser in (SQLParser(sql_content, allowlist=allowlist),
+                       SQLParser.from_file('postgres_setup.sql', allowlist=allowlist)):
+            self.assertEqual(tuple(dict(result) for result in parser.parse()), expected)
+
+    def test_streaming_mode_drops_other_statements_unbuffered(self):
+        parser = SQLParser(allowlist=['orders'])
+        self.assertTrue(parser._is_schema_statement('CREATE TABLE orders ('))
+        self.assertTrue(parser._is_schema_statement('ALTER TABLE ONLY PUBLIC.ORDERS ADD CONSTRAINT'))
+        self.assertFalse(parser._is_schema_statement('CREATE TABLE customers ('))
+        self.assertFalse(parser._is_schema_statement('ALTER TABLE ONLY public.customers ADD'))
+        self.assertFalse(parser._is_schema_statement('INSERT INTO orders VALUES (1)'))
+
+class TestParallelParser(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        with open('postgres_setup.sql') as file:
+            self.sql_content = file.read()
+
+    def write(self, name, sql_content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(sql_content)
+        return path
+
+    def test_byte_range_shards_match_serial_parse(self):
+        copy_block = "COPY nibrs_month (a, b) FROM stdin;\n1;\tx\n\\.\n\n"
+        path = self.write('dump.sql', self.sql_content + copy_block + self.sql_content.replace('nibrs_', 'other_'))
+        expected = SQLParser.from_file(path).parse()
+
+        shards = split_shards([path], 2048)
+        self.assertGreater(len(shards), 10)
+        self.assertEqual(shards[-1][2], os.path.getsize(path))
+        for workers in (1, 2):
+            result = parse_parallel(path, workers=workers, shard_size=2048)
+            self.assertEqual(result, expected)
+            self.assertEqual([list(part) for part in result], [list(part) for part in expected])
+
+    def test_shards_do_not_split_dollar_quoted_bodies(self):
+        functions = ''.join(
+            f"CREATE FUNCTION touch_{index}() RETURNS void AS $body$\nBEGIN\n"
+            f"    UPDATE nibrs_incident SET data_year = 1;\n"
+            f"    INSERT INTO nibrs_victim VALUES ('a;\n  CREATE TABLE quoted_{index} (x int);');\n"
+            f"    CREATE TABLE not_a_table_{index} (x int);\n"
+            f"END;\n$body$ LANGUAGE plpgsql;\n\n/* ;\n  CREATE TABLE commented_{index} (x int); */\n"
+            for index in range(40))
+        path = self.write('functions.sql', self.sql_content + functions)
+        expected = SQLParser.from_file(path).parse()
+        self.assertEqual(len(expected[0]), 42)
+
+        for shard_size in (512, 2048, 4096):
+            self.assertGreater(len(split_shards([path], shard_size)), 5)
+            self.assertEqual(parse_parallel(path, shard_size=shard_size), expected)
+
+    def test_multiple_files_resolve_cross_file_foreign_keys(self):
+        split_at = self.sql_content.index('ALTER TABLE')
+        paths = [self.write('tables.sql', self.sql_content[:split_at]),
+                 self.write('constraints.sql', self.sql_content[split_at:])]
+        expected = SQLParser.from_file('postgres_setup.sql', allowlist=['nibrs_*']).parse()
+        result = parse_parallel(paths, workers=2, allowlist=['nibrs_*'])
+        self.assertEqual(result, expected)
+        self.assertIn('NIBRS_VICTIM', result[2])
+
+class TestSchemaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = SchemaCache(self.directory.name)
+
+    def test_store_and_load(self):
+        parsed = SQLParser.from_file('postgres_setup.sql', allowlist=['nibrs_*']).parse()
+        nodes = [CSVNode(1, ['incident_id']), CSVNode(2, ['incident_id', 'victim_id'])]
+        graph = CSVGraph(list(nodes))
+        graph.add_edge(CSVEdge(nodes[0], nodes[1], ['incident_id']))
+
+        key = self.cache.key('postgres_setup.sql', ['nibrs_*'])
+        self.assertIsNone(self.cache.load(key))
+        self.cache.store(key, parsed, graph)
+        cached_parsed, cached_graph = self.cache.load(key)
+        self.assertEqual(cached_parsed, parsed)
+        self.assertEqual([(e.left_v.key, e.right_v.key, e.column) for e in cached_graph.edges],
+                         [(1, 2, ['incident_id'])])
+
+    def test_key_depends_on_contents_and_allowlist(self):
+        path = os.path.join(self.directory.name, 'dump.sql')
+        with open(path, 'w') as file:
+            file.write('CREATE TABLE a (x int);')
+        key = self.cache.key(path)
+        self.assertEqual(self.cache.key(path), key)
+        self.assertNotEqual(self.cache.key(path, ['a']), key)
+        self.assertNotEqual(self.cache.key(path, [re.compile('a')]), self.cache.key(path, ['a']))
+        with open(path, 'a') as file:
+            file.write('CREATE TABLE b (y int);')
+        self.assertNotEqual(self.cache.key(path), key)
+
+    def test_evicts_least_recently_used_entries(self):
+        keys = [f'{index:040x}' for index in range(4)]
+        for index, key in enumerate(keys):
+            self.cache.store(key, os.urandom(2000), None)
+            os.utime(self.cache._path(key), ns=(index * 10 ** 9, index * 10 ** 9))
+        self.cache.load(keys[0])
+        self.cache.max_bytes = 4500
+        self.cache.evict()
+        self.assertEqual([key for key in keys if self.cache.load(key) is not None], [keys[0], keys[3]])
+
+class TestIncrementalSchema(unittest.TestCase):
+
+    def edge_set(self, graph):
+        return sorted((e.left_v.key, e.right_v.key, tuple(e.column)) for e in graph.edges)
+
+    def edit_dump(self, sql_content):
+        # Drop one FK and one table, add an FK and a column
+        sql_content = sql_content.replace(
+            "ALTER TABLE ONLY PUBLIC.NIBRS_VICTIM_OFFENDER_REL ADD CONSTRAINT NIBRS_VICTIM_OFF_REL_VIC_FK", "-- dropped")
+        start = sql_content.index('CREATE TABLE nibrs_victim_type')
+        sql_content = sql_content[:start] + sql_content[sql_content.index(';', start) + 1:]
+        sql_content = sql_content.replace('CREATE TABLE nibrs_weapon (', 'CREATE TABLE nibrs_weapon (\n    weapon_note text,')
+        return sql_content + (
+            "\nALTER TABLE ONLY PUBLIC.NIBRS_WEAPON ADD CONSTRAINT NIBRS_WEAPON_INC_FK FOREIGN KEY (DATA_YEAR)"
+            "\n  REFERENCES PUBLIC.NIBRS_INCIDENT (DATA_YEAR);\n"
+        )
+
+    def test_patched_graph_matches_rebuild(self):
+        with open('postgres_setup.sql') as file:
+            sql_content = file.read()
+        edited = self.edit_dump(sql_content)
+
+        for lazy in (False, True):
+            schema = IncrementalSchema(allowlist=main.filtered)
+            schema.update(io.StringIO(sql_content))
+            graph = main.create_graph(schema.parsed[0], schema.parsed[2])
+            graph.compress_graph(lazy=lazy)
+
+            diff = schema.update(io.StringIO(edited))
+            self.assertEqual(schema.reparsed_statements, 2)
+            self.assertEqual(diff.removed_tables, ['nibrs_victim_type'])
+            self.assertEqual(diff.added_columns, {'nibrs_weapon': ['weapon_note']})
+            self.assertEqual([fk['columns'] for _, fk in diff.added_foreign_keys], [['data_year']])
+            self.assertEqual(len(diff.removed_foreign_keys), 1)
+
+            affected = patch_graph(graph, diff, schema.parsed, main.filtered)
+            self.assertEqual(affected, {'data_year', 'victim_id', 'victim_type_id'})
+
+            rebuilt = main.create_graph(*SQLParser(edited, allowlist=main.filtered).parse()[::2])
+            rebuilt.compress_graph(lazy=lazy)
+            self.assertEqual(self.edge_set(graph), self.edge_set(rebuilt))
+            self.assertEqual([n.key for n in graph.nodes], [n.key for n in rebuilt.nodes])
+            self.assertEqual(graph.nodes[6].columns[0], 'weapon_note')
+
+    def test_added_table_gets_edges_of_existing_foreign_keys(self):
+        victim = ("CREATE TABLE nibrs_victim (\n    incident_id bigint\n);\n"
+                  "ALTER TABLE ONLY PUBLIC.NIBRS_VICTIM ADD CONSTRAINT NIBRS_VICTIM_FK FOREIGN KEY (INCIDENT_ID)\n"
+                  "  REFERENCES PUBLIC.NIBRS_INCIDENT (INCIDENT_ID);\n")
+        edited = victim + "CREATE TABLE nibrs_incident (\n    incident_id bigint\n);\n"
+        for lazy in (False, True):
+            schema = IncrementalSchema(allowlist=main.filtered)
+            schema.update(io.StringIO(victim))
+            graph = main.create_graph(schema.parsed[0], schema.parsed[2])
+            graph.compress_graph(lazy=lazy)
+            self.assertEqual(self.edge_set(graph), [])
+
+            diff = schema.update(io.StringIO(edited))
+            self.assertEqual((list(diff.added_tables), diff.added_foreign_keys), (['nibrs_incident'], []))
+            self.assertEqual(patch_graph(graph, diff, schema.parsed, main.filtered), {'incident_id'})
+
+            rebuilt = main.create_graph(*SQLParser(edited, allowlist=main.filtered).parse()[::2])
+            rebuilt.compress_graph(lazy=lazy)
+            self.assertEqual(self.edge_set(graph), self.edge_set(rebuilt))
+            self.assertEqual(self.edge_set(graph), [(3, 4, ('incident_id',))])
+
+    def test_patch_matches_tables_in_any_case(self):
+        schema = IncrementalSchema(allowlist=['nibrs_*'])
+        schema.update(io.StringIO("CREATE TABLE nibrs_incident (\n    incident_id bigint\n);\n"))
+        table_names = ['nibrs_incident', 'nibrs_victim']
+        graph = main.create_graph(schema.parsed[0], schema.parsed[2], table_names)
+
+        diff = schema.update(io.StringIO(
+            "CREATE TABLE nibrs_incident (\n    incident_id bigint\n);\n"
+            "CREATE TABLE NIBRS_Victim (\n    incident_id bigint\n);\n"
+            "ALTER TABLE ONLY PUBLIC.NIBRS_VICTIM ADD CONSTRAINT NIBRS_VICTIM_FK FOREIGN KEY (INCIDENT_ID)\n"
+            "  REFERENCES PUBLIC.NIBRS_INCIDENT (INCIDENT_ID);\n"))
+        self.assertEqual(list(diff.added_tables), ['NIBRS_Victim'])
+        patch_graph(graph, diff, schema.parsed, table_names)
+        self.assertEqual(self.edge_set(graph), [(1, 2, ('incident_id',))])
+
+    def test_unchanged_dump_reparses_nothing(self):
+        schema = IncrementalSchema()
+        schema.update('postgres_setup.sql')
+        self.assertGreater(schema.reparsed_statements, 0)
+        self.assertFalse(schema.update('postgres_setup.sql'))
+        self.assertEqual(schema.reparsed_statements, 0)
+        self.assertEqual(schema.parsed, SQLParser.from_file('postgres_setup.sql').parse())
+
+    def test_remove_edge_and_node_update_indexes(self):
+        nodes = [CSVNode(i) for i in range(1, 5)]
+        graph = CSVGraph(list(nodes))
+        for left, right in ((0, 1), (1, 2), (2, 3)):
+            graph.add_edge(CSVEdge(nodes[left], nodes[right], ['incident_id']))
+        graph.compress_graph()
+
+        self.assertTrue(graph.remove_edge(CSVEdge(nodes[2], nodes[1], ['incident_id'])))
+        self.assertFalse(graph.remove_edge(CSVEdge(nodes[2], nodes[1], ['incident_id'])))
+        graph.recompress({'incident_id'})
+        self.assertEqual(self.edge_set(graph), [(1, 2, ('incident_id',)), (3, 4, ('incident_id',))])
+        self.assertIsNone(graph.find_path(nodes[0], nodes[3]))
+
+        self.assertEqual(graph.remove_node(nodes[3]), {'incident_id'})
+        self.assertEqual([n.key for n in graph.nodes], [1, 2, 3])
+        self.assertEqual(self.edge_set(graph), [(1, 2, ('incident_id',))])
+
+class TestHashJoinExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        rng = random.Random(2)
+        self.data = {
+            'nibrs_incident': [{'incident_id': str(i), 'data_year': '2020'} for i in range(200)],
+            'nibrs_victim': [{'victim_id': str(i), 'incident_id': str(rng.randrange(210)), 'age': str(i % 90)}
+                             for i in range(300)],
+            'nibrs_victim_injury': [{'victim_id': str(rng.randrange(300)), 'injury_id': str(i)} for i in range(250)]
+            + [{'victim_id': '', 'injury_id': 'null'}],
+        }
+        for table_name, rows in self.data.items():
+            with open(os.path.join(self.directory.name, f'{table_name.upper()}.csv'), 'w', newline='') as file:
+                file.write(','.join(column.upper() for column in rows[0]) + '\n')
+                file.writelines(','.join(row.values()) + '\n' for row in rows)
+
+        names = list(self.data)
+        self.nodes = [CSVNode(index + 1) for index in range(len(names))]
+        self.graph = CSVGraph(list(self.nodes))
+        self.graph.add_edge(CSVEdge(self.nodes[1], self.nodes[0], ['incident_id']))
+        self.graph.add_edge(CSVEdge(self.nodes[2], self.nodes[1], ['victim_id']))
+        self.files = table_files(self.directory.name, names)
+
+    def expected(self):
+        incidents, victims, injuries = self.data.values()
+        pairs = [(incident, victim) for incident in incidents for victim in victims
+                 if incident['incident_id'] == victim['incident_id']]
+        return sorted((incident['incident_id'], victim['victim_id'], injury['injury_id'])
+                      for incident, victim in pairs for injury in injuries if victim['victim_id'] == injury['victim_id'])
+
+    def run_plan(self, executor, plan):
+        return sorted((row['nibrs_incident.incident_id'], row['nibrs_victim.victim_id'],
+                       row['nibrs_victim_injury.injury_id']) for row in executor.execute(plan))
+
+    def test_path_join_matches_nested_loops(self):
+        self.assertEqual(sorted(self.files), [1, 2, 3])
+        plan = self.graph.path_joins(self.graph.find_path(self.nodes[0], self.nodes[2]))
+        executor = HashJoinExecutor(self.files)
+        self.assertEqual(self.run_plan(executor, plan), self.expected())
+        self.assertEqual(executor.spilled_partitions, 0)
+
+        # A join tree from the planner gives the same rows
+        tree = self.graph.plan_joins([self.nodes[2], self.nodes[0]])
+        self.assertEqual(self.run_plan(executor, tree), self.expected())
+
+    def test_spills_partitions_past_memory_limit(self):
+        plan = self.graph.path_joins(self.graph.find_path(self.nodes[2], self.nodes[0]))
+        executor = HashJoinExecutor(self.files, memory_limit=2000, partitions=4, spill_dir=self.directory.name)
+        self.assertEqual(self.run_plan(executor, plan), self.expected())
+        self.assertGreater(executor.spilled_partitions, 0)
+        self.assertFalse([name for name in os.listdir(self.directory.name) if name.startswith('csvjoin-')])
+
+class TestTableStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_table(self, name, header, rows):
+        with open(os.path.join(self.directory.name, f'{name}.csv'), 'w', newline='') as file:
+            file.write(','.join(header) + '\n')
+            file.writelines(','.join(map(str, row)) + '\n' for row in rows)
+
+    def test_hyperloglog_estimates_distinct_counts(self):
+        for distinct in (10, 1000, 50000):
+            sketch, other = HyperLogLog(), HyperLogLog()
+            for value in range(distinct):
+                (sketch if value % 2 else other).add(str(value))
+            sketch.merge(other)
+            self.assertLess(abs(sketch.count() - distinct), 0.05 * distinct + 1)
+
+    def test_collects_stats_and_prefers_cheap_join_paths(self):
+        # incident joins offense both directly through a huge relation table and through a small one
+        self.write_table('incident', ['INCIDENT_ID'], [(i,) for i in range(100)])
+        self.write_table('big_rel', ['incident_id', 'offense_id'], [(i % 100, i % 7) for i in range(5000)])
+        self.write_table('small_rel', ['incident_id', 'offense_id', 'note'],
+                         [(i, i, '' if i % 4 else 'x') for i in range(20)])
+        self.write_table('offense', ['offense_id'], [(i,) for i in range(50)])
+        names = ['incident', 'big_rel', 'small_rel', 'offense']
+        stats = collect_stats(table_files(self.directory.name, names))
+
+        small = stats[3]
+        self.assertEqual((stats[1].row_count, stats[2].row_count, small.row_count), (100, 5000, 20))
+        self.assertEqual((small.distinct_count('offense_id'), stats[2].distinct_count('OFFENSE_ID')), (20, 7))
+        self.assertEqual(small.null_rate('note'), 0.75)
+
+        nodes = [CSVNode(index + 1) for index in range(len(names))]
+        graph = CSVGraph(list(nodes))
+        graph.add_edge(CSVEdge(nodes[1], nodes[0], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[1], nodes[3], ['offense_id']))
+        graph.add_edge(CSVEdge(nodes[2], nodes[0], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[2], nodes[3], ['offense_id']))
+        graph.add_edge(CSVEdge(nodes[0], nodes[3], ['data_year']))
+        self.assertEqual(len(graph.find_path(nodes[0], nodes[3])), 2)
+        self.assertEqual(len(graph.find_cheapest_path(nodes[0], nodes[3])), 2)
+
+        graph.attach_stats(stats)
+        self.assertIs(nodes[1].stats, stats[2])
+        self.assertAlmostEqual(graph.edges[0].estimated_rows, 5000, delta=50)
+        # The data_year edge has no column stats and costs |incident| * |offense| rows
+        self.assertEqual([node.key for node in graph.find_cheapest_path(nodes[0], nodes[3])], [1, 3, 4])
+
+    def test_tables_without_stats_are_not_free_hops(self):
+        # incident reaches offense through small_rel (with stats) or through mystery (no CSV file)
+        self.write_table('incident', ['incident_id'], [(i,) for i in range(100)])
+        self.write_table('small_rel', ['incident_id', 'offense_id'], [(i, i) for i in range(20)])
+        self.write_table('offense', ['offense_id'], [(i % 50,) for i in range(100)])
+        names = ['incident', 'small_rel', 'offense', 'mystery']
+        stats = collect_stats(table_files(self.directory.name, names[:3]))
+
+        nodes = [CSVNode(index + 1) for index in range(len(names))]
+        graph = CSVGraph(list(nodes))
+        graph.add_edge(CSVEdge(nodes[0], nodes[3], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[3], nodes[2], ['offense_id']))
+        graph.add_edge(CSVEdge(nodes[0], nodes[1], ['incident_id']))
+        graph.add_edge(CSVEdge(nodes[1], nodes[2], ['offense_id']))
+        graph.attach_stats(stats)
+        self.assertIsNone(nodes[3].stats)
+        # 20 + 40 estimated rows, against twice the largest known estimate through mystery
+        self.assertEqual([node.key for node in graph.find_cheapest_path(nodes[0], nodes[2])], [1, 2, 3])
+        self.assertEqual([node.key for node in pickle.loads(pickle.dumps(graph)).find_cheapest_path(nodes[0], nodes[2])],
+                         [1, 2, 3])
+
+class TestCSVSchemaInference(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_table(self, name, header, rows=()):
+        with open(os.path.join(self.directory.name, name), 'w', newline='') as file:
+            file.write(','.join(header) + '\n')
+            file.writelines(','.join(map(str, row)) + '\n' for row in rows)
+
+    def test_infers_star_edges_around_owning_tables(self):
+        self.write_table('NIBRS_incident.csv', ['DATA_YEAR', 'INCIDENT_ID', 'AGENCY_ID'])
+        self.write_table('nibrs_victim.csv', ['data_year', 'victim_id', 'incident_id'])
+        self.write_table('nibrs_offense.csv', ['data_year', 'offense_id', 'incident_id'])
+        self.write_table('nibrs_victim_offense.csv', ['data_year', 'victim_id', 'offense_id'])
+        self.write_table('lookup.csv', ['code', 'label'], [(2, 'a'), (1, 'b')])
+        self.write_table('usage.csv', ['code', 'total'], [(1, 5), (1, 6)])
+        self.write_table('notes.txt', ['incident_id'])
+
+        headers = scan_headers(self.directory.name, sample_rows=5, workers=3)
+        self.assertEqual(list(headers), ['lookup', 'nibrs_incident', 'nibrs_offense', 'nibrs_victim',
+                                         'nibrs_victim_offense', 'usage'])
+        self.assertEqual(headers['usage'], (['code', 'total'], [['1', '5'], ['1', '6']]))
+        self.assertEqual(column_index(headers)['incident_id'], ['nibrs_incident', 'nibrs_offense', 'nibrs_victim'])
+
+        graph, table_names = infer_graph(self.directory.name, sample_rows=5, shared_columns=r'.*_id|code')
+        keys = {table_name: index + 1 for index, table_name in enumerate(table_names)}
+        self.assertEqual(graph.nodes[1].columns, ['data_year', 'incident_id', 'agency_id'])
+        edges = sorted((table_names[e.left_v.key - 1], table_names[e.right_v.key - 1], e.column[0]) for e in graph.edges)
+        self.assertEqual(edges, [
+            ('lookup', 'usage', 'code'),  # lookup's sampled codes are unique
+            ('nibrs_incident', 'nibrs_offense', 'incident_id'),
+            ('nibrs_incident', 'nibrs_victim', 'incident_id'),
+            ('nibrs_offense', 'nibrs_victim_offense', 'offense_id'),
+            ('nibrs_victim', 'nibrs_victim_offense', 'victim_id'),
+        ])
+
+        # Without a filter data_year joins every nibrs table; compression recovers all pairs
+        graph, _ = infer_graph(self.directory.name)
+        graph.compress_graph()
+        nibrs = [node for node in graph.nodes if table_names[node.key - 1].startswith('nibrs')]
+        self.assertTrue(all(graph.has_direct_edge(a, b, 'data_year') for a in nibrs for b in nibrs if a is not b))
+        self.assertFalse(graph.has_direct_edge(graph.nodes[keys['lookup'] - 1], graph.nodes[keys['usage'] - 1], 'total'))
+
+    def test_cli_scans_headers_with_the_default_thread_pool(self):
+        self.write_table('nibrs_incident.csv', ['incident_id'])
+        self.write_table('nibrs_victim.csv', ['victim_id', 'incident_id'])
+        self.assertIsNone(main.build_cli().parse_args(['parse', '--csv-dir', self.directory.name]).workers)
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main.main(['path', 'nibrs_victim', 'nibrs_incident', '--csv-dir', self.directory.name])
+        self.assertIn('nibrs_victim', output.getvalue())
+
+class TestExportAndCLI(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = CSVGraph([CSVNode(1, ['a_id']), CSVNode(2, ['a_id', 'b']), CSVNode(3, ['a_id'])])
+        self.graph.add_edge(CSVEdge(self.graph.nodes[1], self.graph.nodes[0], ['a_id']))
+        self.graph.add_edge(CSVEdge(self.graph.nodes[1], self.graph.nodes[2], ['a_id']))
+        self.names = {1: 'alpha', 2: 'b"<&>', 3: 'gamma'}
+
+    def test_exports_stored_and_virtual_edges(self):
+        for lazy in (False, True):
+            graph = pickle.loads(pickle.dumps(self.graph))
+            graph.compress_graph(lazy=lazy)
+            output = io.StringIO()
+            export(graph, output, 'json', self.names)
+            data = json.loads(output.getvalue())
+            self.assertEqual(data['nodes'][1], {'key': 2, 'name': 'b"<&>', 'columns': ['a_id', 'b']})
+            self.assertEqual(sorted((e['source'], e['target'], e['derived']) for e in data['edges']),
+                             [(1, 2, False), (1, 3, True), (2, 3, False), (3, 1, True)])
+
+            output = io.StringIO()
+            export(graph, output, 'graphml', self.names)
+            root = ET.fromstring(output.getvalue())
+            namespace = {'g': 'http://graphml.graphdrawing.org/xmlns'}
+            self.assertEqual(len(root.findall('.//g:edge', namespace)), 4)
+            self.assertEqual(root.find('.//g:node[@id="n2"]/g:data', namespace).text, 'b"<&>')
+
+        output = io.StringIO()
+        export(graph, output, 'dot', self.names, edges=graph.original_edges())
+        self.assertIn('  2 [label="b\\"<&>"];', output.getvalue())
+        self.assertEqual(output.getvalue().count(' -- '), 2)
+
+    def test_cli_commands(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = ['--cache-dir', directory.name]
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main.main(['path', 'NIBRS_VICTIM_TYPE', 'nibrs_victim'] + cache), 0)
+        self.assertEqual(output.getvalue(), 'nibrs_victim_type\n  -[victim_type_id]- nibrs_victim\n')
+
+        path = os.path.join(directory.name, 'graph.json')
+        main.main(['build', '--format', 'json', '-o', path] + cache)
+        with open(path) as file:
+            data = json.load(file)
+        self.assertEqual(len(data['nodes']), 9)
+        self.assertFalse(any(edge['derived'] for edge in data['edges']))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main.main(['parse', '--tables', 'nibrs_weapon_type'] + cache)
+        self.assertEqual(list(json.loads(output.getvalue())['tables']), ['nibrs_weapon_type'])
+
+    def test_commands_build_only_what_they_need(self):
+        for command, stages in (('parse', {'parse'}), ('build', {'parse', 'create_graph', 'export'}),
+                                ('compress', {'parse', 'create_graph', 'compress_graph', 'export'})):
+            with contextlib.redirect_stdout(io.StringIO()), instrument.instrumented() as recorder:
+                main.main([command, '--no-cache'])
+            self.assertEqual(set(recorder.seconds), stages)
+
+    def test_allowlist_matches_tables_in_any_case(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'mixed.sql')
+        with open(path, 'w') as file:
+            file.write("CREATE TABLE NIBRS_incident (\n    incident_id bigint NOT NULL\n);\n\n"
+                       "CREATE TABLE Nibrs_Victim (\n    victim_id bigint NOT NULL,\n    incident_id bigint\n);\n\n"
+                       "  ALTER TABLE ONLY PUBLIC.NIBRS_VICTIM ADD CONSTRAINT NIBRS_VICTIM_FK FOREIGN KEY (INCIDENT_ID)\n"
+                       "\t  REFERENCES PUBLIC.NIBRS_INCIDENT (INCIDENT_ID);\n")
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = main.main(['path', 'nibrs_victim', 'NIBRS_INCIDENT', path, '--no-cache',
+                                '--tables', 'nibrs_incident,nibrs_victim'])
+        self.assertEqual(status, 0)
+        self.assertEqual(output.getvalue(), 'nibrs_victim\n  -[incident_id]- nibrs_incident\n')
+
+    def test_core_modules_do_not_import_plotting_libraries(self):
+        code = "import sys, main; print(sorted(m for m in ('networkx', 'matplotlib') if m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_scalable_render_writes_images_and_caches_layouts(self):
+        graph, nodes = TestCSVGraph().random_graph(random.Random(1), size=300, edges=400)
+        graph.compress_graph()
+        cache = render.LayoutCache(os.path.join(self.directory.name, 'layouts'))
+        png, svg = os.path.join(self.directory.name, 'graph.png'), os.path.join(self.directory.name, 'graph.svg')
+
+        visualize(graph, png, layout_cache=cache)
+        with open(png, 'rb') as file:
+            self.assertEqual(file.read(8), b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+
+        # Same graph: the cached layout is reused instead of computing a new one
+        with instrument.instrumented() as recorder:
+            visualize(graph, svg, layout_cache=cache, aggregate=False)
+        self.assertEqual(recorder.counters.get('layout_cache_hits'), 1)
+        self.assertNotIn('layout', recorder.seconds)
+        self.assertEqual(len(os.listdir(cache.directory)), 1)
+        with open(svg) as file:
+            self.assertIn('<svg', file.read(1000))
+
+        # Adding an original edge changes the layout key, and removing it again restores the key
+        key = render.layout_key(graph, True, 25)
+        graph.add_edge(CSVEdge(nodes[0], nodes[1], ['offender_id']))
+        self.assertNotEqual(render.layout_key(graph, True, 25), key)
+        graph.remove_edge(CSVEdge(nodes[0], nodes[1], ['offender_id']))
+        self.assertEqual(render.layout_key(graph, True, 25), key)
+
+    def test_small_graphs_keep_classic_drawing(self):
+        graph, _ = TestCSVGraph().build_graph()
+        output = os.path.join(self.directory.name, 'small.png')
+        visualize(graph, output, names={1: 'incidents'})
+        self.assertGreater(os.path.getsize(output), 0)
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_generated_schema_parses_in_both_modes(self):
+        sql_content = ''.join(generate_schema(tables=60, fk_density=2, skew=1.2, copy_rows=5, seed=3))
+        tables, primary_keys, foreign_keys = SQLParser(sql_content).parse()
+        streamed = SQLParser.from_file(io.StringIO(sql_content), chunk_size=512).parse()
+        self.assertEqual((dict(tables), dict(primary_keys), dict(foreign_keys)), tuple(map(dict, streamed)))
+        self.assertEqual(len(tables), 60)
+        self.assertEqual(primary_keys['NIBRS_TABLE_7'], ['table_7_id'])
+
+        # Skew makes the first tables hubs
+        referenced = [fk['ref_table'] for fks in foreign_keys.values() for fk in fks]
+        self.assertGreater(referenced.count('nibrs_table_0'), referenced.count('nibrs_table_59'))
+        self.assertTrue(all(fk['columns'][0] in tables[table.lower()] for table, fks in foreign_keys.items() for fk in fks))
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        baseline = {'stages': {'parse': {'seconds': 1.0, 'peak_bytes': 100}, 'layout': {'seconds': 2.0}}}
+        results = {'stages': {'parse': {'seconds': 1.1, 'peak_bytes': 150}, 'layout': {'seconds': 2.0},
+                              'find_path': {'seconds': 5.0}}}
+        self.assertEqual(compare(results, baseline, 0.2), ['parse peak_bytes: 100 -> 150 (+50%)'])
+        self.assertEqual(compare(results, baseline, 0.6), [])
+
+class TestInstrument(unittest.TestCase):
+
+    def test_counters_stages_and_hooks(self):
+        events = []
+        with instrument.instrumented(hooks=[lambda kind, name, value: events.append((kind, name))]) as recorder:
+            graph, nodes = TestCSVGraph().build_graph()
+            graph.add_edge(CSVEdge(nodes[0], nodes[1], ['incident_id']))
+            graph.compress_graph()
+            graph.find_path(nodes[0], nodes[-1])
+            graph.find_path(nodes[0], nodes[-1])
+            graph.find_path(nodes[0], nodes[-1])
+            SQLParser.from_file(io.StringIO(''.join(generate_schema(tables=5, seed=1)))).parse()
+
+        self.assertFalse(instrument.enabled)
+        self.assertEqual(set(recorder.seconds), {'compress_graph', 'parse'})
+        self.assertEqual(recorder.counters['edges_deduplicated'], 1)
+        self.assertEqual(recorder.counters['path_queries'], 3)
+        self.assertEqual(recorder.counters['path_cache_hits'], 1)
+        self.assertGreater(recorder.counters['nodes_visited'], 0)
+        self.assertEqual(recorder.counters['edges_scanned'], sum(len(edge.column) for edge in graph.original_edges()))
+        self.assertEqual(recorder.counters['edges_derived'], len(list(graph.derived_edges())))
+        self.assertGreater(recorder.counters['statements_parsed'], 5)
+        self.assertIn(('stage', 'parse'), events)
+        self.assertIn(('count', 'path_queries'), events)
+
+        # Nothing is recorded once the block has exited
+        graph.find_path(nodes[0], nodes[-1])
+        self.assertEqual(recorder.counters['path_queries'], 3)
+
+    def test_cli_profile_flags(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        stats = os.path.join(directory.name, 'profile.out')
+
+        output, errors = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            status = main.main(['path', 'nibrs_victim', 'nibrs_weapon', '--no-cache', '--profile', '--cprofile', stats])
+        self.assertEqual(status, 0)
+        self.assertTrue(output.getvalue().startswith('nibrs_victim\n'))
+        self.assertRegex(errors.getvalue(), r'(?m)^parse +1 ')
+        self.assertRegex(errors.getvalue(), r'(?m)^statements_parsed +\d+$')
+        self.assertIn('function calls', errors.getvalue())
+        self.assertGreater(os.path.getsize(stats), 0)
+
+class TestGraphService(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.schema = os.path.join(directory.name, 'schema.sql')
+        with open('postgres_setup.sql') as source, open(self.schema, 'w') as file:
+            file.write(source.read())
+
+    async def request(self, connect, method, target, body=b''):
+        reader, writer = await connect()
+        writer.write(f'{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()).strip():
+            name, _, value = line.decode().partition(':')
+            headers[name.lower()] = value.strip()
+        payload = json.loads(await reader.readexactly(int(headers['content-length'])))
+        writer.close()
+        return status, payload
+
+    def test_queries_over_tcp_and_unix_socket(self):
+        async def run():
+            service = GraphService(self.schema)
+            service.load()
+            calls = []
+            answer = service._run
+            service._run = lambda command, params: calls.append(command) or answer(command, params)
+            server = await service.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            tcp = lambda: asyncio.open_connection('127.0.0.1', port)
+            try:
+                results = await asyncio.gather(*[self.request(tcp, 'GET', '/path?src=nibrs_victim&dest=NIBRS_WEAPON')
+                                                 for _ in range(20)])
+                self.assertEqual({json.dumps(result) for result in results}, {json.dumps(results[0])})
+                self.assertEqual(results[0][1]['path'], ['nibrs_victim', 'nibrs_offense', 'nibrs_weapon'])
+                self.assertEqual(results[0][1]['joins'][1]['columns'], ['offense_id'])
+                self.assertLess(calls.count('path'), 20)
+
+                body = json.dumps({'src': 'nibrs_victim', 'dest': 'nibrs_offense', 'column': 'incident_id'}).encode()
+                self.assertEqual(await self.request(tcp, 'POST', '/reach', body), (200, {'reachable': True}))
+                self.assertEqual((await self.request(tcp, 'GET', '/path?src=nope&dest=nibrs_victim'))[0], 404)
+                self.assertEqual((await self.request(tcp, 'GET', '/neighbors'))[0], 400)
+            finally:
+                server.close()
+
+            if hasattr(asyncio, 'start_unix_server'):
+                path = os.path.join(self.directory, 'service.sock')
+                server = await service.start(unix_socket=path)
+                try:
+                    status, payload = await self.request(lambda: asyncio.open_unix_connection(path), 'GET',
+                                                         '/neighbors?table=nibrs_weapon_type&depth=2')
+                finally:
+                    server.close()
+                self.assertEqual(status, 200)
+                self.assertEqual(payload['neighbors'][0], {'table': 'nibrs_weapon', 'distance': 1,
+                                                           'via': 'nibrs_weapon_type'})
+                self.assertTrue(all(neighbor['distance'] <= 2 for neighbor in payload['neighbors']))
+            service.close()
+
+        asyncio.run(run())
+
+    def test_reload_applies_schema_changes(self):
+        with open(self.schema) as file:
+            sql_content = file.read()
+        weapon_type = sql_content[sql_content.index('CREATE TABLE nibrs_weapon_type'):]
+        weapon_type = weapon_type[:weapon_type.index(');') + 3]
+
+        async def wait_for_generation(service, generation, stamp):
+            os.utime(self.schema, ns=(0, stamp))
+            watcher = asyncio.create_task(service.watch())
+            try:
+                for _ in range(500):
+                    if service.generation == generation:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                watcher.cancel()
+            self.assertEqual(service.generation, generation)
+
+        async def run():
+            # Start without nibrs_weapon_type; the foreign keys to it are already in the dump
+            with open(self.schema, 'w') as file:
+                file.write(sql_content.replace(weapon_type, ''))
+            service = GraphService(self.schema, poll_interval=0.01)
+            service.load()
+            result = await service.query('path', {'src': 'nibrs_victim', 'dest': 'nibrs_weapon'})
+            self.assertEqual(len(result['path']), 3)
+            with self.assertRaises(LookupError):
+                await service.query('reach', {'src': 'nibrs_weapon', 'dest': 'nibrs_weapon_type'})
+
+            with open(self.schema, 'a') as file:
+                file.write('\n  ALTER TABLE ONLY PUBLIC.NIBRS_VICTIM ADD CONSTRAINT VICTIM_WEAPON_FK FOREIGN KEY (OFFENSE_ID)\n'
+                           '\t  REFERENCES PUBLIC.NIBRS_WEAPON (OFFENSE_ID);\n')
+            await wait_for_generation(service, 1, 1)
+            result = await service.query('path', {'src': 'nibrs_victim', 'dest': 'nibrs_weapon'})
+            self.assertEqual(result['path'], ['nibrs_victim', 'nibrs_weapon'])
+
+            # Adding the referenced table also adds the edges of the existing foreign keys
+            with open(self.schema, 'a') as file:
+                file.write('\n' + weapon_type)
+            await wait_for_generation(service, 2, 2)
+            result = await service.query('path', {'src': 'nibrs_weapon', 'dest': 'nibrs_weapon_type'})
+            self.assertEqual(result['path'], ['nibrs_weapon', 'nibrs_weapon_type'])
+            self.assertEqual(result['joins'][0]['columns'], ['weapon_id'])
+            service.close()
+
+        asyncio.run(run())
+
+class TestGraphSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'graph.snap')
+
+    def edge_set(self, edges):
+        return sorted((edge.left_v.key, edge.right_v.key, tuple(edge.column)) for edge in edges)
+
+    def test_queries_match_the_graph(self):
+        for seed, mode in itertools.product(range(20), (None, 'eager', 'lazy')):
+            rng = random.Random(seed)
+            graph, nodes = TestCSVGraph().random_graph(rng, size=25, edges=rng.randint(5, 40))
+            graph.add_edge(CSVEdge(nodes[0], nodes[1], ['victim_id', 'data_year']))
+            if mode is not None:
+                graph.compress_graph(lazy=mode == 'lazy')
+            write_snapshot(graph, self.path, {node.key: f'table_{node.key}' for node in nodes})
+
+            with GraphSnapshot(self.path) as snapshot:
+                self.assertEqual(snapshot.nodes[-1].key, 25)
+                self.assertEqual(sum(node is not None for node in snapshot._node_objects), 1)
+                for _ in range(30):
+                    a, b = rng.sample(nodes, 2)
+                    path = snapshot.find_path(a, b)
+                    self.assertEqual(snapshot.distance(a, b), graph.distance(a, b))
+                    if path is not None:
+                        self.assertEqual([path[0].key, path[-1].key], [a.key, b.key])
+                        for near, far in zip(path, path[1:]):
+                            self.assertTrue(graph.join_columns(near, far))
+                    self.assertEqual(sorted(snapshot.join_columns(a, b)), sorted(graph.join_columns(a, b)))
+                    for column_label in (None, 'incident_id', 'victim_id', 'missing'):
+                        self.assertEqual(snapshot.can_reach(a, b, column_label), graph.can_reach(a, b, column_label))
+                        self.assertEqual({node.key for node in snapshot.reachable_set(a, column_label)},
+                                         {node.key for node in graph.reachable_set(a, column_label)})
+                self.assertEqual(snapshot.name(nodes[4]), 'table_5')
+                self.assertEqual(snapshot.find_node('TABLE_7').key, 7)
+
+                rebuilt = snapshot.to_graph()
+            self.assertEqual(self.edge_set(rebuilt.edges), self.edge_set(graph.edges))
+            self.assertEqual(self.edge_set(rebuilt.derived_edges()), self.edge_set(graph.derived_edges()))
+            self.assertEqual([node.key for node in rebuilt.nodes], [node.key for node in graph.nodes])
+
+    def test_rejects_other_files_and_versions(self):
+        graph, _ = TestCSVGraph().build_graph()
+        write_snapshot(graph, self.path)
+        with open(self.path, 'r+b') as file:
+            file.seek(8)
+            file.write((FORMAT_VERSION + 1).to_bytes(2, sys.byteorder))
+        with self.assertRaisesRegex(ValueError, 'version'):
+            GraphSnapshot(self.path)
+        with open(self.path, 'wb') as file:
+            file.write(b'not a snapshot')
+        with self.assertRaisesRegex(ValueError, 'not a graph snapshot'):
+            GraphSnapshot(self.path)
+
+    def test_cli_writes_snapshot(self):
+        main.main(['snapshot', '--no-cache', '-o', self.path])
+        with GraphSnapshot(self.path) as snapshot:
+            path = snapshot.find_path(snapshot.find_node('nibrs_victim_type'), snapshot.find_node('nibrs_weapon_type'))
+            self.assertEqual([snapshot.name(node) for node in path],
+                             ['nibrs_victim_type', 'nibrs_victim', 'nibrs_offense', 'nibrs_weapon', 'nibrs_weapon_type'])
+
 if __name__ == "__main__":
     unittest.main()